@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Control de admisión del Controlador SDN
+Token bucket que limita el ritmo de escrituras en Floodlight (altas y bajas de
+flujos), compartido por todos los logins, expiraciones y reconciliaciones;
+los logins tienen preferencia sobre el trabajo de fondo
+Autor: SDN_Grupo2
+"""
+
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """`rate` operaciones/s con ráfagas de hasta `burst`
+    Los logins reservan su token al momento (el bucket puede quedar en deuda,
+    como mucho `max_wait` segundos) y quien espera ya tiene su turno. El trabajo
+    de fondo (expiración, reconciliación, reubicación) nunca deja deuda: solo
+    toma tokens por encima de `reserved`, que quedan siempre para los logins"""
+
+    def __init__(self, rate, burst=None, max_wait=None, reserved=0):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_wait = max_wait        # Deuda máxima, en segundos de espera (None: sin tope)
+        self.reserved = reserved        # Tokens que el trabajo de fondo no puede tocar
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {'acquired': 0, 'throttled': 0, 'rejected': 0, 'background_acquired': 0,
+                      'wait_seconds': 0.0}
+
+    def refill(self, now):
+        """Sumar los tokens generados desde la última vez (llamar con el lock)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens=1, max_wait=None):
+        """Tomar `tokens` con prioridad; devuelve los segundos que faltan para poder usarlos
+        Devuelve None, sin tomar nada, si la espera pasaría de max_wait o del tope de deuda"""
+        limits = [limit for limit in (max_wait, self.max_wait) if limit is not None]
+        with self.lock:
+            self.refill(time.monotonic())
+            wait = max(tokens - self.tokens, 0) / self.rate
+            if limits and wait > min(limits):
+                self.stats['rejected'] += tokens
+                return None
+            self.tokens -= tokens
+            self.stats['acquired'] += tokens
+            if wait:
+                self.stats['throttled'] += tokens
+                self.stats['wait_seconds'] += wait
+        return wait
+
+    def take_background(self, tokens=1):
+        """Tomar `tokens` solo si sobran por encima de `reserved`
+        Devuelve 0 si los tomó o los segundos a esperar antes de volver a intentarlo"""
+        with self.lock:
+            self.refill(time.monotonic())
+            missing = self.reserved + tokens - self.tokens
+            if missing > 0:
+                return missing / self.rate
+            self.tokens -= tokens
+            self.stats['background_acquired'] += tokens
+        return 0.0
+
+    def refund(self, tokens=1):
+        """Devolver tokens que no llegaron a usarse (p. ej. el flujo venció esperando al switch)"""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+    def background_wait(self, tokens, deadline):
+        """Siguiente espera del trabajo de fondo: 0 si ya tiene sus tokens, None si no llega a `deadline`"""
+        wait = self.take_background(tokens)
+        if wait and deadline is not None and time.monotonic() + wait > deadline:
+            with self.lock:
+                self.stats['rejected'] += tokens
+            return None
+        return wait
+
+    def acquire(self, tokens=1, background=False, deadline=None):
+        """Esperar el turno; False si no llegaría antes de `deadline` (time.monotonic())"""
+        if not background:
+            wait = self.reserve(tokens, None if deadline is None else deadline - time.monotonic())
+            if wait:
+                time.sleep(wait)
+            return wait is not None
+        while True:
+            wait = self.background_wait(tokens, deadline)
+            if not wait:
+                return wait is not None
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1, background=False, deadline=None):
+        if not background:
+            wait = self.reserve(tokens, None if deadline is None else deadline - time.monotonic())
+            if wait:
+                await asyncio.sleep(wait)
+            return wait is not None
+        while True:
+            wait = self.background_wait(tokens, deadline)
+            if not wait:
+                return wait is not None
+            await asyncio.sleep(wait)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats.update({'rate': self.rate, 'burst': self.burst, 'max_wait': self.max_wait,
+                      'reserved': self.reserved})
+        return stats
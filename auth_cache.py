@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Caché de autenticaciones del Portal Cautivo
+Un dispositivo que se reconecta (tapa del portátil, cambio de AP) vuelve a
+enviar las mismas credenciales: la respuesta RADIUS aceptada se guarda un
+tiempo corto por (usuario, MAC), nunca más que su Session-Timeout. Los
+intentos rechazados se recuerdan también, para que repetir una contraseña
+errónea no llegue a FreeRADIUS. Las contraseñas solo se guardan como HMAC
+con una clave aleatoria del proceso
+Autor: SDN_Grupo2
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class AuthCache:
+    """LRU acotada de autenticaciones aceptadas y caché negativa de rechazos"""
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=10000, max_negative=50000):
+        self.ttl = ttl                      # Vida máxima de una autenticación aceptada
+        self.negative_ttl = negative_ttl    # Vida de un rechazo recordado
+        self.max_entries = max_entries
+        self.max_negative = max_negative
+        self.secret = os.urandom(32)
+        self.accepted = OrderedDict()       # (usuario, mac) -> (expira, hmac contraseña, resultado)
+        self.rejected = OrderedDict()       # (usuario, mac, hmac contraseña) -> expira
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'stored': 0, 'rejections_stored': 0,
+                      'evicted': 0, 'invalidated': 0}
+
+    def password_digest(self, password):
+        return hmac.new(self.secret, password.encode(), hashlib.sha256).digest()
+
+    def lookup(self, username, mac_address, password):
+        """Resultado aceptado en caché para estas credenciales, o None"""
+        key = (username, mac_address.lower())
+        digest = self.password_digest(password)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.accepted.get(key)
+            if entry is not None:
+                expires, cached_digest, result = entry
+                if expires <= now:
+                    del self.accepted[key]
+                elif hmac.compare_digest(cached_digest, digest):
+                    self.accepted.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return dict(result, cached=True)
+            self.stats['misses'] += 1
+        return None
+
+    def store(self, username, mac_address, password, result):
+        """Guardar una autenticación aceptada hasta min(ttl, Session-Timeout)"""
+        ttl = min(self.ttl, int(result.get('session_timeout') or self.ttl))
+        if ttl <= 0:
+            return
+        key = (username, mac_address.lower())
+        digest = self.password_digest(password)
+        with self.lock:
+            self.accepted[key] = (time.monotonic() + ttl, digest, result)
+            self.accepted.move_to_end(key)
+            self.rejected.pop(key + (digest,), None)
+            self.stats['stored'] += 1
+            while len(self.accepted) > self.max_entries:
+                self.accepted.popitem(last=False)
+                self.stats['evicted'] += 1
+
+    def is_rejected(self, username, mac_address, password):
+        """True si estas mismas credenciales se rechazaron hace menos de negative_ttl"""
+        key = (username, mac_address.lower(), self.password_digest(password))
+        now = time.monotonic()
+        with self.lock:
+            expires = self.rejected.get(key)
+            if expires is None:
+                return False
+            if expires <= now:
+                del self.rejected[key]
+                return False
+            self.stats['negative_hits'] += 1
+            return True
+
+    def reject(self, username, mac_address, password):
+        """Recordar un rechazo de RADIUS (no los timeouts: no dicen nada de las credenciales)"""
+        key = (username, mac_address.lower(), self.password_digest(password))
+        with self.lock:
+            self.rejected[key] = time.monotonic() + self.negative_ttl
+            self.rejected.move_to_end(key)
+            self.stats['rejections_stored'] += 1
+            while len(self.rejected) > self.max_negative:
+                self.rejected.popitem(last=False)
+
+    def invalidate(self, username=None, mac_address=None):
+        """Olvidar las entradas de un usuario, de una MAC, de ambos o (sin filtros) todas"""
+        mac_address = mac_address.lower() if mac_address else None
+
+        def matches(key):
+            return (username is None or key[0] == username) and (mac_address is None or key[1] == mac_address)
+
+        with self.lock:
+            removed = [key for key in self.accepted if matches(key)]
+            for key in removed:
+                del self.accepted[key]
+            for key in [key for key in self.rejected if matches(key)]:
+                del self.rejected[key]
+            self.stats['invalidated'] += len(removed)
+        return len(removed)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({'entries': len(self.accepted), 'negative_entries': len(self.rejected),
+                          'ttl': self.ttl, 'negative_ttl': self.negative_ttl, 'max_entries': self.max_entries})
+        return stats
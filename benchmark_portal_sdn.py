@@ -0,0 +1,1698 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del Portal Cautivo SDN
+Levanta un Floodlight simulado en localhost y mide el rendimiento del controlador
+Uso: python3 benchmark_portal_sdn.py logins --concurrency 1 10 100
+     python3 benchmark_portal_sdn.py controller-load --modes threaded asyncio
+     python3 benchmark_portal_sdn.py --output run.json end-to-end --baseline previous.json
+Autor: SDN_Grupo2
+"""
+
+import argparse
+import bisect
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import sdn_controller
+from sdn_controller import SDNController
+from controller_state import SQLiteStateStore
+from radius_client import RadiusClient
+from neighbor_cache import NeighborCache
+import flow_export
+from metrics import Histogram
+from portal_stubs import (ROLES, ROLE_VLANS, FloodlightStub, RadiusStub, login_payload, radius_users,
+                          free_port, start_portal, start_controller, run_http_load)
+
+def legacy_install(controller, flows):
+    """Instalación serie original: una conexión nueva por flujo, sin timeout"""
+    results = []
+    for flow in flows:
+        # Mismo formato de resultado que FloodlightFlowPusher (registro de flujos y métricas)
+        result = {'name': flow.get('name'), 'switch': flow.get('switch'), 'status': 'error',
+                  'http_status': None, 'latency': 0.0, 'started': None, 'error': None}
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{controller.FLOODLIGHT_URL}/wm/staticflowpusher/json",
+                                     headers={"Content-Type": "application/json"},
+                                     data=json.dumps(flow))
+            result['http_status'] = response.status_code
+            result['status'] = 'success' if response.status_code == 200 else 'error'
+        except requests.exceptions.RequestException as e:
+            result['error'] = str(e)
+        result['latency'] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+def legacy_generate_flows_for_user(controller, user_data):
+    """Generación original: re-parsea el match de cada política en cada login y switch"""
+    role = user_data['role']
+    mac_address = user_data['mac_address']
+    vlan_id = user_data['vlan_id']
+    if role not in controller.FLOW_POLICIES:
+        role = 'ROLE_GUEST'
+    policy = controller.FLOW_POLICIES[role]
+    flows = []
+    for switch_dpid in controller.SWITCHES.keys():
+        for flow_template in policy['flows']:
+            flow = {
+                "switch": switch_dpid,
+                "name": controller.switch_flow_name(f"{flow_template['name']}_{mac_address.replace(':', '')}", switch_dpid),
+                "priority": str(flow_template.get('priority', policy['priority'])),
+                "eth_src": mac_address,
+                "eth_type": "0x0800",
+                "active": "true"
+            }
+            if 'match' in flow_template and flow_template['match']:
+                for item in flow_template['match'].split(','):
+                    item = item.strip()
+                    if '=' in item:
+                        key, value = item.split('=', 1)
+                        key = key.strip()
+                        value = value.strip()
+                        if key == "tp-dst":
+                            flow["ip_proto"] = "6"
+                            flow["tp_dst"] = value
+                        elif key == "tp-src":
+                            flow["ip_proto"] = "6"
+                            flow["tp_src"] = value
+                        elif key == "nw-dst":
+                            flow["ipv4_dst"] = value
+                        elif key == "nw-src":
+                            flow["ipv4_src"] = value
+                        elif key == "ip-proto":
+                            flow["ip_proto"] = value
+            action = flow_template['action']
+            if action == "output=normal":
+                flow["actions"] = "output=normal"
+            elif action == "drop":
+                flow["actions"] = ""
+            else:
+                flow["actions"] = action
+            if vlan_id and vlan_id != '0':
+                flow["vlan_vid"] = str(vlan_id)
+            flows.append(flow)
+    return flows
+
+def run_logins(controller, concurrency, total, role=None):
+    """Ejecutar `total` autenticaciones con `concurrency` clientes simultáneos"""
+    latencies = []
+    lock = threading.Lock()
+
+    def one_login(i):
+        start = time.perf_counter()
+        controller.user_authenticated_handler(login_payload(i, role))
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_login, range(total)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'logins': total,
+        'duration_s': round(duration, 3),
+        'logins_per_sec': round(total / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+    }
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def bench_logins(args):
+    """Logins/seg del controlador contra un Floodlight local"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.latency).start()
+
+    report = {'benchmark': 'logins', 'floodlight_latency_ms': args.latency * 1000, 'results': []}
+    try:
+        for mode in args.modes:
+            for concurrency in args.concurrency:
+                controller = SDNController(floodlight_url=stub.url)
+                if mode == 'legacy':
+                    controller.install_flows_to_floodlight = lambda flows, role=None, c=controller: legacy_install(c, flows)
+                total = max(args.logins, concurrency)
+                result = run_logins(controller, concurrency, total, role=args.role)
+                result['mode'] = mode
+                report['results'].append(result)
+                controller.flow_pusher.close()
+    finally:
+        stub.stop()
+    return report
+
+def time_generation(generate, payloads):
+    """Flujos generados por segundo llamando a `generate` con cada login"""
+    count = 0
+    start = time.perf_counter()
+    for payload in payloads:
+        count += len(generate(payload))
+    return count / (time.perf_counter() - start)
+
+def bench_flow_generation(args):
+    """Flujos/seg de generate_flows_for_user: parseo por login vs plantillas compiladas"""
+    controller = SDNController()
+    report = {'benchmark': 'flow-generation', 'switches': len(controller.SWITCHES), 'results': []}
+
+    for role in ROLES:
+        payloads = [login_payload(i, role) for i in range(args.logins)]
+        if controller.generate_flows_for_user(payloads[0]) != legacy_generate_flows_for_user(controller, payloads[0]):
+            raise RuntimeError(f"Compiled flows differ from legacy flows for {role}")
+
+        legacy = time_generation(lambda p: legacy_generate_flows_for_user(controller, p), payloads)
+        compiled = time_generation(controller.generate_flows_for_user, payloads)
+        report['results'].append({
+            'role': role,
+            'flows_per_login': len(controller.generate_flows_for_user(payloads[0])),
+            'legacy_flows_per_sec': round(legacy),
+            'compiled_flows_per_sec': round(compiled),
+            'speedup': round(compiled / legacy, 2)
+        })
+    return report
+
+def bench_expiry(args):
+    """Tiempo de expirar `sessions` sesiones a la vez y borrar todos sus flujos"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.latency).start()
+    controller = SDNController(floodlight_url=stub.url)
+    try:
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            list(pool.map(lambda i: (controller.user_authenticated_handler(login_payload(i)),
+                                     controller.register_user(login_payload(i))), range(args.sessions)))
+        flows_before = stub.stats()['flows']
+        registered_flows = controller.flow_registry.count()
+
+        for user_data in controller.active_users.values():
+            user_data['expires_at'] = 0
+        start = time.perf_counter()
+        controller.cleanup_expired_users()
+        duration = time.perf_counter() - start
+
+        return {
+            'benchmark': 'expiry',
+            'sessions': args.sessions,
+            'floodlight_latency_ms': args.latency * 1000,
+            'registered_flows': registered_flows,
+            'floodlight_flows_before': flows_before,
+            'floodlight_flows_after': stub.stats()['flows'],
+            'duration_s': round(duration, 3),
+            'flow_removal': controller.get_flow_removal_stats()
+        }
+    finally:
+        controller.flow_pusher.close()
+        stub.stop()
+
+def legacy_status_payload(controller):
+    """Trabajo original de /api/status: recorrido completo de sesiones y conteo por rol"""
+    current_time = time.time()
+    expired = [ip for ip, u in controller.active_users.items() if current_time > u.get('expires_at', 0)]
+    return {
+        'expired': len(expired),
+        'active_users': len(controller.active_users),
+        'users_by_role': {
+            role: len([u for u in controller.active_users.values() if u.get('role') == role])
+            for role in controller.FLOW_POLICIES.keys()
+        }
+    }
+
+def time_calls(call, requests_count):
+    latencies = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+    }
+
+def bench_status_latency(args):
+    """Latencia de /api/status con muchas sesiones activas"""
+    controller = SDNController()
+    for i in range(args.sessions):
+        controller.register_user(login_payload(i))
+
+    # Un 1% de sesiones vencidas para que la expiración tenga trabajo
+    expired_count = args.sessions // 100
+    for i in range(expired_count):
+        payload = login_payload(i)
+        payload['session_timeout'] = -1
+        controller.register_user(payload)
+
+    start = time.perf_counter()
+    controller.cleanup_expired_users()
+    expiry_duration = time.perf_counter() - start
+
+    client = sdn_controller.create_app(controller).test_client()
+    return {
+        'benchmark': 'status-latency',
+        'sessions': args.sessions,
+        'expired_sessions': expired_count,
+        'expiry_pass_ms': round(expiry_duration * 1000, 3),
+        'api_status': time_calls(lambda: client.get('/api/status'), args.requests),
+        'legacy_scan': time_calls(lambda: legacy_status_payload(controller), args.requests)
+    }
+
+def bench_recovery(args):
+    """Tiempo de recuperar sesiones desde SQLite y reconciliación contra Floodlight"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix='sdn_state_'), 'controller_state.db')
+
+    # 1. Ejecución anterior: sesiones con sus flujos guardadas en el backend
+    store = SQLiteStateStore(db_path)
+    writer = SDNController(state_store=store)
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        payload = login_payload(i)
+        writer.flow_registry.add(payload['client_ip'], payload['mac_address'],
+                                 writer.desired_flows_for_user(payload['client_ip'], payload))
+        writer.register_user(payload)
+    write_duration = time.perf_counter() - start
+    writer.flow_pusher.close()
+    store.close()
+
+    # 2. Reinicio: recuperar todo el estado
+    store = SQLiteStateStore(db_path)
+    restarted = SDNController(state_store=store)
+    restore = restarted.restore_state()
+    report = {
+        'benchmark': 'recovery',
+        'sessions': args.sessions,
+        'write_per_login_ms': round(write_duration / args.sessions * 1000, 3),
+        'restored_sessions': restore['restored'],
+        'restored_flows': restarted.flow_registry.count(),
+        'restore_duration_s': round(restore['duration'], 3)
+    }
+    restarted.flow_pusher.close()
+    store.close()
+
+    # 3. Reconciliación: Floodlight con flujos huérfanos y otros que faltan
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=0).start()
+    try:
+        controller = SDNController(floodlight_url=stub.url)
+        for i in range(args.reconcile_sessions):
+            controller.user_authenticated_handler(login_payload(i))
+            controller.register_user(login_payload(i))
+        for i in range(args.reconcile_sessions // 2):
+            controller.flow_registry.pop_client(login_payload(i)['client_ip'])
+            controller.unregister_user(login_payload(i)['client_ip'])      # Huérfanos
+        controller.user_authenticated_handler(login_payload(args.reconcile_sessions))  # Huérfanos extra
+        missing = controller.desired_flows_for_user('x', login_payload(args.reconcile_sessions - 1))
+        controller.flow_pusher.remove([(f['switch'], f['name']) for f in missing])      # Faltantes
+        report['reconcile'] = controller.reconcile_with_floodlight()
+        report['reconcile_second_pass'] = controller.reconcile_with_floodlight()
+        controller.flow_pusher.close()
+    finally:
+        stub.stop()
+    return report
+
+def run_radius_logins(authenticate, concurrency, total):
+    """Autenticar `total` usuarios con `concurrency` hilos; devuelve métricas"""
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one_login(i):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            ok = authenticate(f'user{i}', f'pass{i}')
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_login, range(total)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'logins': total,
+        'failures': failures,
+        'logins_per_sec': round(total / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+    }
+
+def bench_radius(args):
+    """Cliente RADIUS nativo frente a radtest contra un RADIUS simulado"""
+    secret = 'radius_secret_sdn'
+    users = radius_users(max(args.logins, 1))
+    report = {'benchmark': 'radius', 'latency_ms': args.latency * 1000, 'results': []}
+
+    stub = RadiusStub(secret, users, latency=args.latency).start()
+    try:
+        client = RadiusClient('127.0.0.1', stub.port, secret, timeout=2, retries=2)
+
+        # Verificar atributos y rechazo antes de medir
+        accept = client.authenticate('user1', 'pass1')
+        reject = client.authenticate('user1', 'wrong')
+        report['sample_accept'] = accept
+        report['sample_reject'] = reject['code']
+
+        def native(username, password):
+            return client.authenticate(username, password)['code'] == 'Access-Accept'
+
+        def radtest(username, password):
+            result = subprocess.run(['radtest', username, password, '127.0.0.1', str(stub.port), secret],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True, timeout=10)
+            return 'Access-Accept' in result.stdout
+
+        modes = [('native', native)]
+        if shutil.which('radtest'):
+            modes.append(('radtest', radtest))
+        else:
+            report['radtest'] = 'not installed, skipped'
+
+        for concurrency in args.concurrency:
+            for mode, authenticate in modes:
+                result = run_radius_logins(authenticate, concurrency, args.logins)
+                result['mode'] = mode
+                report['results'].append(result)
+        client.close()
+    finally:
+        stub.stop()
+
+    # Pérdida de paquetes: cada petición descartada se recupera con un reenvío
+    stub = RadiusStub(secret, users, drop_every=args.drop_every).start()
+    try:
+        client = RadiusClient('127.0.0.1', stub.port, secret, timeout=0.05, retries=3)
+        lossy = run_radius_logins(lambda u, p: client.authenticate(u, p)['code'] == 'Access-Accept',
+                                  10, args.logins)
+        lossy['drop_every'] = args.drop_every
+        report['lossy'] = lossy
+        client.close()
+    finally:
+        stub.stop()
+    return report
+
+def write_arp_table(path, entries):
+    """Escribir una tabla con el formato de /proc/net/arp"""
+    with open(path, 'w') as arp_file:
+        arp_file.write("IP address       HW type     Flags       HW address            Mask     Device\n")
+        for i in range(entries):
+            ip = f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+            mac = f'02:00:00:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}'
+            arp_file.write(f"{ip:<16} 0x1         0x2         {mac}     *        eth0\n")
+
+def bench_neighbor_cache(args):
+    """Búsquedas IP -> MAC/seg con la caché frente a un `arp -n` por login"""
+    arp_path = os.path.join(tempfile.mkdtemp(prefix='sdn_arp_'), 'arp')
+    write_arp_table(arp_path, args.entries)
+    ips = [f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}' for i in range(args.entries)]
+
+    cache = NeighborCache(arp_path=arp_path)
+    start = time.perf_counter()
+    loaded = cache.reload()
+    load_duration = time.perf_counter() - start
+
+    report = {
+        'benchmark': 'neighbor-cache',
+        'entries': loaded,
+        'load_ms': round(load_duration * 1000, 2),
+        'results': []
+    }
+
+    def lookup_slice(worker, concurrency):
+        lookup = cache.lookup
+        return sum(lookup(ips[i % len(ips)]) is not None
+                   for i in range(worker, args.lookups, concurrency))
+
+    for concurrency in args.concurrency:
+        lookups = args.lookups
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            found = sum(pool.map(lookup_slice, range(concurrency), [concurrency] * concurrency))
+        duration = time.perf_counter() - start
+        report['results'].append({
+            'mode': 'cache',
+            'concurrency': concurrency,
+            'lookups': lookups,
+            'found': found,
+            'lookups_per_sec': round(lookups / duration)
+        })
+
+    # Fallo de caché: una recarga de la tabla, sin lanzar procesos
+    start = time.perf_counter()
+    cache.loaded_at = 0.0
+    cache.lookup('192.0.2.254')
+    report['miss_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    # Referencia: un proceso `arp -n` por búsqueda, como hacía get_client_mac
+    if shutil.which('arp'):
+        lookups = min(args.lookups, 200)
+        start = time.perf_counter()
+        for i in range(lookups):
+            cache.lookup_system(ips[i % len(ips)])
+        duration = time.perf_counter() - start
+        report['results'].append({
+            'mode': 'arp-subprocess',
+            'concurrency': 1,
+            'lookups': lookups,
+            'lookups_per_sec': round(lookups / duration)
+        })
+    return report
+
+def bench_reconciler(args):
+    """Reconciliación periódica por switch: detección de deriva, corrección y coste en reposo"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=0).start()
+    try:
+        controller = SDNController(floodlight_url=stub.url)
+        reconciler = controller.reconciler
+        reconciler.max_changes = args.max_changes
+        switches = list(controller.SWITCHES.keys())
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(lambda i: controller.user_authenticated_handler(login_payload(i)), range(args.sessions)))
+        for i in range(args.sessions):
+            controller.register_user(login_payload(i))
+
+        # Deriva: flujos borrados por fuera del controlador y flujos de usuarios que ya no existen
+        drifted = [controller.desired_flows_for_user('x', login_payload(i)) for i in range(args.drift)]
+        controller.flow_pusher.remove([(f['switch'], f['name']) for flows in drifted for f in flows])
+        for i in range(args.sessions, args.sessions + args.drift):
+            controller.flow_pusher.push(controller.desired_flows_for_user('x', login_payload(i)))
+
+        def cycle():
+            start = time.perf_counter()
+            totals = {'missing': 0, 'orphans': 0, 'reinstalled': 0, 'removed': 0}
+            durations = []
+            for switch_dpid in switches:
+                pass_start = time.perf_counter()
+                result = reconciler.reconcile_switch(switch_dpid)
+                durations.append(time.perf_counter() - pass_start)
+                totals['missing'] += len(result['missing'])
+                totals['orphans'] += len(result['orphans'])
+                totals['reinstalled'] += result['reinstalled']
+                totals['removed'] += result['removed']
+            totals['cycle_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            totals['max_switch_pass_ms'] = round(max(durations) * 1000, 1)
+            return totals
+
+        report = {
+            'benchmark': 'reconciler',
+            'sessions': args.sessions,
+            'flows_in_floodlight': stub.stats()['flows'],
+            'drifted_sessions': args.drift,
+            'max_changes_per_pass': args.max_changes,
+            'cycles': [cycle() for _ in range(args.cycles)],
+            'drift_after': reconciler.get_stats()['drift'],
+            'status_reconciliation': {key: value for key, value in controller.status_report(True, 0)['reconciliation'].items()
+                                      if key != 'by_switch'}
+        }
+        controller.flow_pusher.close()
+    finally:
+        stub.stop()
+    return report
+
+def bench_aggregation(args):
+    """Tamaño de la tabla de flujos de Floodlight frente a usuarios: por usuario vs por rol/VLAN"""
+    report = {'benchmark': 'aggregation', 'results': []}
+    for strategy in args.strategies:
+        for users in args.users:
+            stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=0).start()
+            try:
+                controller = SDNController(floodlight_url=stub.url, flow_aggregation=strategy)
+                payloads = []
+                for i in range(users):
+                    payload = login_payload(i, role=args.role)
+                    payload['vlan_id'] = ROLE_VLANS[payload['role']]
+                    payloads.append(payload)
+
+                def login(payload):
+                    if controller.user_authenticated_handler(payload) > 0:
+                        controller.register_user(payload)
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    list(pool.map(login, payloads))
+                duration = time.perf_counter() - start
+                after_login = stub.stats()
+
+                # Logout de todos: los flujos de grupo se borran con el último usuario
+                controller.remove_user_flows([payload['client_ip'] for payload in payloads])
+                after_logout = stub.stats()
+
+                report['results'].append({
+                    'strategy': strategy,
+                    'users': users,
+                    'role': args.role or 'mixed',
+                    'floodlight_flows': after_login['flows'],
+                    'flows_per_user': round(after_login['flows'] / users, 2),
+                    'flows_pushed': after_login['posts'],
+                    'logins_per_sec': round(users / duration, 1),
+                    'flows_left_after_logout': after_logout['flows']
+                })
+                controller.flow_pusher.close()
+            finally:
+                stub.stop()
+    return report
+
+def tree_links(switches):
+    """Árbol de cinco switches: el primero (uplink) con dos ramas de dos niveles"""
+    s1, s2, s3, s4, s5 = switches
+    return [(s1, s2), (s1, s3), (s2, s4), (s3, s5)]
+
+def bench_placement(args):
+    """Flujos enviados por login: en todos los switches vs en el camino acceso -> uplink"""
+    switches = list(sdn_controller.KNOWN_SWITCHES.keys())
+    report = {'benchmark': 'placement', 'topology': 'tree', 'switches': len(switches), 'results': []}
+    for placement in args.placements:
+        stub = FloodlightStub(switches, latency=0, links=tree_links(switches)).start()
+        try:
+            controller = SDNController(floodlight_url=stub.url, flow_placement=placement)
+            controller.health_monitor.probe()
+            controller.start_topology()
+            if controller.topology is not None:
+                controller.topology.stop()   # Los refrescos se lanzan a mano más abajo
+            payloads = [login_payload(i, role=args.role) for i in range(args.users)]
+
+            def login(payload):
+                if controller.user_authenticated_handler(payload) > 0:
+                    controller.register_user(payload)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(login, payloads))
+            duration = time.perf_counter() - start
+            after_login = stub.stats()
+
+            result = {
+                'placement': placement,
+                'users': args.users,
+                'role': args.role,
+                'flows_pushed_per_login': round(after_login['posts'] / args.users, 2),
+                'floodlight_flows': after_login['flows'],
+                'logins_per_sec': round(args.users / duration, 1)
+            }
+
+            if controller.topology is not None:
+                # Mover una parte de los hosts a otro switch y dejar que sus flujos los sigan
+                moved = payloads[:args.moves]
+                for i, payload in enumerate(moved):
+                    current = controller.active_users[payload['client_ip']]['switches'][0]
+                    target = switches[(switches.index(current) + 1 + i % (len(switches) - 1)) % len(switches)]
+                    requests.post(f"{stub.url}/stub/move", json={'mac': payload['mac_address'], 'switch': target}, timeout=5)
+                start = time.perf_counter()
+                _, moved_macs = controller.topology.refresh()
+                relocated = controller.refresh_placements(moved_macs)
+                result['hosts_moved'] = len(moved_macs)
+                result['relocated'] = relocated
+                result['relocation_s'] = round(time.perf_counter() - start, 3)
+                result['topology'] = controller.topology.get_stats()
+
+            # Tras logins y movimientos la tabla debe coincidir con lo deseado
+            drift = controller.reconcile_with_floodlight()
+            result['drift_after'] = {'missing': drift['missing'], 'orphans': drift['orphans']}
+            report['results'].append(result)
+            controller.flow_pusher.close()
+        finally:
+            stub.stop()
+
+    baseline = next((r for r in report['results'] if r['placement'] == 'all'), None)
+    for result in report['results']:
+        if baseline is not None and result is not baseline:
+            result['reduction'] = round(baseline['flows_pushed_per_login'] / result['flows_pushed_per_login'], 2)
+    return report
+
+def bench_switch_churn(args):
+    """Un switch se desconecta y vuelve: flujos enviados a switches caídos y tiempo hasta reponer su tabla"""
+    switches = list(sdn_controller.KNOWN_SWITCHES.keys())
+    stub = FloodlightStub(switches, latency=0).start()
+    report = {'benchmark': 'switch-churn', 'switches': len(switches), 'users': args.users}
+    try:
+        controller = SDNController(floodlight_url=stub.url)
+        controller.health_monitor.probe()
+        payloads = [login_payload(i, role=args.role) for i in range(args.users * 2)]
+
+        def login(payload):
+            if controller.user_authenticated_handler(payload) > 0:
+                controller.register_user(payload)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(login, payloads[:args.users]))
+
+        # Cae el último switch: los logins siguientes no deben enviarle flujos
+        down = switches[-1]
+        requests.post(f"{stub.url}/stub/switches", json={'switches': switches[:-1]}, timeout=5)
+        controller.health_monitor.probe()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(login, payloads[args.users:]))
+        while_down = stub.stats()
+
+        # Vuelve: se reponen los flujos de todas las sesiones sin esperar al reconciliador
+        start = time.perf_counter()
+        requests.post(f"{stub.url}/stub/switches", json={'switches': switches}, timeout=5)
+        controller.health_monitor.probe()
+        expected = while_down['by_switch'][switches[0]]
+        restored = 0
+        while time.perf_counter() - start < args.timeout:
+            restored = stub.stats()['by_switch'].get(down, 0)
+            if restored >= expected:
+                break
+            time.sleep(0.01)
+
+        report.update({
+            'offline_posts': while_down['offline_posts'],
+            'live_switches_while_down': len(switches) - 1,
+            'flows_expected_on_rejoin': expected,
+            'flows_restored_on_rejoin': restored,
+            'rejoin_restore_s': round(time.perf_counter() - start, 3),
+            'inventory': controller.switch_inventory.get_stats(),
+            'validate_dpid_ns': round(min(timeit_loop(lambda: controller.validate_switch_dpid(down), 100000)) * 1e9, 1)
+        })
+        controller.flow_pusher.close()
+    finally:
+        stub.stop()
+    return report
+
+def timeit_loop(call, iterations, repeat=5):
+    """Segundos por llamada en varias repeticiones"""
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        results.append((time.perf_counter() - start) / iterations)
+    return results
+
+def measure_export(produce):
+    """Tiempo, bytes y pico de memoria de consumir una exportación"""
+    start = time.perf_counter()
+    total_bytes = sum(len(chunk) for chunk in produce())
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in produce():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'duration_s': round(duration, 3),
+        'megabytes': round(total_bytes / 1e6, 1),
+        'peak_memory_mb': round(peak / 1e6, 2)
+    }
+
+def bench_flow_export(args):
+    """Exportar ~1M flujos del registro: NDJSON/columnar en streaming frente a /api/flows"""
+    controller = SDNController()
+    for i in range(args.sessions):
+        payload = login_payload(i)
+        flows_by_switch = {}
+        for flow in controller.desired_flows_for_user(payload['client_ip'], payload):
+            flows_by_switch.setdefault(flow['switch'], []).append(flow['name'])
+        controller.flow_registry.add_grouped(payload['client_ip'], payload['mac_address'], flows_by_switch)
+        controller.activate_user(payload['client_ip'], dict(payload, expires_at=time.time() + 3600))
+    flows = controller.flow_registry.count()
+
+    def export(export_format, **filters):
+        params = flow_export.parse_export_params(dict(format=export_format, **filters))
+        return lambda: flow_export.export_stream(controller, params)[0]
+
+    report = {
+        'benchmark': 'flow-export',
+        'sessions': args.sessions,
+        'flows': flows,
+        'ndjson': measure_export(export('ndjson')),
+        'columnar': measure_export(export('columnar')),
+        'ndjson_role_filter': measure_export(export('ndjson', role='ROLE_IOT')),
+        'ndjson_page_1000': measure_export(export('ndjson', offset='500000', limit='1000')),
+        'legacy_api_flows': measure_export(lambda: [json.dumps(controller.flows_report()).encode()])
+    }
+    controller.flow_pusher.close()
+    return report
+
+def bench_controller_load(args):
+    """p50/p99 de /api/user_authenticated en modo threaded vs asyncio"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.latency).start()
+
+    report = {'benchmark': 'controller-load', 'floodlight_latency_ms': args.latency * 1000, 'results': []}
+    try:
+        for mode in args.modes:
+            port = free_port()
+            process = start_controller(mode, stub.url, port)
+            try:
+                for concurrency in args.concurrency:
+                    total = max(args.logins, concurrency)
+                    payloads = [login_payload(i) for i in range(total)]
+                    latencies, errors, duration = run_http_load(
+                        f"http://127.0.0.1:{port}/api/user_authenticated", payloads, concurrency)
+                    report['results'].append({
+                        'mode': mode,
+                        'concurrency': concurrency,
+                        'requests': total,
+                        'errors': errors,
+                        'requests_per_sec': round(total / duration, 1),
+                        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+                    })
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        stub.stop()
+    return report
+
+def bench_duplicate_logins(args):
+    """Notificaciones de login duplicadas y simultáneas: POSTs a Floodlight por login"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.latency).start()
+
+    report = {'benchmark': 'duplicate-logins', 'duplicates': args.duplicates,
+              'floodlight_latency_ms': args.latency * 1000, 'results': []}
+    try:
+        for mode in args.modes:
+            port = free_port()
+            process = start_controller(mode, stub.url, port)
+            url = f"http://127.0.0.1:{port}/api/user_authenticated"
+            try:
+                # Referencia: un único login de otro usuario del mismo rol
+                before = stub.stats()['posts']
+                run_http_load(url, [login_payload(0, args.role)], 1)
+                single = stub.stats()['posts'] - before
+
+                before = stub.stats()['posts']
+                payload = login_payload(1, args.role)
+                latencies, errors, duration = run_http_load(url, [payload] * args.duplicates, args.duplicates)
+                duplicated = stub.stats()['posts'] - before
+
+                # Mismo usuario y rol otra vez: solo renueva la sesión
+                before = stub.stats()['posts']
+                run_http_load(url, [payload], 1)
+                relogin = stub.stats()['posts'] - before
+
+                report['results'].append({
+                    'mode': mode,
+                    'posts_single_login': single,
+                    'posts_duplicate_burst': duplicated,
+                    'posts_relogin': relogin,
+                    'flow_pushes_per_burst': round(duplicated / single, 2) if single else None,
+                    'errors': errors,
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                    'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+                })
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        stub.stop()
+    return report
+
+def bench_provisioning(args):
+    """Latencia de la notificación de login con aprovisionamiento inline vs encolado
+    según la latencia de Floodlight, y tiempo hasta tener todos los flujos instalados"""
+    report = {'benchmark': 'provisioning', 'controller_mode': args.controller_mode,
+              'logins': args.logins, 'concurrency': args.concurrency, 'results': []}
+    for latency in args.latencies:
+        for provisioning in args.provisioning:
+            # Floodlight vacío en cada pasada: la reconciliación al arrancar no borra flujos ajenos
+            stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=latency).start()
+            port = free_port()
+            process = start_controller(args.controller_mode, stub.url, port,
+                                       extra_args=('--provisioning', provisioning))
+            controller_url = f"http://127.0.0.1:{port}"
+            try:
+                payloads = [login_payload(i, args.role) for i in range(args.logins)]
+                start = time.perf_counter()
+                latencies, errors, _ = run_http_load(f"{controller_url}/api/user_authenticated",
+                                                     payloads, args.concurrency)
+                # Con la cola, los flujos siguen instalándose tras responder
+                while True:
+                    status = requests.get(f"{controller_url}/api/status", timeout=5).json()
+                    if status['provisioning']['pending'] == 0:
+                        break
+                    time.sleep(0.05)
+                provisioned = time.perf_counter() - start
+                report['results'].append({
+                    'floodlight_latency_ms': latency * 1000,
+                    'provisioning': provisioning,
+                    'errors': errors,
+                    'notify_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                    'notify_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                    'all_provisioned_s': round(provisioned, 3),
+                    'active_users': status['active_users'],
+                    'queue': status['provisioning']
+                })
+            finally:
+                process.terminate()
+                process.wait()
+                stub.stop()
+    return report
+
+def bench_admission(args):
+    """Login masivo con roles mezclados: espera en cola y descartes por rol con la
+    cola por prioridad y el token bucket hacia Floodlight"""
+    stub = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.latency).start()
+    port = free_port()
+    process = start_controller(args.controller_mode, stub.url, port,
+                               extra_args=('--provisioning', 'queued', '--flow-push-rate', str(args.rate)))
+    controller_url = f"http://127.0.0.1:{port}"
+    try:
+        payloads = [login_payload(i) for i in range(args.logins)]
+        random.Random(args.seed).shuffle(payloads)
+        start = time.perf_counter()
+        latencies, rejected, _ = run_http_load(f"{controller_url}/api/user_authenticated", payloads, args.concurrency)
+        while requests.get(f"{controller_url}/api/status", timeout=5).json()['provisioning']['pending']:
+            time.sleep(0.1)
+        duration = time.perf_counter() - start
+        status = requests.get(f"{controller_url}/api/status", timeout=5).json()
+        posts = stub.stats()['posts']
+    finally:
+        process.terminate()
+        process.wait()
+        stub.stop()
+
+    # Prioridad de cada rol según las políticas del controlador (instancia local, sin servir)
+    reference = SDNController()
+    reference.flow_pusher.close()
+    return {
+        'benchmark': 'admission',
+        'controller_mode': args.controller_mode,
+        'logins': args.logins,
+        'concurrency': args.concurrency,
+        'flow_push_rate': args.rate,
+        'rejected_503': rejected,
+        'notify_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'duration_s': round(duration, 3),
+        'floodlight_posts_per_sec': round(posts / duration, 1),
+        'rate_limiter': status['flow_push_rate_limit'],
+        'by_role': dict(sorted(status['provisioning']['by_role'].items(),
+                               key=lambda item: -reference.role_priority(item[0])))
+    }
+
+def parse_weights(spec, valid):
+    """'login=6,status=3' -> {'login': 6.0, 'status': 3.0}"""
+    weights = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in valid:
+            raise SystemExit(f"Valor desconocido '{name}'; opciones: {', '.join(valid)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def latency_summary(latencies, errors, duration):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'per_sec': round(len(latencies) / duration, 1) if duration else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+    }
+
+class PortalClient:
+    """Dispositivo simulado: IP propia (X-Forwarded-For) y usuario RADIUS"""
+
+    def __init__(self, index, role):
+        self.index = index
+        self.role = role
+        self.username = f'user{index}'
+        self.password = f'pass{index}'
+        self.client_ip = f'10.200.{(index >> 8) & 255}.{index & 255}'
+        self.logged_in = False
+        self.session = requests.Session()
+        self.session.headers['X-Forwarded-For'] = self.client_ip
+
+    def login(self, portal_url):
+        response = self.session.post(f"{portal_url}/authenticate", timeout=30,
+                                     data={'username': self.username, 'password': self.password})
+        ok = response.status_code == 200 and 'Conexión Exitosa' in response.text
+        self.logged_in = self.logged_in or ok
+        return ok
+
+    def logout(self, portal_url):
+        response = self.session.get(f"{portal_url}/logout", timeout=30)
+        self.logged_in = False
+        return response.status_code == 200
+
+    def status(self, portal_url):
+        response = self.session.get(f"{portal_url}/status", timeout=30)
+        return response.status_code == 200 and response.json()['authenticated'] == self.logged_in
+
+def run_portal_mix(portal_url, clients, concurrency, operations, mix, seed):
+    """Ejecutar `operations` operaciones repartidas entre `concurrency` hilos
+    Cada hilo es dueño de un subconjunto de clientes: nunca hay dos operaciones
+    a la vez sobre el mismo dispositivo"""
+    samples = {name: [] for name in ('login', 'logout', 'status')}
+    login_by_role = {}
+    errors = {name: 0 for name in samples}
+    role_errors = {}
+    lock = threading.Lock()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def worker(w):
+        rng = random.Random(seed + w)
+        own = clients[w::concurrency]
+        for _ in range(operations // concurrency + (1 if w < operations % concurrency else 0)):
+            client = rng.choice(own)
+            op = rng.choices(names, weights)[0]
+            if op == 'logout' and not client.logged_in:
+                op = 'login'   # Solo se cierra sesión si hay una abierta
+            if op == 'login' and client.logged_in:
+                op = 'status'
+            start = time.perf_counter()
+            try:
+                ok = getattr(client, op)(portal_url)
+            except (requests.exceptions.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[op].append(elapsed)
+                if op == 'login':
+                    login_by_role.setdefault(client.role, []).append(elapsed)
+                if not ok:
+                    errors[op] += 1
+                    if op == 'login':
+                        role_errors[client.role] = role_errors.get(client.role, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    return samples, login_by_role, errors, role_errors, duration
+
+def compare_reports(baseline, report):
+    """Variación de throughput y p99 respecto a un informe anterior (misma concurrencia)"""
+    previous = {result['concurrency']: result for result in baseline.get('results', [])}
+    comparison = []
+    for result in report['results']:
+        before = previous.get(result['concurrency'])
+        if before is None:
+            continue
+        comparison.append({
+            'concurrency': result['concurrency'],
+            'ops_per_sec_change_pct': round((result['ops_per_sec'] / before['ops_per_sec'] - 1) * 100, 1),
+            'login_p99_change_pct': round((result['operations']['login']['p99_ms'] /
+                                           max(before['operations']['login']['p99_ms'], 1e-9) - 1) * 100, 1)
+        })
+    return comparison
+
+LOGIN_STAGE_METRICS = {
+    'portal': {'arp_lookup': 'portal_arp_lookup_seconds', 'radius_auth': 'portal_radius_auth_seconds',
+               'controller_notify': 'portal_controller_notify_seconds', 'portal_total': 'portal_login_seconds'},
+    'controller': {'controller_handler': 'sdn_controller_login_seconds',
+                   'flow_push_per_flow': 'sdn_controller_flow_push_seconds'}
+}
+
+def scrape_histogram_means(url, stages):
+    """Media en ms de cada histograma (sumando todas sus etiquetas) de un /metrics"""
+    totals = {}
+    for line in requests.get(url, timeout=10).text.splitlines():
+        if line.startswith('#') or ' ' not in line:
+            continue
+        sample, value = line.rsplit(' ', 1)
+        name = sample.split('{', 1)[0]
+        for suffix in ('_sum', '_count'):
+            if name.endswith(suffix):
+                key = (name[:-len(suffix)], suffix)
+                totals[key] = totals.get(key, 0.0) + float(value)
+    means = {}
+    for stage, metric in stages.items():
+        count = totals.get((metric, '_count'), 0)
+        means[stage] = round(totals.get((metric, '_sum'), 0.0) / count * 1000, 3) if count else None
+    return means
+
+def slowest_logins(portal_url, controller_url, limit=3):
+    """Los logins más lentos del portal con los spans del controlador de la misma traza"""
+    portal = requests.get(f"{portal_url}/debug/traces", params={'limit': limit}, timeout=5).json()
+    controller = requests.get(f"{controller_url}/debug/traces", params={'limit': 500}, timeout=5).json()
+    by_trace = {trace['trace_id']: trace for trace in controller['traces']}
+    logins = []
+    for trace in portal['traces']:
+        remote = by_trace.get(trace['trace_id'])
+        logins.append({
+            'trace_id': trace['trace_id'],
+            'duration_ms': trace['duration_ms'],
+            'portal_spans_ms': {span['name']: span['duration_ms'] for span in trace['spans']},
+            'controller_spans_ms': {span['name']: span['duration_ms'] for span in remote['spans']
+                                    if span['name'] != 'floodlight_post'} if remote else None,
+            'floodlight_posts': sum(span['name'] == 'floodlight_post' for span in remote['spans']) if remote else None
+        })
+    return logins
+
+def bench_metrics_overhead(args):
+    """Coste de Histogram.observe por hilo frente a un contador protegido por lock"""
+    report = {'benchmark': 'metrics-overhead', 'observations_per_thread': args.observations, 'results': []}
+
+    class LockedHistogram(Histogram):
+        """Mismos cubos, pero un único diccionario compartido bajo un lock"""
+        def __init__(self):
+            super().__init__('bench_locked_seconds', 'bench', ['role'])
+            self.lock = threading.Lock()
+            self.counts = {}
+
+        def observe(self, value, *labels):
+            with self.lock:
+                counts = self.counts.get(labels)
+                if counts is None:
+                    counts = self.counts[labels] = [0] * (len(self.buckets) + 2)
+                counts[bisect.bisect_left(self.buckets, value)] += 1
+                counts[-1] += value
+
+    for threads in args.threads:
+        for kind, metric in (('sharded', Histogram('bench_seconds', 'bench', ['role'])), ('locked', LockedHistogram())):
+            barrier = threading.Barrier(threads)
+
+            def worker(_):
+                barrier.wait()
+                observe = metric.observe
+                for i in range(args.observations):
+                    observe(0.003, ROLES[i % 6])
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(worker, range(threads)))
+            duration = time.perf_counter() - start
+            total = threads * args.observations
+            result = {'kind': kind, 'threads': threads,
+                      'ns_per_observation': round(duration / total * 1e9, 1),
+                      'observations_per_sec': round(total / duration)}
+            if kind == 'sharded':
+                result['counted'] = sum(sum(counts[:-1]) for counts in metric.collect().values())
+            report['results'].append(result)
+    return report
+
+def bench_end_to_end(args):
+    """Portal → Controlador → Floodlight con RADIUS y Floodlight simulados"""
+    roles = parse_weights(args.roles, ROLES)
+    mix = parse_weights(args.mix, ['login', 'logout', 'status'])
+    rng = random.Random(args.seed)
+    role_names = list(roles)
+    client_roles = rng.choices(role_names, [roles[r] for r in role_names], k=args.clients)
+
+    secret = 'radius_secret_sdn'
+    users = {f'user{i}': (f'pass{i}', role, 10 + ROLES.index(role), 3600, 'default')
+             for i, role in enumerate(client_roles)}
+
+    floodlight = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=args.floodlight_latency).start()
+    radius = RadiusStub(secret, users, latency=args.radius_latency).start()
+    controller_port = free_port()
+    portal_port = free_port()
+    processes = []
+    report = {
+        'benchmark': 'end-to-end',
+        'controller_mode': args.controller_mode,
+        'provisioning': args.provisioning,
+        'clients': args.clients,
+        'roles': roles,
+        'mix': mix,
+        'floodlight_latency_ms': args.floodlight_latency * 1000,
+        'radius_latency_ms': args.radius_latency * 1000,
+        'results': []
+    }
+    try:
+        processes.append(start_controller(args.controller_mode, floodlight.url, controller_port,
+                                          extra_args=('--provisioning', args.provisioning)))
+        processes.append(start_portal(portal_port, f"http://127.0.0.1:{controller_port}", radius.port, secret))
+        portal_url = f"http://127.0.0.1:{portal_port}"
+
+        for concurrency in args.concurrency:
+            clients = [PortalClient(i, role) for i, role in enumerate(client_roles)]
+            concurrency = min(concurrency, len(clients))
+            before = floodlight.stats()
+            samples, login_by_role, errors, role_errors, duration = run_portal_mix(
+                portal_url, clients, concurrency, args.operations, mix, args.seed)
+            after = floodlight.stats()
+
+            # Cerrar las sesiones abiertas para que el siguiente nivel parta de cero
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda c: c.logout(portal_url), [c for c in clients if c.logged_in]))
+
+            total = sum(len(values) for values in samples.values())
+            report['results'].append({
+                'concurrency': concurrency,
+                'operations_total': total,
+                'duration_s': round(duration, 3),
+                'ops_per_sec': round(total / duration, 1),
+                'operations': {op: latency_summary(values, errors[op], duration)
+                               for op, values in samples.items()},
+                'login_by_role': {role: latency_summary(values, role_errors.get(role, 0), duration)
+                                  for role, values in sorted(login_by_role.items())},
+                'flows_pushed_per_sec': round((after['posts'] - before['posts']) / duration, 1),
+                'flows_removed_per_sec': round((after['deletes'] - before['deletes']) / duration, 1)
+            })
+
+        # Desglose del login por etapa a partir de /metrics de ambos procesos
+        report['login_stages_mean_ms'] = dict(
+            scrape_histogram_means(f"{portal_url}/metrics", LOGIN_STAGE_METRICS['portal']),
+            **scrape_histogram_means(f"http://127.0.0.1:{controller_port}/metrics",
+                                     LOGIN_STAGE_METRICS['controller']))
+        report['slowest_logins'] = slowest_logins(portal_url, f"http://127.0.0.1:{controller_port}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        radius.stop()
+        floodlight.stop()
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['vs_baseline'] = compare_reports(json.load(baseline_file), report)
+    return report
+
+def run_client_calls(call, clients, concurrency, rounds=1):
+    """`call(cliente)` para cada cliente `rounds` veces desde `concurrency` hilos
+    (cada hilo con sus propios clientes); devuelve latencias, fallos y duración"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(w):
+        nonlocal errors
+        for _ in range(rounds):
+            for client in clients[w::concurrency]:
+                start = time.perf_counter()
+                try:
+                    ok = call(client)
+                except (requests.exceptions.RequestException, ValueError):
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+def bench_portal_workers(args):
+    """Throughput de /authenticate y /status con 1..N workers pre-fork y sesiones compartidas"""
+    secret = 'radius_secret_sdn'
+    users = {f'user{i}': (f'pass{i}', args.role, 10 + ROLES.index(args.role), 3600, 'default')
+             for i in range(args.clients)}
+    radius = RadiusStub(secret, users, latency=args.radius_latency).start()
+    floodlight = FloodlightStub(sdn_controller.KNOWN_SWITCHES.keys(), latency=0.001).start()
+    controller_port = free_port()
+    controller = start_controller('asyncio', floodlight.url, controller_port,
+                                  extra_args=('--provisioning', 'queued'))
+    controller_url = f"http://127.0.0.1:{controller_port}"
+    report = {
+        'benchmark': 'portal-workers',
+        'session_backend': 'sqlite',
+        'clients': args.clients,
+        'concurrency': args.concurrency,
+        'status_rounds': args.status_rounds,
+        'cpus': os.cpu_count(),
+        'results': []
+    }
+    try:
+        for workers in args.workers:
+            portal_port = free_port()
+            portal_url = f"http://127.0.0.1:{portal_port}"
+            with tempfile.TemporaryDirectory() as tmp:
+                portal = start_portal(portal_port, controller_url, radius.port, secret, extra_args=(
+                    '--workers', str(workers), '--session-backend', 'sqlite',
+                    '--session-db', os.path.join(tmp, 'sessions.db')))
+                try:
+                    clients = [PortalClient(i, args.role) for i in range(args.clients)]
+                    login_latencies, login_errors, login_duration = run_client_calls(
+                        lambda c: c.login(portal_url), clients, args.concurrency)
+
+                    # Conexiones nuevas: cada /status puede caer en un worker distinto al del login
+                    for client in clients:
+                        client.session.close()
+                    status_latencies, status_errors, status_duration = run_client_calls(
+                        lambda c: c.status(portal_url), clients, args.concurrency, args.status_rounds)
+
+                    pids = set()
+                    for _ in range(8 * workers):
+                        pids.add(requests.get(f"{portal_url}/api/stats", headers={'Connection': 'close'},
+                                              timeout=10).json()['worker_pid'])
+
+                    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                        list(pool.map(lambda c: c.logout(portal_url), clients))
+                finally:
+                    portal.terminate()
+                    portal.wait()
+
+            report['results'].append({
+                'workers': workers,
+                'workers_answering': len(pids),
+                'authenticate': latency_summary(login_latencies, login_errors, login_duration),
+                'status': latency_summary(status_latencies, status_errors, status_duration)
+            })
+    finally:
+        controller.terminate()
+        controller.wait()
+        radius.stop()
+        floodlight.stop()
+    return report
+
+PROBE_MIX = ('/generate_204', '/hotspot-detect.html', '/connecttest.txt', '/success.txt', '/', '/some/page.html')
+
+def run_probe_load(port, paths, concurrency, requests_per_client, gzip_accepted):
+    """GETs keep-alive (http.client, sin la sobrecarga de requests) de clientes sin sesión"""
+    latencies = []
+    errors = 0
+    received = 0
+    lock = threading.Lock()
+
+    def worker(w):
+        nonlocal errors, received
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        headers = {'X-Forwarded-For': f'10.201.{w >> 8}.{w & 255}'}
+        if gzip_accepted:
+            headers['Accept-Encoding'] = 'gzip'
+        local = []
+        failed = 0
+        size = 0
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                connection.request('GET', paths[(w + i) % len(paths)], headers=headers)
+                response = connection.getresponse()
+                size += len(response.read())
+                failed += response.status not in (200, 302)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+            local.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors += failed
+            received += size
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    summary = latency_summary(latencies, errors, duration)
+    summary['bytes_per_response'] = round(received / len(latencies)) if latencies else 0
+    return summary
+
+def bench_probes(args):
+    """Sondas de portal cautivo y URLs redirigidas: Flask completo vs camino rápido"""
+    report = {
+        'benchmark': 'probes',
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'results': []
+    }
+    for fast_path in args.modes:
+        port = free_port()
+        portal = start_portal(port, 'http://127.0.0.1:9', free_port(), 'unused',
+                              extra_args=() if fast_path == 'on' else ('--no-fast-path',))
+        try:
+            result = {'fast_path': fast_path}
+            for name, paths in (('generate_204', ['/generate_204']), ('mixed', list(PROBE_MIX))):
+                run_probe_load(port, paths, args.concurrency, 20, True)   # Calentamiento
+                result[name] = run_probe_load(port, paths, args.concurrency,
+                                              args.requests // args.concurrency, True)
+            result['login_page'] = {
+                'identity_bytes': len(requests.get(f"http://127.0.0.1:{port}/", timeout=10,
+                                                   headers={'Accept-Encoding': 'identity'}).content),
+                'gzip_bytes': run_probe_load(port, ['/'], 1, 1, True)['bytes_per_response']
+            }
+        finally:
+            portal.terminate()
+            portal.wait()
+        report['results'].append(result)
+    return report
+
+def page_contexts(count):
+    """Parámetros de login.html / success.html / logout.html para `count` dispositivos"""
+    contexts = []
+    for i in range(count):
+        client_ip = f'10.202.{i >> 8}.{i & 255}'
+        contexts.append(('login.html', {'client_ip': client_ip}))
+        contexts.append(('success.html', {
+            'username': f'user{i}', 'role': ROLES[i % len(ROLES)], 'vlan_id': str(10 + i % len(ROLES)),
+            'session_timeout': 3600, 'client_ip': client_ip, 'mac_address': f'00:00:00:00:{i >> 8:02x}:{i & 255:02x}',
+            'provisioning_state': None}))
+        contexts.append(('logout.html', {}))
+    return contexts
+
+def bench_templates(args):
+    """Bytes por página de login y tiempo de render: CSS en línea vs CSS con huella y páginas en caché"""
+    import gzip
+    import flask
+    import jinja2
+    import captive_portal
+    from portal_assets import PageRenderer
+
+    # Variante anterior: el CSS en línea dentro de base.html, render_template de Flask
+    css = captive_portal.assets.by_name['portal.css'].encodings['identity'].decode()
+    base = captive_portal.app.jinja_env.loader.get_source(captive_portal.app.jinja_env, 'base.html')[0]
+    inline_base = re.sub(r'    <link rel="stylesheet"[^>]*>\n', lambda _: f'    <style>\n{css}    </style>\n', base)
+    legacy_app = flask.Flask('legacy_portal', root_path=captive_portal.app.root_path, static_folder=None)
+    legacy_app.jinja_loader = jinja2.ChoiceLoader([jinja2.DictLoader({'base.html': inline_base}),
+                                                   captive_portal.app.jinja_loader])
+
+    def legacy_render(name, **context):
+        with legacy_app.app_context():
+            return flask.render_template(name, **context)
+
+    contexts = page_contexts(args.devices)
+    renderers = {
+        'inline_css': legacy_render,
+        'compiled': PageRenderer(captive_portal.app.jinja_env, ['login.html', 'success.html', 'logout.html'],
+                                 cache_size=0).render,
+        'cached': captive_portal.pages.render
+    }
+    report = {'benchmark': 'templates', 'devices': args.devices, 'bytes': {}, 'render': []}
+
+    for name, render in (('inline_css', legacy_render), ('fingerprinted_css', captive_portal.pages.render)):
+        page = render('login.html', client_ip='10.202.0.1').encode()
+        report['bytes'][name] = {'login_page': len(page), 'login_page_gzip': len(gzip.compress(page))}
+    asset = captive_portal.assets.by_name['portal.css']
+    report['bytes']['css_asset'] = {encoding: len(body) for encoding, body in asset.encodings.items()}
+    report['bytes']['css_asset']['cache_control'] = 'public, max-age=31536000, immutable'
+
+    for threads in args.threads:
+        for name, render in renderers.items():
+            for template, context in contexts:   # Calentamiento (compilación y caché)
+                render(template, **context)
+            barrier = threading.Barrier(threads)
+
+            def worker(w):
+                barrier.wait()
+                for i in range(args.renders):
+                    template, context = contexts[(w * 7919 + i) % len(contexts)]
+                    render(template, **context)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(worker, range(threads)))
+            duration = time.perf_counter() - start
+            total = threads * args.renders
+            report['render'].append({'renderer': name, 'threads': threads,
+                                     'us_per_render': round(duration / total * 1e6, 1),
+                                     'renders_per_sec': round(total / duration)})
+    return report
+
+def bench_brute_force(args):
+    """Ráfaga de credenciales erróneas contra el limitador del portal: RADIUS solo ve los intentos permitidos"""
+    import captive_portal
+
+    secret = 'radius_secret_sdn'
+    radius = RadiusStub(secret, {'legit': ('legit-pass', 'ROLE_GUEST', 30, 3600, 'default')},
+                        latency=args.radius_latency).start()
+    portal = captive_portal.portal
+    portal.RADIUS_SERVER = '127.0.0.1'
+    portal.RADIUS_PORT = radius.port
+    portal.RADIUS_SECRET = secret
+    portal.radius_client = portal.create_radius_client()
+    logging.getLogger(captive_portal.__name__).setLevel(logging.ERROR)
+    if args.session_backend == 'sqlite':
+        # Los contadores en el SQLite compartido, como en un portal con --workers
+        from login_limiter import SharedSlidingWindowLimiter
+        from portal_sessions import SQLiteSessionStore
+        db_path = os.path.join(tempfile.mkdtemp(prefix='sdn_portal_'), 'sessions.db')
+        portal.sessions = SQLiteSessionStore(db_path)
+        portal.login_limiter = SharedSlidingWindowLimiter(portal.sessions, portal.MAX_LOGIN_ATTEMPTS,
+                                                          portal.LOCKOUT_DURATION)
+
+    # Contar lo que llega a RADIUS por IP y por usuario
+    radius_calls = {'ip': {}, 'user': {}}
+    calls_lock = threading.Lock()
+    radius_authenticate = portal.radius_authenticate
+
+    def counted_radius_authenticate(username, password, client_ip, mac_address):
+        with calls_lock:
+            radius_calls['ip'][client_ip] = radius_calls['ip'].get(client_ip, 0) + 1
+            radius_calls['user'][username] = radius_calls['user'].get(username, 0) + 1
+        return radius_authenticate(username, password, client_ip, mac_address)
+    portal.radius_authenticate = counted_radius_authenticate
+
+    per_thread_rate = args.rate / args.threads
+    attempts_per_thread = int(per_thread_rate * args.duration)
+    outcomes = {'throttled': 0, 'rejected': 0, 'accepted': 0}
+    throttled_latencies = []
+    lock = threading.Lock()
+
+    def attacker(w):
+        rng = random.Random(args.seed + w)
+        local = {name: 0 for name in outcomes}
+        local_latencies = []
+        start = time.perf_counter()
+        for i in range(attempts_per_thread):
+            delay = start + i / per_thread_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            ip_index = rng.randrange(args.ips)
+            client_ip = f'10.203.{ip_index >> 8}.{ip_index & 255}'
+            began = time.perf_counter()
+            result = portal.authenticate_attempt(f'victim{rng.randrange(args.users)}', f'guess{rng.random()}',
+                                                 client_ip, f'00:00:00:03:{ip_index >> 8:02x}:{ip_index & 255:02x}')
+            elapsed = time.perf_counter() - began
+            if result.get('throttled'):
+                local['throttled'] += 1
+                local_latencies.append(elapsed)
+            else:
+                local['accepted' if result['authenticated'] else 'rejected'] += 1
+        with lock:
+            for name, count in local.items():
+                outcomes[name] += count
+            throttled_latencies.extend(local_latencies)
+
+    try:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=attacker, args=(w,)) for w in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        # Un usuario legítimo desde otra IP no se ve afectado por el ataque
+        legit = portal.authenticate_attempt('legit', 'legit-pass', '10.204.0.1', '00:00:00:04:00:01')
+    finally:
+        portal.radius_authenticate = radius_authenticate
+        radius.stop()
+
+    limit = portal.login_limiter.limit
+    total = sum(outcomes.values())
+    max_per_ip = max(radius_calls['ip'].values(), default=0)
+    max_per_user = max(radius_calls['user'].values(), default=0)
+    throttled_latencies.sort()
+    return {
+        'benchmark': 'brute-force',
+        'session_backend': args.session_backend,
+        'offered_rate': args.rate,
+        'achieved_rate': round(total / duration, 1),
+        'attempts': total,
+        'attacker_ips': args.ips,
+        'usernames': args.users,
+        'limit': limit,
+        'window_s': portal.login_limiter.window,
+        'outcomes': outcomes,
+        'radius_calls': sum(radius_calls['ip'].values()) - 1,   # Sin el login legítimo
+        'max_radius_calls_per_ip': max_per_ip,
+        'max_radius_calls_per_user': max_per_user,
+        'within_limits': max_per_ip <= limit and max_per_user <= limit,
+        'throttled_p50_us': round(percentile(throttled_latencies, 50) * 1e6, 1),
+        'throttled_p99_us': round(percentile(throttled_latencies, 99) * 1e6, 1),
+        'legit_login_after_attack': legit['authenticated'],
+        'limiter': portal.login_limiter.get_stats()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del Portal Cautivo SDN')
+    parser.add_argument('--output', help='Guardar también el informe JSON en este fichero')
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    logins = sub.add_parser('logins', help='Logins/seg contra un Floodlight simulado')
+    logins.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100])
+    logins.add_argument('--logins', type=int, default=200, help='Autenticaciones por nivel de concurrencia')
+    logins.add_argument('--role', default='ROLE_PROFESOR')
+    logins.add_argument('--latency', type=float, default=0.002, help='Latencia simulada de Floodlight (s)')
+    logins.add_argument('--modes', nargs='+', default=['pooled', 'legacy'], choices=['pooled', 'legacy'])
+    logins.set_defaults(func=bench_logins)
+
+    load = sub.add_parser('controller-load', help='Latencia HTTP del controlador: threaded vs asyncio')
+    load.add_argument('--concurrency', type=int, nargs='+', default=[10, 100])
+    load.add_argument('--logins', type=int, default=200, help='Peticiones por nivel de concurrencia')
+    load.add_argument('--latency', type=float, default=0.005, help='Latencia simulada de Floodlight (s)')
+    load.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'], choices=['threaded', 'asyncio'])
+    load.set_defaults(func=bench_controller_load)
+
+    generation = sub.add_parser('flow-generation', help='Flujos/seg generados por rol')
+    generation.add_argument('--logins', type=int, default=20000, help='Logins simulados por rol')
+    generation.set_defaults(func=bench_flow_generation)
+
+    expiry = sub.add_parser('expiry', help='Expiración masiva de sesiones y borrado de flujos')
+    expiry.add_argument('--sessions', type=int, default=500)
+    expiry.add_argument('--latency', type=float, default=0.002, help='Latencia simulada de Floodlight (s)')
+    expiry.set_defaults(func=bench_expiry)
+
+    status = sub.add_parser('status-latency', help='Latencia de /api/status con muchas sesiones')
+    status.add_argument('--sessions', type=int, default=100000)
+    status.add_argument('--requests', type=int, default=200)
+    status.set_defaults(func=bench_status_latency)
+
+    recovery = sub.add_parser('recovery', help='Recuperación de estado tras reinicio y reconciliación')
+    recovery.add_argument('--sessions', type=int, default=50000)
+    recovery.add_argument('--reconcile-sessions', type=int, default=40)
+    recovery.set_defaults(func=bench_recovery)
+
+    radius = sub.add_parser('radius', help='Autenticaciones RADIUS/seg: cliente nativo vs radtest')
+    radius.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100])
+    radius.add_argument('--logins', type=int, default=2000, help='Autenticaciones por nivel de concurrencia')
+    radius.add_argument('--latency', type=float, default=0.001, help='Latencia simulada del servidor RADIUS (s)')
+    radius.add_argument('--drop-every', type=int, default=10, help='Descartar una de cada N peticiones')
+    radius.set_defaults(func=bench_radius)
+
+    neighbors = sub.add_parser('neighbor-cache', help='Búsquedas IP -> MAC/seg con la caché ARP')
+    neighbors.add_argument('--entries', type=int, default=10000, help='Entradas en la tabla de vecinos')
+    neighbors.add_argument('--lookups', type=int, default=200000)
+    neighbors.add_argument('--concurrency', type=int, nargs='+', default=[1, 10])
+    neighbors.set_defaults(func=bench_neighbor_cache)
+
+    e2e = sub.add_parser('end-to-end', help='Mezcla login/logout/status contra portal + controlador')
+    e2e.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    e2e.add_argument('--operations', type=int, default=500, help='Operaciones por nivel de concurrencia')
+    e2e.add_argument('--clients', type=int, default=200, help='Dispositivos simulados')
+    e2e.add_argument('--mix', default='login=5,status=3,logout=2', help='Pesos de cada operación')
+    e2e.add_argument('--roles', default=','.join(f'{role}=1' for role in ROLES), help='Pesos de cada rol')
+    e2e.add_argument('--controller-mode', choices=['threaded', 'asyncio'], default='threaded')
+    e2e.add_argument('--provisioning', choices=['inline', 'queued'], default='inline')
+    e2e.add_argument('--floodlight-latency', type=float, default=0.002, help='Latencia simulada de Floodlight (s)')
+    e2e.add_argument('--radius-latency', type=float, default=0.001, help='Latencia simulada de RADIUS (s)')
+    e2e.add_argument('--seed', type=int, default=1)
+    e2e.add_argument('--baseline', help='Informe JSON anterior con el que comparar')
+    e2e.set_defaults(func=bench_end_to_end)
+
+    export = sub.add_parser('flow-export', help='Exportación de flujos en streaming (NDJSON/columnar)')
+    export.add_argument('--sessions', type=int, default=52000, help='Sesiones registradas (~19 flujos cada una)')
+    export.set_defaults(func=bench_flow_export)
+
+    reconcile = sub.add_parser('reconciler', help='Reconciliación diferencial periódica con Floodlight')
+    reconcile.add_argument('--sessions', type=int, default=300)
+    reconcile.add_argument('--drift', type=int, default=20, help='Sesiones con flujos borrados y usuarios huérfanos')
+    reconcile.add_argument('--max-changes', type=int, default=500, help='Altas + bajas máximas por switch y pasada')
+    reconcile.add_argument('--cycles', type=int, default=4)
+    reconcile.set_defaults(func=bench_reconciler)
+
+    aggregation = sub.add_parser('aggregation', help='Flujos en Floodlight por usuarios: por usuario vs por rol')
+    aggregation.add_argument('--users', type=int, nargs='+', default=[100, 500, 2000])
+    aggregation.add_argument('--strategies', nargs='+', default=['per_user', 'per_role'], choices=['per_user', 'per_role'])
+    aggregation.add_argument('--role', default=None, choices=ROLES, help='Un solo rol (por defecto, mezcla de roles)')
+    aggregation.add_argument('--concurrency', type=int, default=16)
+    aggregation.set_defaults(func=bench_aggregation)
+
+    placement = sub.add_parser('placement', help='Flujos por login: todos los switches vs camino por topología')
+    placement.add_argument('--users', type=int, default=1000)
+    placement.add_argument('--placements', nargs='+', default=['all', 'topology'], choices=['all', 'topology'])
+    placement.add_argument('--role', default='ROLE_GUEST', choices=ROLES)
+    placement.add_argument('--moves', type=int, default=100, help='Hosts que cambian de switch tras el login')
+    placement.add_argument('--concurrency', type=int, default=16)
+    placement.set_defaults(func=bench_placement)
+
+    churn = sub.add_parser('switch-churn', help='Desconexión y reconexión de un switch con sesiones activas')
+    churn.add_argument('--users', type=int, default=300, help='Logins antes y durante la caída')
+    churn.add_argument('--role', default='ROLE_PROFESOR', choices=ROLES)
+    churn.add_argument('--concurrency', type=int, default=16)
+    churn.add_argument('--timeout', type=float, default=30, help='Espera máxima a la reposición (s)')
+    churn.set_defaults(func=bench_switch_churn)
+
+    overhead = sub.add_parser('metrics-overhead', help='Coste de observar un histograma desde varios hilos')
+    overhead.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    overhead.add_argument('--observations', type=int, default=200000, help='Observaciones por hilo')
+    overhead.set_defaults(func=bench_metrics_overhead)
+
+    duplicates = sub.add_parser('duplicate-logins', help='Notificaciones de login duplicadas y simultáneas')
+    duplicates.add_argument('--duplicates', type=int, default=50, help='Copias simultáneas de la misma notificación')
+    duplicates.add_argument('--role', default='ROLE_GUEST', choices=ROLES)
+    duplicates.add_argument('--latency', type=float, default=0.005, help='Latencia simulada de Floodlight (s)')
+    duplicates.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'], choices=['threaded', 'asyncio'])
+    duplicates.set_defaults(func=bench_duplicate_logins)
+
+    provisioning = sub.add_parser('provisioning', help='Notificación de login inline vs cola de aprovisionamiento')
+    provisioning.add_argument('--latencies', type=float, nargs='+', default=[0.005, 0.05],
+                              help='Latencias simuladas de Floodlight (s)')
+    provisioning.add_argument('--logins', type=int, default=200)
+    provisioning.add_argument('--concurrency', type=int, default=20)
+    provisioning.add_argument('--role', default='ROLE_GUEST', choices=ROLES)
+    provisioning.add_argument('--controller-mode', choices=['threaded', 'asyncio'], default='threaded')
+    provisioning.add_argument('--provisioning', nargs='+', default=['inline', 'queued'], choices=['inline', 'queued'])
+    provisioning.set_defaults(func=bench_provisioning)
+
+    admission = sub.add_parser('admission', help='Login masivo: cola por prioridad de rol y límite de escrituras')
+    admission.add_argument('--logins', type=int, default=1500)
+    admission.add_argument('--concurrency', type=int, default=50)
+    admission.add_argument('--rate', type=int, default=1500, help='Escrituras/s permitidas en Floodlight')
+    admission.add_argument('--latency', type=float, default=0.002, help='Latencia simulada de Floodlight (s)')
+    admission.add_argument('--controller-mode', choices=['threaded', 'asyncio'], default='asyncio')
+    admission.add_argument('--seed', type=int, default=1)
+    admission.set_defaults(func=bench_admission)
+
+    workers = sub.add_parser('portal-workers', help='Throughput del portal con N workers y sesiones compartidas')
+    workers.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    workers.add_argument('--clients', type=int, default=400, help='Dispositivos que inician sesión')
+    workers.add_argument('--concurrency', type=int, default=32)
+    workers.add_argument('--status-rounds', type=int, default=5, help='Consultas /status por dispositivo')
+    workers.add_argument('--role', default='ROLE_GUEST', choices=ROLES)
+    workers.add_argument('--radius-latency', type=float, default=0.001, help='Latencia simulada de RADIUS (s)')
+    workers.set_defaults(func=bench_portal_workers)
+
+    probes = sub.add_parser('probes', help='Sondas de portal cautivo sin sesión: Flask vs camino rápido')
+    probes.add_argument('--requests', type=int, default=20000, help='GETs por escenario')
+    probes.add_argument('--concurrency', type=int, default=16)
+    probes.add_argument('--modes', nargs='+', default=['off', 'on'], choices=['off', 'on'])
+    probes.set_defaults(func=bench_probes)
+
+    templates = sub.add_parser('templates', help='Bytes por página y tiempo de render de las plantillas del portal')
+    templates.add_argument('--devices', type=int, default=200, help='Dispositivos distintos (IPs/usuarios)')
+    templates.add_argument('--renders', type=int, default=5000, help='Renders por hilo')
+    templates.add_argument('--threads', type=int, nargs='+', default=[1, 16])
+    templates.set_defaults(func=bench_templates)
+
+    brute = sub.add_parser('brute-force', help='Ráfaga de logins erróneos contra el limitador por IP y usuario')
+    brute.add_argument('--rate', type=int, default=10000, help='Intentos/s ofrecidos')
+    brute.add_argument('--duration', type=float, default=3.0, help='Segundos de ataque')
+    brute.add_argument('--ips', type=int, default=100, help='IPs atacantes')
+    brute.add_argument('--users', type=int, default=2000, help='Usuarios atacados')
+    brute.add_argument('--threads', type=int, default=8)
+    brute.add_argument('--radius-latency', type=float, default=0.001, help='Latencia simulada de RADIUS (s)')
+    brute.add_argument('--seed', type=int, default=1)
+    brute.add_argument('--session-backend', choices=('memory', 'sqlite'), default='memory',
+                       help='sqlite: limitador compartido entre workers')
+    brute.set_defaults(func=bench_brute_force)
+
+    args = parser.parse_args()
+    logging.getLogger(sdn_controller.__name__).setLevel(logging.WARNING)
+    report = args.func(args)
+    report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
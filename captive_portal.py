@@ -6,14 +6,28 @@ Autor: SDN_Grupo2
 Fecha: Julio 2025
 """
 
+import argparse
 import logging
+import os
+import signal
+import socket
 import time
-import subprocess
 import requests
 import json
-import re
-from flask import Flask, render_template, request, redirect, session, jsonify
+import threading
+from flask import Flask, Response, request, redirect, session, jsonify
 from functools import wraps
+from werkzeug.serving import make_server
+
+from portal_sessions import open_session_store
+from portal_fastpath import CaptiveFastPath, client_address
+from portal_assets import StaticAssets, PageRenderer
+from auth_cache import AuthCache
+from login_limiter import SharedSlidingWindowLimiter, SlidingWindowLimiter
+from radius_client import RadiusClient, RadiusTimeout
+from neighbor_cache import NeighborCache
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import Tracer, OTLPExporter, parse_report_params
 
 # Configuración de logging
 logging.basicConfig(
@@ -22,12 +36,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Métricas de las etapas de un login
+RADIUS_AUTH_SECONDS = REGISTRY.histogram(
+    'portal_radius_auth_seconds', 'Latencia de la autenticación RADIUS', ['result'])
+ARP_LOOKUP_SECONDS = REGISTRY.histogram(
+    'portal_arp_lookup_seconds', 'Latencia de la búsqueda IP -> MAC', ['result'],
+    buckets=(0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0))
+CONTROLLER_NOTIFY_SECONDS = REGISTRY.histogram(
+    'portal_controller_notify_seconds', 'Latencia de la notificación de login al controlador SDN', ['result'])
+LOGIN_SECONDS = REGISTRY.histogram(
+    'portal_login_seconds', 'Duración total de /authenticate', ['result'])
+LOGINS_TOTAL = REGISTRY.counter(
+    'portal_logins_total', 'Intentos de login por rol y resultado', ['role', 'result'])
+AUTH_CACHE_TOTAL = REGISTRY.counter(
+    'portal_auth_cache_total', 'Autenticaciones resueltas por la caché (hit, negative_hit) o por RADIUS (miss)', ['result'])
+
+# Trazas por login (/debug/traces)
+tracer = Tracer('captive-portal')
+
 class CaptivePortalController:
     def __init__(self):
         # Configuración RADIUS
         self.RADIUS_SERVER = "localhost"  # FreeRADIUS en el mismo servidor
         self.RADIUS_SECRET = "radius_secret_sdn"
         self.RADIUS_PORT = 1812
+        self.RADIUS_TIMEOUT = 3             # Segundos por intento
+        self.RADIUS_RETRIES = 2             # Reenvíos antes de dar la autenticación por fallida
         
         # Configuración del controlador SDN
         self.CONTROLLER_URL = "http://192.168.200.200:8081"  # IP del controlador
@@ -37,8 +71,31 @@ class CaptivePortalController:
         self.PORTAL_PORT = 5000
         self.SUCCESS_REDIRECT = "http://www.google.com"
         
-        # Almacenamiento de sesiones
-        self.authenticated_devices = {}
+        # Cliente RADIUS en proceso: un socket UDP compartido por todos los logins
+        self.radius_client = self.create_radius_client()
+        
+        # Caché de autenticaciones por (usuario, MAC) y de rechazos recientes
+        self.AUTH_CACHE_TTL = 300           # Segundos (nunca más que el Session-Timeout del usuario)
+        self.AUTH_NEGATIVE_TTL = 60         # Segundos que se recuerda un rechazo
+        self.AUTH_CACHE_SIZE = 10000
+        self.auth_cache = AuthCache(self.AUTH_CACHE_TTL, self.AUTH_NEGATIVE_TTL, self.AUTH_CACHE_SIZE)
+        self.auth_invalidation_seq = None   # Última invalidación de otros workers ya aplicada
+        self.ADMIN_ADDRESSES = {'127.0.0.1', '::1'}   # Orígenes (sin proxy) de las APIs de administración
+        self.TRUSTED_PROXIES = set()        # Proxies inversos cuyo X-Forwarded-For se acepta (--trusted-proxy)
+        
+        # Límite de intentos fallidos por IP y por usuario (SECURITY en config_portal_sdn.py)
+        self.MAX_LOGIN_ATTEMPTS = 3         # Intentos fallidos permitidos en la ventana
+        self.LOCKOUT_DURATION = 300         # Segundos de la ventana deslizante
+        self.login_limiter = SlidingWindowLimiter(self.MAX_LOGIN_ATTEMPTS, self.LOCKOUT_DURATION)
+        
+        # Tabla ARP en memoria: un login no lanza `arp` salvo que falte /proc/net/arp
+        self.neighbor_cache = NeighborCache(interval=2)
+        
+        # Almacenamiento de sesiones: en memoria (un worker) o compartido entre workers (--session-backend sqlite)
+        self.sessions = open_session_store('memory')
+        self.EXPIRY_CHECK_INTERVAL = 1      # Segundos entre revisiones de expiración
+        REGISTRY.gauge('portal_active_devices', 'Dispositivos autenticados',
+                       lambda: self.sessions.count())
         
         # Mapeo de roles a configuraciones
         self.ROLE_CONFIG = {
@@ -86,21 +143,42 @@ class CaptivePortalController:
             }
         }
     
+    def create_radius_client(self):
+        """Cliente RADIUS con la configuración actual del portal"""
+        return RadiusClient(
+            self.RADIUS_SERVER, self.RADIUS_PORT, self.RADIUS_SECRET,
+            timeout=self.RADIUS_TIMEOUT, retries=self.RADIUS_RETRIES,
+            nas_ip=self.PORTAL_IP
+        )
+    
+    def add_device(self, client_ip, session_data):
+        """Guardar la sesión de un dispositivo autenticado"""
+        self.sessions.add(client_ip, session_data)
+    
+    def get_device(self, client_ip):
+        """Sesión de un dispositivo autenticado, o None"""
+        return self.sessions.get(client_ip)
+    
+    def remove_device(self, client_ip):
+        """Quitar la sesión de un dispositivo; devuelve sus datos o None"""
+        return self.sessions.remove(client_ip)
+    
+    def expire_devices(self):
+        """Retirar solo las sesiones vencidas (con varios workers, cada una la retira uno solo)"""
+        expired = []
+        for client_ip, session_data in self.sessions.pop_expired():
+            logger.info(f"Session expired for user {session_data['username']}")
+            expired.append(client_ip)
+        return expired
+    
     def get_client_mac(self, client_ip):
         """Obtener MAC address del cliente por IP"""
         try:
-            result = subprocess.run(
-                ['arp', '-n', client_ip],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True, timeout=5
-            )
-            
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if client_ip in line:
-                        mac_match = re.search(r'([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}', line)
-                        if mac_match:
-                            return mac_match.group(0)
+            start = time.perf_counter()
+            mac_address = self.neighbor_cache.lookup(client_ip)
+            ARP_LOOKUP_SECONDS.observe(time.perf_counter() - start, 'found' if mac_address else 'not_found')
+            if mac_address:
+                return mac_address
             
             # Si no se encuentra, generar MAC basada en IP
             ip_parts = client_ip.split('.')
@@ -112,74 +190,86 @@ class CaptivePortalController:
     
     def radius_authenticate(self, username, password, client_ip, mac_address):
         """Autenticar usuario contra FreeRADIUS"""
+        start = time.perf_counter()
         try:
-            cmd = [
-                'radtest', username, password,
-                self.RADIUS_SERVER, str(self.RADIUS_PORT),
-                self.RADIUS_SECRET
-            ]
-            
-            result = subprocess.run(cmd,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True, timeout=10)
+            reply = self.radius_client.authenticate(
+                username, password,
+                calling_station_id=mac_address, framed_ip=client_ip
+            )
+            RADIUS_AUTH_SECONDS.observe(time.perf_counter() - start,
+                                        'accept' if reply['code'] == 'Access-Accept' else 'reject')
             
-            if result.returncode == 0 and "Access-Accept" in result.stdout:
-                # Parsear respuesta RADIUS
-                attributes = self.parse_radius_response(result.stdout)
+            if reply['code'] == 'Access-Accept':
+                attributes = reply['attributes']
+                role = attributes.get('role', 'ROLE_GUEST')
                 
                 return {
                     'authenticated': True,
-                    'role': attributes.get('role', 'ROLE_GUEST'),
+                    'role': role,
                     'vlan_id': attributes.get('vlan_id', '30'),
                     'session_timeout': attributes.get('session_timeout', 3600),
                     'filter_id': attributes.get('filter_id', 'default'),
-                    'attributes': attributes
+                    'attributes': attributes,
+                    'role_config': self.ROLE_CONFIG.get(role, {})
                 }
             else:
-                logger.warning(f"RADIUS authentication failed for {username}: {result.stdout}")
-                return {'authenticated': False, 'error': 'Invalid credentials'}
+                logger.warning(f"RADIUS authentication failed for {username}: {reply['code']}")
+                return {'authenticated': False, 'rejected': True, 'error': 'Invalid credentials'}
                 
-        except subprocess.TimeoutExpired:
+        except RadiusTimeout:
+            RADIUS_AUTH_SECONDS.observe(time.perf_counter() - start, 'timeout')
             logger.error("RADIUS authentication timeout")
             return {'authenticated': False, 'error': 'Authentication timeout'}
         except Exception as e:
+            RADIUS_AUTH_SECONDS.observe(time.perf_counter() - start, 'error')
             logger.error(f"RADIUS authentication error: {e}")
             return {'authenticated': False, 'error': str(e)}
     
-    def parse_radius_response(self, radius_output):
-        """Parsear respuesta de FreeRADIUS para extraer atributos"""
-        attributes = {}
+    def authenticate_credentials(self, username, password, client_ip, mac_address):
+        """Autenticar con la caché delante de RADIUS
+        Credenciales aceptadas hace poco para esta MAC: sin RADIUS; rechazadas hace poco: rechazo inmediato"""
+        result = self.auth_cache.lookup(username, mac_address, password)
+        if result is not None:
+            AUTH_CACHE_TOTAL.inc('hit')
+            return result
+        if self.auth_cache.is_rejected(username, mac_address, password):
+            AUTH_CACHE_TOTAL.inc('negative_hit')
+            logger.warning(f"Repeated rejected credentials for {username}, not forwarded to RADIUS")
+            return {'authenticated': False, 'rejected': True, 'cached': True, 'error': 'Invalid credentials'}
         
-        try:
-            # Extraer Class (rol) - formato hex
-            class_match = re.search(r'Class = (0x[0-9a-fA-F]+)', radius_output)
-            if class_match:
-                role_hex = class_match.group(1).replace('0x', '')
-                try:
-                    role = bytes.fromhex(role_hex).decode('utf-8')
-                    attributes['role'] = role
-                except:
-                    attributes['role'] = 'ROLE_GUEST'
-            
-            # Extraer VLAN ID
-            vlan_match = re.search(r'Tunnel-Private-Group-Id.*?= "?(\d+)"?', radius_output)
-            if vlan_match:
-                attributes['vlan_id'] = vlan_match.group(1)
-            
-            # Extraer Session-Timeout
-            timeout_match = re.search(r'Session-Timeout = (\d+)', radius_output)
-            if timeout_match:
-                attributes['session_timeout'] = int(timeout_match.group(1))
-            
-            # Extraer Filter-Id
-            filter_match = re.search(r'Filter-Id = "([^"]+)"', radius_output)
-            if filter_match:
-                attributes['filter_id'] = filter_match.group(1)
-                
-        except Exception as e:
-            logger.error(f"Error parsing RADIUS response: {e}")
+        AUTH_CACHE_TOTAL.inc('miss')
+        result = self.radius_authenticate(username, password, client_ip, mac_address)
+        if result['authenticated']:
+            self.auth_cache.store(username, mac_address, password, result)
+        elif result.get('rejected'):
+            self.auth_cache.reject(username, mac_address, password)
+        return result
+    
+    def authenticate_attempt(self, username, password, client_ip, mac_address):
+        """Intento de login con el limitador delante de la caché y de RADIUS
+        Solo cuentan los rechazos: un login correcto o un fallo de RADIUS devuelve el intento"""
+        keys = (('ip', client_ip), ('user', username))
+        bucket, retry_after = self.login_limiter.acquire(keys)
+        if bucket is None:
+            return {'authenticated': False, 'throttled': True, 'retry_after': int(retry_after) + 1,
+                    'error': 'Too many failed attempts'}
         
-        return attributes
+        result = self.authenticate_credentials(username, password, client_ip, mac_address)
+        if not result.get('rejected'):
+            self.login_limiter.release(keys, bucket)
+        return result
+    
+    def invalidate_auth_cache(self, username=None, mac_address=None):
+        """Invalidar la caché de autenticaciones en este worker y avisar a los demás"""
+        removed = self.auth_cache.invalidate(username, mac_address)
+        self.sessions.publish_invalidation(username, mac_address)
+        return removed
+    
+    def sync_auth_cache(self):
+        """Aplicar las invalidaciones publicadas por otros workers"""
+        self.auth_invalidation_seq, invalidations = self.sessions.invalidations_since(self.auth_invalidation_seq)
+        for username, mac_address in invalidations:
+            self.auth_cache.invalidate(username, mac_address)
     
     def notify_controller(self, user_data):
         """Notificar al controlador SDN sobre usuario autenticado"""
@@ -194,22 +284,37 @@ class CaptivePortalController:
                 'vlan_id': user_data['vlan_id'],
                 'session_timeout': user_data['session_timeout'],
                 'filter_id': user_data['filter_id'],
-                'role_config': self.ROLE_CONFIG.get(user_data['role'], {})
+                'role_config': user_data.get('role_config') or self.ROLE_CONFIG.get(user_data['role'], {}),
+                'trace_id': tracer.current_trace_id()
             }
             
             logger.info(f"Notifying controller for user {user_data['username']} with role {user_data['role']}")
             
-            response = requests.post(
-                f"{self.CONTROLLER_URL}/api/user_authenticated",
-                json=controller_data,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            start = time.perf_counter()
+            try:
+                response = requests.post(
+                    f"{self.CONTROLLER_URL}/api/user_authenticated",
+                    json=controller_data,
+                    timeout=10,
+                    headers={'Content-Type': 'application/json', **tracer.propagation_headers()}
+                )
+            except requests.exceptions.RequestException:
+                CONTROLLER_NOTIFY_SECONDS.observe(time.perf_counter() - start, 'unreachable')
+                raise
+            CONTROLLER_NOTIFY_SECONDS.observe(time.perf_counter() - start,
+                                              'success' if response.status_code in (200, 202) else 'error')
             
             if response.status_code == 200:
                 result = response.json()
                 logger.info(f"Controller responded: {result}")
                 return True
+            elif response.status_code == 202:
+                # Login encolado: los flujos se instalan en segundo plano (/status consulta el estado)
+                result = response.json()
+                user_data['provisioning_id'] = result['provisioning_id']
+                user_data['provisioning_state'] = result['state']
+                logger.info(f"Controller queued provisioning {result['provisioning_id']} for {user_data['username']}")
+                return True
             else:
                 logger.error(f"Controller error: {response.status_code} - {response.text}")
                 return False
@@ -223,6 +328,24 @@ class CaptivePortalController:
             logger.error(f"Unexpected error notifying controller: {e}")
             return True
     
+    def provisioning_state(self, user_data):
+        """Estado del aprovisionamiento de un login encolado en el controlador (None si no se encoló)"""
+        provisioning_id = user_data.get('provisioning_id')
+        if provisioning_id is None:
+            return None
+        
+        if user_data['provisioning_state'] in ('queued', 'provisioning'):
+            try:
+                response = requests.get(f"{self.CONTROLLER_URL}/api/provisioning/{provisioning_id}", timeout=2)
+                if response.status_code == 200:
+                    user_data['provisioning_state'] = response.json()['state']
+                    # Visible para los demás workers, sin resucitar la sesión si entretanto se cerró
+                    self.sessions.update_if_present(user_data['client_ip'],
+                                                    provisioning_state=user_data['provisioning_state'])
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.debug(f"Cannot read provisioning {provisioning_id}: {e}")  # Se mantiene el último estado
+        return user_data['provisioning_state']
+    
     def notify_controller_logout(self, user_data):
         """Notificar al controlador sobre logout de usuario"""
         try:
@@ -249,136 +372,187 @@ class CaptivePortalController:
             return True
 
 # Inicializar Flask app
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)   # static/ lo sirve static_asset() desde memoria
 app.secret_key = 'sdn_captive_portal_secret_key_2025'
 
+# CSS compartido con huella y precomprimido; plantillas compiladas al arrancar
+assets = StaticAssets(os.path.join(app.root_path, 'static'))
+app.jinja_env.globals['asset_url'] = assets.url
+pages = PageRenderer(app.jinja_env, ['login.html', 'success.html', 'logout.html'])
+
 # Instancia global del controlador
 portal = CaptivePortalController()
 
+def request_client_ip():
+    """IP del cliente: la de la conexión, o X-Forwarded-For si llega por un proxy de confianza"""
+    return client_address(request.environ, portal.TRUSTED_PROXIES)
+
 def is_authenticated():
     """Verificar si el cliente está autenticado"""
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-    return client_ip in portal.authenticated_devices and session.get('authenticated', False)
+    client_ip = request_client_ip()
+    return session.get('authenticated', False) and portal.get_device(client_ip) is not None
 
 @app.route('/')
 def index():
     """Página principal del portal cautivo"""
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    client_ip = request_client_ip()
     
     if is_authenticated():
         # Usuario ya autenticado, redirigir a internet
         return redirect(portal.SUCCESS_REDIRECT)
     
     # Mostrar página de login
-    return render_template('login.html', client_ip=client_ip)
+    return pages.render('login.html', client_ip=client_ip)
+
+def record_login(start, result, role=None):
+    """Anotar la duración y el resultado de un /authenticate"""
+    LOGIN_SECONDS.observe(time.perf_counter() - start, result)
+    LOGINS_TOTAL.inc(role or 'unknown', result)
 
 @app.route('/authenticate', methods=['POST'])
 def authenticate():
     """Procesar autenticación de usuario"""
+    start = time.perf_counter()
     username = request.form.get('username', '').strip()
     password = request.form.get('password', '').strip()
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    client_ip = request_client_ip()
     
     if not username or not password:
-        return render_template('login.html', 
+        record_login(start, 'invalid_request')
+        return pages.render('login.html', 
                              error="Usuario y contraseña son requeridos",
                              client_ip=client_ip)
     
-    # Obtener MAC address
-    mac_address = portal.get_client_mac(client_ip)
-    
-    # Autenticar contra RADIUS
-    auth_result = portal.radius_authenticate(username, password, client_ip, mac_address)
-    
-    if auth_result['authenticated']:
-        # Crear sesión de usuario
-        session_data = {
-            'username': username,
-            'client_ip': client_ip,
-            'mac_address': mac_address,
-            'role': auth_result['role'],
-            'vlan_id': auth_result['vlan_id'],
-            'authenticated_at': time.time(),
-            'expires_at': time.time() + auth_result['session_timeout'],
-            'session_timeout': auth_result['session_timeout'],
-            'filter_id': auth_result['filter_id'],
-            'attributes': auth_result['attributes']
-        }
+    # Una traza por login: etapas del portal y, con el mismo trace ID, del controlador
+    with tracer.trace('login', username=username, client_ip=client_ip):
+        # Obtener MAC address
+        with tracer.span('get_client_mac'):
+            mac_address = portal.get_client_mac(client_ip)
+    
+        # Autenticar contra RADIUS (o la caché de autenticaciones recientes) si no hay demasiados fallos
+        with tracer.span('radius_authenticate') as span:
+            auth_result = portal.authenticate_attempt(username, password, client_ip, mac_address)
+            span['authenticated'] = auth_result['authenticated']
+            span['cached'] = auth_result.get('cached', False)
+            span['throttled'] = auth_result.get('throttled', False)
         
-        # Notificar al controlador SDN
-        controller_success = portal.notify_controller(session_data)
+        if auth_result.get('throttled'):
+            logger.warning(f"Too many failed logins for {username} from {client_ip}, "
+                           f"retry in {auth_result['retry_after']}s")
+            record_login(start, 'throttled')
+            page = pages.render('login.html',
+                                error=f"Demasiados intentos fallidos, espera {auth_result['retry_after']} segundos",
+                                client_ip=client_ip)
+            return page, 429, {'Retry-After': str(auth_result['retry_after'])}
+    
+        if auth_result['authenticated']:
+            # Crear sesión de usuario
+            session_data = {
+                'username': username,
+                'client_ip': client_ip,
+                'mac_address': mac_address,
+                'role': auth_result['role'],
+                'vlan_id': auth_result['vlan_id'],
+                'authenticated_at': time.time(),
+                'expires_at': time.time() + auth_result['session_timeout'],
+                'session_timeout': auth_result['session_timeout'],
+                'filter_id': auth_result['filter_id'],
+                'attributes': auth_result['attributes'],
+                'role_config': auth_result['role_config']
+            }
         
-        if controller_success:
-            # Guardar sesión
-            portal.authenticated_devices[client_ip] = session_data
-            session['authenticated'] = True
-            session['username'] = username
-            session['role'] = auth_result['role']
+            # Notificar al controlador SDN
+            with tracer.span('notify_controller') as span:
+                controller_success = portal.notify_controller(session_data)
+                span['success'] = controller_success
+        
+            if controller_success:
+                # Guardar sesión
+                with tracer.span('add_device'):
+                    portal.add_device(client_ip, session_data)
+                session['authenticated'] = True
+                session['username'] = username
+                session['role'] = auth_result['role']
             
-            logger.info(f"User {username} authenticated successfully with role {auth_result['role']}")
+                logger.info(f"User {username} authenticated successfully with role {auth_result['role']}")
+                record_login(start, 'success', auth_result['role'])
             
-            # Mostrar página de éxito
-            return render_template('success.html',
-                                 username=username,
-                                 role=auth_result['role'],
-                                 vlan_id=auth_result['vlan_id'],
-                                 session_timeout=auth_result['session_timeout'],
-                                 client_ip=client_ip,
-                                 mac_address=mac_address)
+                # Mostrar página de éxito
+                return pages.render('success.html',
+                                     username=username,
+                                     role=auth_result['role'],
+                                     vlan_id=auth_result['vlan_id'],
+                                     session_timeout=auth_result['session_timeout'],
+                                     client_ip=client_ip,
+                                     mac_address=mac_address,
+                                     provisioning_state=session_data.get('provisioning_state'))
+            else:
+                logger.error(f"Failed to configure network access for {username}")
+                record_login(start, 'network_error', auth_result['role'])
+                return pages.render('login.html',
+                                     error="Error configurando acceso de red",
+                                     client_ip=client_ip)
         else:
-            logger.error(f"Failed to configure network access for {username}")
-            return render_template('login.html',
-                                 error="Error configurando acceso de red",
+            logger.warning(f"Failed authentication for {username} from {client_ip}")
+            record_login(start, 'rejected')
+            return pages.render('login.html',
+                                 error="Credenciales inválidas",
                                  client_ip=client_ip)
-    else:
-        logger.warning(f"Failed authentication for {username} from {client_ip}")
-        return render_template('login.html',
-                             error="Credenciales inválidas",
-                             client_ip=client_ip)
 
 @app.route('/logout')
 def logout():
     """Cerrar sesión de usuario"""
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    client_ip = request_client_ip()
     
-    if client_ip in portal.authenticated_devices:
-        user_data = portal.authenticated_devices[client_ip]
-        
+    # Retirar la sesión primero: si dos workers reciben el logout, solo uno notifica
+    user_data = portal.remove_device(client_ip)
+    if user_data is not None:
         # Notificar al controlador
         portal.notify_controller_logout(user_data)
         
         # Limpiar sesión
-        del portal.authenticated_devices[client_ip]
         session.clear()
         
         logger.info(f"User {user_data['username']} logged out")
     
-    return render_template('logout.html')
+    return pages.render('logout.html')
 
 @app.route('/status')
 def status():
     """API para verificar estado de autenticación"""
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    client_ip = request_client_ip()
     
-    if client_ip in portal.authenticated_devices:
-        user_data = portal.authenticated_devices[client_ip]
+    user_data = portal.get_device(client_ip)
+    if user_data is not None:
         current_time = time.time()
         
         # Verificar si la sesión ha expirado
         if current_time > user_data['expires_at']:
-            del portal.authenticated_devices[client_ip]
+            portal.remove_device(client_ip)
             session.clear()
             return jsonify({
                 'authenticated': False,
                 'message': 'Session expired'
             })
         
+        # Login encolado en el controlador: si la instalación falló, el acceso no está configurado
+        provisioning_state = portal.provisioning_state(user_data)
+        if provisioning_state == 'failed':
+            portal.remove_device(client_ip)
+            session.clear()
+            return jsonify({
+                'authenticated': False,
+                'provisioning_state': provisioning_state,
+                'message': 'Network provisioning failed'
+            })
+        
         return jsonify({
             'authenticated': True,
             'username': user_data['username'],
             'role': user_data['role'],
             'vlan_id': user_data['vlan_id'],
             'time_remaining': int(user_data['expires_at'] - current_time),
+            'provisioning_state': provisioning_state,
             'session_info': {
                 'authenticated_at': user_data['authenticated_at'],
                 'expires_at': user_data['expires_at']
@@ -394,30 +568,63 @@ def status():
 def api_stats():
     """API para obtener estadísticas del portal"""
     current_time = time.time()
-    active_users = 0
-    
-    # Contar usuarios activos (no expirados)
-    for client_ip, user_data in list(portal.authenticated_devices.items()):
-        if current_time <= user_data['expires_at']:
-            active_users += 1
-        else:
-            # Limpiar sesiones expiradas
-            del portal.authenticated_devices[client_ip]
     
+    # Las sesiones expiradas las retira periodic_cleanup, no hace falta recorrerlas
+    active_devices = portal.sessions.count()
+    devices_by_role = portal.sessions.count_by_role()
     return jsonify({
-        'active_users': active_users,
-        'total_devices': len(portal.authenticated_devices),
+        'active_users': active_devices,
+        'total_devices': active_devices,
         'portal_uptime': int(current_time - app.start_time) if hasattr(app, 'start_time') else 0,
         'roles_distribution': {
-            role: len([u for u in portal.authenticated_devices.values() if u['role'] == role])
+            role: devices_by_role.get(role, 0)
             for role in portal.ROLE_CONFIG.keys()
-        }
+        },
+        'auth_cache': portal.auth_cache.get_stats(),
+        'login_limiter': portal.login_limiter.get_stats(),
+        'worker_pid': os.getpid()
     })
 
+@app.route('/api/auth_cache/invalidate', methods=['POST'])
+def invalidate_auth_cache():
+    """Olvidar autenticaciones en caché (body JSON opcional: username, mac_address; vacío = todas)"""
+    if request.remote_addr not in portal.ADMIN_ADDRESSES:
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    mac_address = data.get('mac_address')
+    removed = portal.invalidate_auth_cache(username, mac_address)
+    logger.info(f"🧹 Auth cache invalidated (username={username}, mac={mac_address}): {removed} entries")
+    return jsonify({'invalidated': removed, 'username': username, 'mac_address': mac_address})
+
+@app.route('/debug/traces')
+def debug_traces():
+    """Logins recientes del portal, los más lentos primero (parámetros: limit, order, min_ms)"""
+    try:
+        params = parse_report_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(tracer.report(**params))
+
+@app.route('/metrics')
+def metrics():
+    """Métricas del portal en formato de texto de Prometheus"""
+    return Response(REGISTRY.render(prefix='portal_'), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/static/<path:filename>')
+def static_asset(filename):
+    """CSS y demás recursos de static/ (con huella: caché de un año)"""
+    asset = assets.response(filename, request.headers.get('Accept-Encoding', ''),
+                            request.headers.get('If-None-Match'))
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    status, headers, body = asset
+    return Response(body, status=status, headers=headers)
+
 @app.route('/<path:path>')
 def catch_all(path):
     """Capturar todo el tráfico HTTP y redirigir al portal"""
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    client_ip = request_client_ip()
     
     if is_authenticated():
         # Usuario autenticado, permitir acceso
@@ -427,18 +634,163 @@ def catch_all(path):
     # Usuario no autenticado, redirigir al portal
     return redirect('/')
 
+def install_fast_path():
+    """Responder sondas, redirecciones y login/logout sin sesión antes de Flask"""
+    app.wsgi_app = CaptiveFastPath(app.wsgi_app, app.url_map,
+                                   lambda client_ip: portal.get_device(client_ip) is not None,
+                                   pages.render, trusted_proxies=portal.TRUSTED_PROXIES)
+
+def periodic_cleanup():
+    """Tarea periódica: retirar sesiones expiradas y aplicar invalidaciones de la caché de autenticaciones"""
+    while True:
+        try:
+            portal.expire_devices()
+            portal.sync_auth_cache()
+        except Exception as e:
+            logger.error(f"Error in periodic cleanup: {e}")
+        time.sleep(portal.EXPIRY_CHECK_INTERVAL)
+
+def parse_args():
+    """Opciones de arranque del portal"""
+    parser = argparse.ArgumentParser(description='Portal Cautivo SDN')
+    parser.add_argument('--host', default=None, help='IP en la que escucha el portal')
+    parser.add_argument('--port', type=int, default=None, help='Puerto del portal')
+    parser.add_argument('--controller-url', default=None, help='URL de la API del controlador SDN')
+    parser.add_argument('--radius-server', default=None, help='Servidor RADIUS')
+    parser.add_argument('--radius-port', type=int, default=None, help='Puerto de autenticación RADIUS')
+    parser.add_argument('--radius-secret', default=None, help='Secreto compartido con el servidor RADIUS')
+    parser.add_argument('--otlp-endpoint', default=None,
+                        help='Colector OTLP/HTTP al que enviar las trazas (p. ej. http://localhost:4318)')
+    parser.add_argument('--session-backend', choices=['memory', 'sqlite'], default='memory',
+                        help='Dónde se guardan las sesiones (sqlite: compartidas entre workers)')
+    parser.add_argument('--session-db', default=None,
+                        help='Fichero SQLite de sesiones (por defecto /dev/shm/captive_portal_sessions.db)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Procesos worker pre-fork que atienden el mismo puerto (>1 requiere --session-backend sqlite)')
+    parser.add_argument('--trusted-proxy', action='append', default=[], metavar='IP',
+                        help='Proxy inverso cuyo X-Forwarded-For identifica al cliente (repetible; '
+                             'sin él se usa la IP de la conexión)')
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help='Atender todo el tráfico no autenticado con Flask (sin respuestas precalculadas)')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.workers > 1 and args.session_backend != 'sqlite':
+        parser.error('--workers > 1 requires --session-backend sqlite (sessions must be shared)')
+    return args
+
+def start_background_tasks(otlp_endpoint=None):
+    """Hilos de cada worker: limpieza de sesiones, tabla ARP y exportador de trazas"""
+    # Iniciar tarea de limpieza en background
+    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
+    cleanup_thread.start()
+    
+    # Cargar la tabla ARP y mantenerla fresca en background
+    portal.neighbor_cache.reload()
+    portal.neighbor_cache.start()
+    
+    if otlp_endpoint:
+        tracer.exporter = OTLPExporter(otlp_endpoint, tracer.service).start()
+
+def run_worker(listen_fd, otlp_endpoint=None):
+    """Worker pre-fork: servidor WSGI con hilos sobre el socket abierto por el proceso padre"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    start_background_tasks(otlp_endpoint)
+    server = make_server(portal.PORTAL_IP, portal.PORTAL_PORT, app, threaded=True, fd=listen_fd)
+    logger.info(f"👷 Portal worker {os.getpid()} ready")
+    server.serve_forever()
+
+def serve_prefork(workers, otlp_endpoint=None):
+    """Abrir el puerto una vez y repartirlo entre `workers` procesos hijos
+    El kernel reparte las conexiones entre los accept() de los workers; las sesiones
+    se comparten por el almacén SQLite. Métricas y trazas son de cada worker"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((portal.PORTAL_IP, portal.PORTAL_PORT))
+    listener.listen(1024)
+    portal.sessions.close()   # Cada worker abre su propia conexión
+    
+    children = set()
+    stopping = False
+    
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(listener.fileno(), otlp_endpoint)
+            finally:
+                os._exit(1)
+        children.add(pid)
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info(f"Started {workers} portal workers: {sorted(children)}")
+    
+    # Reponer los workers que mueran hasta recibir SIGTERM/SIGINT
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"⚠️ Portal worker {pid} exited ({status}), restarting it")
+            spawn()
+    listener.close()
+
 if __name__ == '__main__':
+    args = parse_args()
+    
+    portal.PORTAL_IP = args.host or portal.PORTAL_IP
+    portal.PORTAL_PORT = args.port or portal.PORTAL_PORT
+    portal.CONTROLLER_URL = args.controller_url or portal.CONTROLLER_URL
+    portal.RADIUS_SERVER = args.radius_server or portal.RADIUS_SERVER
+    portal.RADIUS_PORT = args.radius_port or portal.RADIUS_PORT
+    portal.RADIUS_SECRET = args.radius_secret or portal.RADIUS_SECRET
+    portal.radius_client = portal.create_radius_client()
+    portal.TRUSTED_PROXIES.update(args.trusted_proxy)
+    portal.sessions = open_session_store(args.session_backend, args.session_db)
+    if args.session_backend == 'sqlite':
+        # Con varios workers el límite de intentos debe ser del portal, no de cada proceso
+        portal.login_limiter = SharedSlidingWindowLimiter(portal.sessions, portal.MAX_LOGIN_ATTEMPTS,
+                                                          portal.LOCKOUT_DURATION)
+    if not args.no_fast_path:
+        install_fast_path()
+    
     app.start_time = time.time()
     
     logger.info("=== Portal Cautivo SDN ===")
     logger.info(f"RADIUS Server: {portal.RADIUS_SERVER}:{portal.RADIUS_PORT}")
     logger.info(f"Controller URL: {portal.CONTROLLER_URL}")
     logger.info(f"Portal URL: http://{portal.PORTAL_IP}:{portal.PORTAL_PORT}")
-    logger.info("Starting Captive Portal...")
-    
-    app.run(
-        host=portal.PORTAL_IP,
-        port=portal.PORTAL_PORT,
-        debug=False,
-        threaded=True
-    )
+    logger.info(f"Session backend: {args.session_backend}, workers: {args.workers}, "
+                f"fast path: {'off' if args.no_fast_path else 'on'}")
+    
+    if args.workers > 1:
+        logger.info("Starting Captive Portal (pre-fork)...")
+        serve_prefork(args.workers, args.otlp_endpoint)
+    else:
+        start_background_tasks(args.otlp_endpoint)
+        
+        logger.info("Starting Captive Portal...")
+        
+        app.run(
+            host=portal.PORTAL_IP,
+            port=portal.PORTAL_PORT,
+            debug=False,
+            threaded=True
+        )
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Comprobaciones de comportamiento del Portal Cautivo SDN
+A diferencia de benchmark_portal_sdn.py no mide rendimiento: cada comprobación
+monta un escenario contra Floodlight y FreeRADIUS simulados y falla (código de
+salida 1) si el controlador o el portal no se comportan como deben
+Uso: python3 check_portal_sdn.py                   # todas
+     python3 check_portal_sdn.py reconciler recovery
+Autor: SDN_Grupo2
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from sdn_controller import SDNController, KNOWN_SWITCHES
+from controller_state import SQLiteStateStore
+from login_limiter import SharedSlidingWindowLimiter, SlidingWindowLimiter
+from portal_sessions import SQLiteSessionStore
+from radius_client import RadiusClient, RadiusTimeout
+from portal_stubs import (FloodlightStub, RadiusStub, login_payload, radius_users, free_port,
+                          start_controller, run_http_load)
+
+CHECKS = {}   # nombre -> función, en el orden en que se ejecutan
+
+class CheckFailed(AssertionError):
+    """Una comprobación encontró un comportamiento distinto del esperado"""
+
+def check(name):
+    """Registrar una comprobación bajo `name`"""
+    def register(function):
+        CHECKS[name] = function
+        return function
+    return register
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+def floodlight_table(stub):
+    """(switch, nombre) de todos los flujos estáticos del Floodlight simulado"""
+    table = requests.get(f"{stub.url}/wm/staticflowpusher/list/all/json", timeout=5).json()
+    return {(switch_dpid, name) for switch_dpid, entries in table.items() for entry in entries for name in entry}
+
+def desired_table(controller):
+    """(switch, nombre) de los flujos que deben tener las sesiones activas"""
+    with controller.users_lock:
+        users = list(controller.active_users.items())
+    return {(flow['switch'], flow['name'])
+            for client_ip, user_data in users for flow in controller.desired_flows_for_user(client_ip, user_data)}
+
+@check('reconciler')
+def check_reconciler():
+    """Tras la deriva, una reconciliación deja Floodlight igual al estado deseado y la siguiente no cambia nada"""
+    stub = FloodlightStub(KNOWN_SWITCHES.keys(), latency=0).start()
+    controller = SDNController(floodlight_url=stub.url)
+    try:
+        for i in range(20):
+            controller.user_authenticated_handler(login_payload(i))
+            controller.register_user(login_payload(i))
+        expect(floodlight_table(stub) == desired_table(controller), 'logins did not install the desired flows')
+
+        # Flujos borrados por fuera del controlador y flujos de un usuario que ya no existe
+        missing = controller.desired_flows_for_user('x', login_payload(0))
+        controller.flow_pusher.remove([(flow['switch'], flow['name']) for flow in missing])
+        controller.flow_pusher.push(controller.desired_flows_for_user('x', login_payload(100)))
+
+        first = controller.reconcile_with_floodlight()
+        expect(first['reinstalled'] == len(missing), f"expected {len(missing)} reinstalled flows, got {first}")
+        expect(floodlight_table(stub) == desired_table(controller), 'reconciliation left drift behind')
+        for _ in range(3):
+            again = controller.reconcile_with_floodlight()
+            expect(again == {'missing': 0, 'reinstalled': 0, 'orphans': 0, 'removed': 0},
+                   f"reconciliation keeps changing a converged table: {again}")
+        expect(floodlight_table(stub) == desired_table(controller), 'repeated reconciliation moved flows')
+    finally:
+        controller.flow_pusher.close()
+        stub.stop()
+
+@check('recovery')
+def check_recovery():
+    """Un controlador reiniciado recupera del estado SQLite todas las sesiones y sus flujos"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix='sdn_state_'), 'controller_state.db')
+    store = SQLiteStateStore(db_path)
+    writer = SDNController(state_store=store)
+    expected_flows = 0
+    for i in range(200):
+        payload = login_payload(i)
+        flows = writer.desired_flows_for_user(payload['client_ip'], payload)
+        writer.flow_registry.add(payload['client_ip'], payload['mac_address'], flows)
+        writer.register_user(payload)
+        expected_flows += len(flows)
+    writer.unregister_user(login_payload(0)['client_ip'])
+    expected_flows -= len(writer.flow_registry.pop_client(login_payload(0)['client_ip']))
+    writer.flow_pusher.close()
+    store.close()
+
+    store = SQLiteStateStore(db_path)
+    restarted = SDNController(state_store=store)
+    try:
+        restore = restarted.restore_state()
+        expect(restore['restored'] == 199, f"expected 199 restored sessions, got {restore['restored']}")
+        expect(login_payload(0)['client_ip'] not in restarted.active_users, 'a logged-out session came back')
+        expect(restarted.flow_registry.count() == expected_flows,
+               f"expected {expected_flows} restored flows, got {restarted.flow_registry.count()}")
+    finally:
+        restarted.flow_pusher.close()
+        store.close()
+
+@check('switch-churn')
+def check_switch_churn():
+    """No se envían flujos a un switch caído y al volver recupera los de todas las sesiones"""
+    switches = list(KNOWN_SWITCHES.keys())
+    stub = FloodlightStub(switches, latency=0).start()
+    controller = SDNController(floodlight_url=stub.url)
+    try:
+        controller.health_monitor.probe()
+
+        def login(payload):
+            if controller.user_authenticated_handler(payload) > 0:
+                controller.register_user(payload)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(login, [login_payload(i) for i in range(20)]))
+        down = switches[-1]
+        requests.post(f"{stub.url}/stub/switches", json={'switches': switches[:-1]}, timeout=5)
+        controller.health_monitor.probe()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(login, [login_payload(i) for i in range(20, 40)]))
+        expect(stub.stats()['offline_posts'] == 0, 'flows were pushed to a disconnected switch')
+
+        requests.post(f"{stub.url}/stub/switches", json={'switches': switches}, timeout=5)
+        controller.health_monitor.probe()
+        expected = {key for key in desired_table(controller) if key[0] == down}
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and not expected <= floodlight_table(stub):
+            time.sleep(0.05)
+        expect(expected <= floodlight_table(stub), f"{down} did not get its flows back after rejoining")
+    finally:
+        controller.flow_pusher.close()
+        stub.stop()
+
+@check('radius-restart')
+def check_radius_restart():
+    """Un reinicio de FreeRADIUS no deja al cliente sin hilo receptor: tras volver el servidor los logins funcionan"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    users = radius_users(1)
+    client = RadiusClient('127.0.0.1', port, 'testing123', timeout=0.3, retries=1)
+    try:
+        for _ in range(2):   # Servidor caído y de nuevo en marcha, dos veces
+            try:
+                client.authenticate('user0', 'pass0')
+            except RadiusTimeout:
+                pass
+            else:
+                raise CheckFailed('got a reply while the RADIUS server was down')
+            server = RadiusStub('testing123', users, port=port).start()
+            try:
+                reply = client.authenticate('user0', 'pass0')
+                expect(reply['code'] == 'Access-Accept', f"expected Access-Accept after the restart, got {reply['code']}")
+            finally:
+                server.stop()
+    finally:
+        client.close()
+
+@check('duplicate-logins')
+def check_duplicate_logins():
+    """50 notificaciones simultáneas del mismo login instalan los flujos una sola vez
+    y repetir el login con el mismo rol no envía nada a Floodlight"""
+    stub = FloodlightStub(KNOWN_SWITCHES.keys(), latency=0.02).start()
+    try:
+        for mode in ('threaded', 'asyncio'):
+            port = free_port()
+            process = start_controller(mode, stub.url, port)
+            url = f"http://127.0.0.1:{port}/api/user_authenticated"
+            try:
+                before = stub.stats()['posts']
+                run_http_load(url, [login_payload(0, 'ROLE_GUEST')], 1)
+                single = stub.stats()['posts'] - before
+                expect(single > 0, f"{mode}: a single login pushed no flows")
+
+                payload = login_payload(1, 'ROLE_GUEST')
+                before = stub.stats()['posts']
+                _, errors, _ = run_http_load(url, [payload] * 50, 50)
+                burst = stub.stats()['posts'] - before
+                expect(errors == 0, f"{mode}: {errors} duplicate notifications failed")
+                expect(burst == single, f"{mode}: 50 duplicate logins pushed {burst} flows, a single login {single}")
+
+                before = stub.stats()['posts']
+                run_http_load(url, [payload], 1)
+                relogin = stub.stats()['posts'] - before
+                expect(relogin == 0, f"{mode}: a same-role re-login pushed {relogin} flows")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        stub.stop()
+
+@check('brute-force')
+def check_brute_force():
+    """Con credenciales erróneas RADIUS no recibe más de MAX_LOGIN_ATTEMPTS intentos por IP ni por
+    usuario, aunque el atacante cambie X-Forwarded-For en cada petición"""
+    import captive_portal   # Crea el portal al importarse: solo si se ejecuta esta comprobación
+    logging.getLogger(captive_portal.__name__).setLevel(logging.ERROR)
+
+    secret = 'testing123'
+    radius = RadiusStub(secret, radius_users(1)).start()
+    portal = captive_portal.portal
+    portal.RADIUS_SERVER = '127.0.0.1'
+    portal.RADIUS_PORT = radius.port
+    portal.RADIUS_SECRET = secret
+    portal.radius_client = portal.create_radius_client()
+
+    calls = []   # (IP con la que el portal llamó a RADIUS, usuario)
+    radius_authenticate = portal.radius_authenticate
+    def counted_radius_authenticate(username, password, client_ip, mac_address):
+        calls.append((client_ip, username))
+        return radius_authenticate(username, password, client_ip, mac_address)
+    portal.radius_authenticate = counted_radius_authenticate
+
+    client = captive_portal.app.test_client()
+    def attempt(remote_addr, forwarded, username, password):
+        client.post('/authenticate', data={'username': username, 'password': password},
+                    headers={'X-Forwarded-For': forwarded}, environ_base={'REMOTE_ADDR': remote_addr})
+
+    guess = 0   # Contraseñas distintas en todo el ataque: la caché de rechazos no interviene
+    try:
+        for backend in ('memory', 'sqlite'):
+            if backend == 'sqlite':
+                db_path = os.path.join(tempfile.mkdtemp(prefix='sdn_portal_'), 'sessions.db')
+                portal.sessions = SQLiteSessionStore(db_path)
+                portal.login_limiter = SharedSlidingWindowLimiter(portal.sessions, portal.MAX_LOGIN_ATTEMPTS,
+                                                                  portal.LOCKOUT_DURATION)
+            else:
+                portal.login_limiter = SlidingWindowLimiter(portal.MAX_LOGIN_ATTEMPTS, portal.LOCKOUT_DURATION)
+            del calls[:]
+
+            for source in range(5):
+                before = len(calls)
+                for i in range(30):
+                    guess += 1
+                    attempt(f'10.203.0.{source}', f'10.99.{source}.{i}', f'victim{guess % 4}', f'guess{guess}')
+                expect(len(calls) - before <= portal.MAX_LOGIN_ATTEMPTS,
+                       f"{backend}: 10.203.0.{source} reached RADIUS {len(calls) - before} times "
+                       f"rotating X-Forwarded-For (limit {portal.MAX_LOGIN_ATTEMPTS})")
+            per_user = {}
+            for _, username in calls:
+                per_user[username] = per_user.get(username, 0) + 1
+            expect(max(per_user.values()) <= portal.MAX_LOGIN_ATTEMPTS,
+                   f"{backend}: a username reached RADIUS {max(per_user.values())} times")
+
+        # Detrás de un proxy de confianza sí cuenta el cliente que indica X-Forwarded-For
+        portal.TRUSTED_PROXIES.add('127.0.0.1')
+        attempt('127.0.0.1', '10.204.0.1', 'user0', 'wrong')
+        expect(calls[-1] == ('10.204.0.1', 'user0'), f"trusted proxy client not honored: {calls[-1]}")
+    finally:
+        portal.TRUSTED_PROXIES.discard('127.0.0.1')
+        portal.radius_authenticate = radius_authenticate
+        portal.radius_client.close()
+        radius.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Comprobaciones de comportamiento del Portal Cautivo SDN')
+    parser.add_argument('checks', nargs='*', metavar='check',
+                        help=f"Comprobaciones a ejecutar (por defecto todas): {', '.join(CHECKS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    logging.getLogger().setLevel(logging.ERROR)   # Solo el resultado de cada comprobación
+
+    failed = []
+    for name in args.checks or list(CHECKS):
+        start = time.perf_counter()
+        try:
+            CHECKS[name]()
+        except CheckFailed as e:
+            failed.append(name)
+            print(f"❌ {name}: {e}")
+        except Exception:
+            failed.append(name)
+            print(f"❌ {name}: error inesperado")
+            traceback.print_exc()
+        else:
+            print(f"✅ {name} ({time.perf_counter() - start:.1f}s)")
+
+    if failed:
+        print(f"{len(failed)} comprobación(es) fallida(s): {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Persistencia del estado del Controlador SDN
+Guarda sesiones activas y sus flujos para recuperarlos tras un reinicio, y los
+logins pendientes de la cola de aprovisionamiento
+Backends: MemoryStateStore (sin persistencia) y SQLiteStateStore (SQLite en modo WAL)
+Autor: SDN_Grupo2
+"""
+
+import json
+import sqlite3
+import threading
+
+DEFAULT_STATE_PATH = '/var/lib/sdn_grupo2/controller_state.db'   # StateDirectory del servicio systemd
+
+class MemoryStateStore:
+    """Backend nulo: el estado vive solo en memoria del controlador"""
+
+    def save_session(self, client_ip, record, flows_by_switch):
+        pass
+
+    def delete_sessions(self, client_ips):
+        pass
+
+    def load_sessions(self):
+        return []
+
+    def save_job(self, job):
+        pass
+
+    def delete_jobs(self, job_ids):
+        pass
+
+    def load_jobs(self):
+        return []
+
+    def close(self):
+        pass
+
+class SQLiteStateStore(MemoryStateStore):
+    """Sesiones y flujos en SQLite (WAL): una fila por sesión
+    Los flujos se guardan agrupados por switch para que la recuperación sea un único SELECT"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Durable ante caída del proceso
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                client_ip TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                flows TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS provisioning_jobs (
+                id TEXT PRIMARY KEY,
+                job TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def save_session(self, client_ip, record, flows_by_switch):
+        """Guardar (o reemplazar) una sesión con sus flujos {switch: [nombres]}"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (client_ip, record, flows, expires_at) VALUES (?, ?, ?, ?)",
+                (client_ip, json.dumps(record), json.dumps(flows_by_switch), record['expires_at'])
+            )
+
+    def delete_sessions(self, client_ips):
+        with self.lock:
+            self.conn.executemany("DELETE FROM sessions WHERE client_ip = ?",
+                                  [(client_ip,) for client_ip in client_ips])
+
+    def load_sessions(self):
+        """Devolver (client_ip, record, {switch: [nombres]}) de todas las sesiones guardadas"""
+        with self.lock:
+            rows = self.conn.execute("SELECT client_ip, record, flows FROM sessions").fetchall()
+
+        return [(client_ip, json.loads(record), json.loads(flows)) for client_ip, record, flows in rows]
+
+    def save_job(self, job):
+        """Guardar un login aceptado y todavía sin aprovisionar"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO provisioning_jobs (id, job, created_at) VALUES (?, ?, ?)",
+                (job['id'], json.dumps(job), job['created_at'])
+            )
+
+    def delete_jobs(self, job_ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM provisioning_jobs WHERE id = ?",
+                                  [(job_id,) for job_id in job_ids])
+
+    def load_jobs(self):
+        """Logins pendientes en el orden en que se aceptaron"""
+        with self.lock:
+            rows = self.conn.execute("SELECT job FROM provisioning_jobs ORDER BY created_at").fetchall()
+        return [json.loads(job) for job, in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_state_store(backend, path=None):
+    """Crear el backend de estado indicado ('memory' o 'sqlite')"""
+    if backend == 'sqlite':
+        return SQLiteStateStore(path or DEFAULT_STATE_PATH)
+    if backend == 'memory':
+        return MemoryStateStore()
+    raise ValueError(f"Unknown state backend: {backend}")
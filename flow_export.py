@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Exportación de flujos del Controlador SDN
+Recorre el registro de flujos del controlador o las tablas de Floodlight
+y las emite como NDJSON o en formato columnar compacto, con filtros por
+switch, rol o MAC y paginación offset/limit. Todo son generadores: la
+memoria no crece con el número de flujos exportados
+Autor: SDN_Grupo2
+"""
+
+import itertools
+import json
+import re
+
+EXPORT_FIELDS = ('source', 'switch', 'name', 'client_ip', 'mac_address', 'role')
+DICTIONARY_FIELDS = ('source', 'switch', 'role')   # Pocos valores distintos: se codifican por índice
+EXPORT_SOURCES = ('registry', 'floodlight')
+MAC_SUFFIX = re.compile(r'_(?:[0-9a-fA-F]{12}|v\d{1,4})$')   # Sufijo por usuario (MAC) o por grupo (VLAN)
+encode_record = json.JSONEncoder(separators=(',', ':'), check_circular=False).encode
+
+def normalize_mac(mac_address):
+    return mac_address.lower().replace('-', ':') if mac_address else None
+
+class FlowExporter:
+    """Generadores de registros de flujo a partir del estado de un SDNController"""
+
+    def __init__(self, controller, floodlight_timeout=10):
+        self.controller = controller
+        self.floodlight_timeout = floodlight_timeout
+        self.role_by_prefix = {
+            template_name: role
+            for role, templates in controller.compiled_policies.items()
+            for template_name, _ in templates
+        }
+
+    def role_for_client(self, client_ip):
+        if client_ip and client_ip.startswith('group:'):
+            return client_ip.split(':')[1]   # Flujos compartidos de un rol
+        user_data = self.controller.active_users.get(client_ip)
+        return user_data['role'] if user_data else None
+
+    def role_for_flow_name(self, flow_name):
+        """Rol cuyo prefijo de plantilla generó este nombre de flujo"""
+        return self.role_by_prefix.get(MAC_SUFFIX.sub('', flow_name))
+
+    def registry_records(self, switch=None, role=None, mac=None):
+        """Flujos que el controlador tiene registrados como instalados"""
+        registry = self.controller.flow_registry
+        mac = normalize_mac(mac)
+
+        if mac:
+            client_ip = registry.client_for_mac(mac)
+            client_ips = [client_ip] if client_ip else []
+        else:
+            client_ips = registry.clients(switch)
+
+        for client_ip in client_ips:
+            client_role = self.role_for_client(client_ip)
+            if role and client_role != role:
+                continue
+            mac_address = registry.mac_for(client_ip)
+            for switch_dpid, flow_name in registry.flows_for(client_ip):
+                if switch and switch_dpid != switch:
+                    continue
+                yield {
+                    'source': 'registry',
+                    'switch': switch_dpid,
+                    'name': flow_name,
+                    'client_ip': client_ip,
+                    'mac_address': mac_address,
+                    'role': client_role
+                }
+
+    def floodlight_records(self, switch=None, role=None, mac=None):
+        """Flujos presentes en Floodlight, pedidos switch a switch
+        Solo la tabla de un switch está en memoria a la vez"""
+        controller = self.controller
+        mac = normalize_mac(mac)
+        switches = [switch] if switch else list(controller.SWITCHES.keys())
+
+        for switch_dpid in switches:
+            url = f"{controller.FLOODLIGHT_URL}/wm/staticflowpusher/list/{switch_dpid}/json"
+            response = controller.flow_pusher.session.get(url, timeout=self.floodlight_timeout)
+            response.raise_for_status()
+
+            for entry in response.json().get(switch_dpid, []):
+                for flow_name, flow in entry.items():
+                    flow_mac = normalize_mac(flow.get('eth_src') or flow.get('match', {}).get('eth_src'))
+                    if mac and flow_mac != mac:
+                        continue
+                    client_ip = controller.flow_registry.client_for_mac(flow_mac) if flow_mac else None
+                    flow_role = self.role_for_flow_name(flow_name) or self.role_for_client(client_ip)
+                    if role and flow_role != role:
+                        continue
+                    yield {
+                        'source': 'floodlight',
+                        'switch': switch_dpid,
+                        'name': flow_name,
+                        'client_ip': client_ip,
+                        'mac_address': flow_mac,
+                        'role': flow_role
+                    }
+
+    def records(self, source='registry', switch=None, role=None, mac=None, offset=0, limit=None):
+        """Registros del origen indicado, filtrados y paginados"""
+        if source == 'registry':
+            records = self.registry_records(switch, role, mac)
+        elif source == 'floodlight':
+            records = self.floodlight_records(switch, role, mac)
+        else:
+            raise ValueError(f"Unknown export source: {source}")
+        return paginate(records, offset, limit)
+
+def paginate(records, offset=0, limit=None):
+    """Saltar `offset` registros y devolver como mucho `limit`"""
+    stop = offset + limit if limit is not None else None
+    return itertools.islice(records, offset, stop)
+
+def to_ndjson(records):
+    """Un objeto JSON por línea"""
+    for record in records:
+        yield encode_record(record) + '\n'
+
+def to_columnar(records, chunk_size=1000):
+    """Bloques de `chunk_size` filas con una lista por columna
+    Las columnas de pocos valores distintos se envían como índices a un diccionario"""
+    yield json.dumps({'format': 'columnar', 'columns': EXPORT_FIELDS,
+                      'dictionary_columns': DICTIONARY_FIELDS}) + '\n'
+
+    dictionaries = {field: {} for field in DICTIONARY_FIELDS}
+    records = iter(records)
+    while True:
+        rows = list(itertools.islice(records, chunk_size))
+        if not rows:
+            return
+
+        block = {'rows': len(rows)}
+        new_values = {}
+        for field in EXPORT_FIELDS:
+            values = [row[field] for row in rows]
+            if field in dictionaries:
+                codes = dictionaries[field]
+                added = [value for value in dict.fromkeys(values) if value not in codes]
+                for value in added:
+                    codes[value] = len(codes)
+                if added:
+                    new_values[field] = added   # Ampliaciones del diccionario respecto a bloques anteriores
+                values = [codes[value] for value in values]
+            block[field] = values
+        if new_values:
+            block['dictionary'] = new_values
+        yield encode_record(block) + '\n'
+
+EXPORT_FORMATS = {
+    'ndjson': (to_ndjson, 'application/x-ndjson'),
+    'columnar': (to_columnar, 'application/x-ndjson')
+}
+
+def decode_columnar(lines):
+    """Reconstruir registros a partir de líneas del formato columnar"""
+    lines = iter(lines)
+    header = json.loads(next(lines))
+    columns = header['columns']
+    dictionaries = {field: [] for field in header['dictionary_columns']}
+
+    for line in lines:
+        block = json.loads(line)
+        for field, added in block.get('dictionary', {}).items():
+            dictionaries[field].extend(added)
+        decoded = [
+            [dictionaries[field][code] for code in block[field]] if field in dictionaries else block[field]
+            for field in columns
+        ]
+        for values in zip(*decoded):
+            yield dict(zip(columns, values))
+
+def chunked(lines, chunk_bytes=64 * 1024):
+    """Agrupar líneas en trozos de ~chunk_bytes para la respuesta HTTP"""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def parse_export_params(params):
+    """Validar los parámetros de /api/flows/export (query string)"""
+    source = params.get('source', 'registry')
+    export_format = params.get('format', 'ndjson')
+    if source not in EXPORT_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(EXPORT_SOURCES)}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    try:
+        offset = int(params.get('offset', 0))
+        limit = int(params['limit']) if params.get('limit') else None
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative")
+
+    return {
+        'source': source,
+        'format': export_format,
+        'switch': params.get('switch') or None,
+        'role': params.get('role') or None,
+        'mac': params.get('mac') or None,
+        'offset': offset,
+        'limit': limit
+    }
+
+def export_stream(controller, params):
+    """Trozos de bytes y content-type de una exportación ya validada"""
+    formatter, content_type = EXPORT_FORMATS[params['format']]
+    records = FlowExporter(controller).records(
+        params['source'], params['switch'], params['role'], params['mac'],
+        params['offset'], params['limit']
+    )
+    return chunked(formatter(records)), content_type
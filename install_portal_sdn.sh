@@ -47,7 +47,7 @@ install_python_dependencies() {
     python3 -m pip install --upgrade pip
     
     # Instalar dependencias del proyecto
-    pip3 install flask requests subprocess32 mysql-connector-python
+    pip3 install flask requests aiohttp subprocess32 mysql-connector-python brotli
     
     log_success "Dependencias de Python instaladas"
 }
@@ -185,7 +185,10 @@ After=network.target
 Type=simple
 User=root
 WorkingDirectory=/opt/sdn_grupo2
-ExecStart=/usr/bin/python3 /opt/sdn_grupo2/sdn_controller.py
+# Sesiones y flujos persistidos en /var/lib/sdn_grupo2 (systemd crea el directorio):
+# tras un reinicio el controlador los recupera y reconcilia con Floodlight
+StateDirectory=sdn_grupo2
+ExecStart=/usr/bin/python3 /opt/sdn_grupo2/sdn_controller.py --state-backend sqlite --state-db /var/lib/sdn_grupo2/controller_state.db
 Restart=always
 RestartSec=10
 
@@ -225,6 +228,16 @@ install_files() {
         exit 1
     fi
     
+    # Módulos de apoyo importados por el portal y el controlador
+    for module in session_expiry.py sdn_controller_async.py controller_state.py radius_client.py neighbor_cache.py flow_export.py topology_cache.py switch_inventory.py metrics.py tracing.py provisioning.py admission.py portal_sessions.py portal_fastpath.py portal_assets.py auth_cache.py login_limiter.py; do
+        if [[ -f "$module" ]]; then
+            cp $module $INSTALL_DIR/
+        else
+            log_error "No se encontró $module en el directorio actual"
+            exit 1
+        fi
+    done
+    
     # Copiar templates si existen
     if [[ -d "templates" ]]; then
         cp -r templates/* $INSTALL_DIR/templates/
@@ -232,6 +245,14 @@ install_files() {
         log_warning "No se encontró el directorio templates"
     fi
     
+    # Recursos estáticos del portal (CSS compartido)
+    if [[ -d "static" ]]; then
+        mkdir -p $INSTALL_DIR/static
+        cp -r static/* $INSTALL_DIR/static/
+    else
+        log_warning "No se encontró el directorio static"
+    fi
+    
     # Establecer permisos
     chown -R root:root $INSTALL_DIR
     chmod -R 755 $INSTALL_DIR
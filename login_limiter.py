@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Limitador de intentos de login del Portal Cautivo
+Ventana deslizante por cubos: cada clave (IP del cliente, usuario) guarda como
+mucho `buckets` contadores, así que comprobar y anotar un intento es O(1) y la
+memoria por clave es fija. El número de claves está acotado (LRU): un ataque
+con millones de usuarios distintos no hace crecer el proceso.
+SharedSlidingWindowLimiter guarda los mismos cubos en el almacén SQLite de
+sesiones, para que el límite sea del portal y no de cada worker pre-fork
+Autor: SDN_Grupo2
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+class SlidingWindowLimiter:
+    """Como mucho `limit` intentos por clave en los últimos `window` segundos
+    acquire() reserva el intento en todas las claves a la vez (o en ninguna),
+    antes de hablar con RADIUS; release() lo devuelve, del mismo cubo, si no debe contar"""
+
+    def __init__(self, limit, window, buckets=10, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.max_keys = max_keys
+        self.keys = OrderedDict()     # clave -> [total, deque([índice de cubo, intentos])]
+        self.lock = threading.Lock()
+        self.stats = {'allowed': 0, 'throttled': 0, 'released': 0, 'evicted': 0}
+
+    def counter(self, key, bucket):
+        """Contador de la clave sin los cubos que ya salieron de la ventana (llamar con el lock)"""
+        entry = self.keys.get(key)
+        if entry is None:
+            return None
+        slots = entry[1]
+        while slots and slots[0][0] <= bucket - self.buckets:
+            entry[0] -= slots.popleft()[1]
+        if not slots:
+            del self.keys[key]
+            return None
+        self.keys.move_to_end(key)
+        return entry
+
+    def retry_after(self, entry, now):
+        """Segundos hasta que el cubo más antiguo salga de la ventana"""
+        oldest = entry[1][0][0]
+        return max((oldest + self.buckets) * self.bucket_width - now, 0.001)
+
+    def acquire(self, keys, now=None):
+        """Anotar un intento para todas las claves
+        Devuelve (cubo, 0) si se permite, o (None, segundos que faltan para poder reintentar)"""
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_width)
+        with self.lock:
+            entries = []
+            for key in keys:
+                entry = self.counter(key, bucket)
+                if entry is not None and entry[0] >= self.limit:
+                    self.stats['throttled'] += 1
+                    return None, self.retry_after(entry, now)
+                entries.append((key, entry))
+
+            for key, entry in entries:
+                if entry is None:
+                    entry = self.keys[key] = [0, deque()]
+                slots = entry[1]
+                if slots and slots[-1][0] == bucket:
+                    slots[-1][1] += 1
+                else:
+                    slots.append([bucket, 1])
+                entry[0] += 1
+            self.stats['allowed'] += 1
+
+            while len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+                self.stats['evicted'] += 1
+        return bucket, 0
+
+    def release(self, keys, bucket):
+        """Devolver un intento reservado con acquire() en `bucket` (login correcto o fallo que no es del usuario)
+        Si el cubo ya salió de la ventana, o la clave se desalojó, no hay nada que devolver"""
+        with self.lock:
+            for key in keys:
+                entry = self.keys.get(key)
+                if entry is None:
+                    continue
+                slots = entry[1]
+                for slot in slots:   # Como mucho `buckets` cubos
+                    if slot[0] == bucket:
+                        slot[1] -= 1
+                        entry[0] -= 1
+                        if not slot[1]:
+                            slots.remove(slot)
+                        break
+                if not slots:
+                    del self.keys[key]
+            self.stats['released'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({'tracked_keys': len(self.keys), 'max_keys': self.max_keys,
+                          'limit': self.limit, 'window': self.window})
+        return stats
+
+class SharedSlidingWindowLimiter:
+    """Misma ventana por cubos que SlidingWindowLimiter, compartida por los
+    workers a través del SQLiteSessionStore (tabla login_attempts, una fila por
+    clave y cubo). Comprobar y anotar un intento es una sola transacción
+    BEGIN IMMEDIATE, así que dos workers no pueden colar el intento limit+1"""
+
+    def __init__(self, store, limit, window, buckets=10, max_rows=100000, prune_every=1000):
+        self.store = store
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.max_rows = max_rows
+        self.prune_every = prune_every      # Intentos anotados entre dos limpiezas como mucho
+        self.pruned_bucket = None
+        self.since_prune = 0
+        self.lock = threading.Lock()        # Solo para las estadísticas del proceso
+        self.stats = {'allowed': 0, 'throttled': 0, 'released': 0, 'evicted': 0}
+        with store.lock:
+            store.connection().execute("""
+                CREATE TABLE IF NOT EXISTS login_attempts (
+                    key TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (key, bucket)
+                )
+            """)
+            store.conn.execute("CREATE INDEX IF NOT EXISTS login_attempts_bucket ON login_attempts (bucket)")
+
+    @staticmethod
+    def key_text(key):
+        return ':'.join(str(part) for part in key)
+
+    def prune(self, conn, bucket):
+        """Borrar los cubos fuera de la ventana y, si aún sobran filas, las más antiguas"""
+        conn.execute("DELETE FROM login_attempts WHERE bucket <= ?", (bucket - self.buckets,))
+        excess = conn.execute("SELECT COUNT(*) FROM login_attempts").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute("DELETE FROM login_attempts WHERE rowid IN "
+                         "(SELECT rowid FROM login_attempts ORDER BY bucket LIMIT ?)", (excess,))
+            with self.lock:
+                self.stats['evicted'] += excess
+        self.pruned_bucket = bucket
+        self.since_prune = 0
+
+    def acquire(self, keys, now=None):
+        """Anotar un intento para todas las claves
+        Devuelve (cubo, 0) si se permite, o (None, segundos que faltan para poder reintentar)"""
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_width)
+        texts = [self.key_text(key) for key in keys]
+        with self.store.lock, self.store.transaction() as conn:
+            for text in texts:
+                total, oldest = conn.execute(
+                    "SELECT COALESCE(SUM(count), 0), MIN(bucket) FROM login_attempts WHERE key = ? AND bucket > ?",
+                    (text, bucket - self.buckets)).fetchone()
+                if total >= self.limit:
+                    with self.lock:
+                        self.stats['throttled'] += 1
+                    return None, max((oldest + self.buckets) * self.bucket_width - now, 0.001)
+
+            # INSERT OR IGNORE + UPDATE en vez de UPSERT, que necesita SQLite >= 3.24
+            rows = [(text, bucket) for text in texts]
+            conn.executemany("INSERT OR IGNORE INTO login_attempts (key, bucket, count) VALUES (?, ?, 0)", rows)
+            conn.executemany("UPDATE login_attempts SET count = count + 1 WHERE key = ? AND bucket = ?", rows)
+            self.since_prune += 1
+            if self.pruned_bucket != bucket or self.since_prune >= self.prune_every:
+                self.prune(conn, bucket)
+        with self.lock:
+            self.stats['allowed'] += 1
+        return bucket, 0
+
+    def release(self, keys, bucket):
+        """Devolver un intento reservado con acquire() en `bucket`, si esa fila sigue existiendo"""
+        texts = [self.key_text(key) for key in keys]
+        with self.store.lock, self.store.transaction() as conn:
+            conn.executemany("UPDATE login_attempts SET count = count - 1 WHERE key = ? AND bucket = ? AND count > 0",
+                             [(text, bucket) for text in texts])
+            conn.executemany("DELETE FROM login_attempts WHERE key = ? AND bucket = ? AND count = 0",
+                             [(text, bucket) for text in texts])
+        with self.lock:
+            self.stats['released'] += 1
+
+    def get_stats(self):
+        with self.store.lock:
+            tracked = self.store.connection().execute(
+                "SELECT COUNT(DISTINCT key) FROM login_attempts").fetchone()[0]
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update({'tracked_keys': tracked, 'max_rows': self.max_rows,
+                      'limit': self.limit, 'window': self.window, 'shared': True})
+        return stats
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Métricas estilo Prometheus para el portal y el controlador
+Contadores e histogramas sin lock en el camino caliente: cada hilo acumula en
+su propio fragmento y /metrics suma los fragmentos al exportar en formato de
+texto (version 0.0.4). Los fragmentos de hilos terminados se pliegan en un
+acumulado para que los servidores con un hilo por petición no los acumulen
+Autor: SDN_Grupo2
+"""
+
+import bisect
+import threading
+import weakref
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SHARDS = 1024   # Fragmentos antes de plegar los de hilos terminados sin esperar a un scrape
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class ShardedMetric:
+    """Base: un diccionario {etiquetas: valor} por hilo"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.local = threading.local()
+        self.shards = {}           # id(fragmento) -> (hilo dueño, fragmento)
+        self.retired = {}          # Acumulado de hilos terminados
+        self.fold_lock = threading.Lock()   # Solo al crear fragmentos y al exportar
+
+    def shard(self):
+        """Fragmento del hilo actual (se crea en su primera observación)"""
+        values = getattr(self.local, 'values', None)
+        if values is None:
+            values = self.local.values = {}
+            self.shards[id(values)] = (weakref.ref(threading.current_thread()), values)
+            if len(self.shards) > MAX_SHARDS:
+                self.fold()
+        return values
+
+    def merge_into(self, target, values):
+        raise NotImplementedError
+
+    def fold(self):
+        """Plegar en `retired` los fragmentos de hilos que ya terminaron"""
+        with self.fold_lock:
+            for key, (thread_ref, values) in list(self.shards.items()):
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    self.merge_into(self.retired, values)
+                    del self.shards[key]
+
+    def collect(self):
+        """Suma de todos los fragmentos: {etiquetas: valor}"""
+        self.fold()
+        with self.fold_lock:
+            total = {}
+            self.merge_into(total, self.retired)
+            for _, values in list(self.shards.values()):
+                self.merge_into(total, dict(values))
+        return total
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.extend(self.render_sample(labels, value))
+        return lines
+
+class Counter(ShardedMetric):
+    """Contador monótono"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        values = self.shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def merge_into(self, target, values):
+        for labels, value in values.items():
+            target[labels] = target.get(labels, 0) + value
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"]
+
+class Histogram(ShardedMetric):
+    """Histograma con cubos fijos; cada fragmento guarda [cuentas por cubo..., suma]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self.shard()
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * (len(self.buckets) + 2)   # + cubo +Inf + suma
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def merge_into(self, target, values):
+        for labels, counts in values.items():
+            merged = target.get(labels)
+            if merged is None:
+                target[labels] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    merged[i] += count
+
+    def render_sample(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(float(counts[-1]))}")
+        lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Gauge:
+    """Valor leído de una función en cada scrape (usuarios activos, flujos...)
+    Con etiquetas, `read` devuelve {valor de la etiqueta o tupla de valores: valor}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        if not self.labelnames:
+            lines.append(f"{self.name} {format_value(self.read())}")
+            return lines
+        for labels, value in sorted(self.read().items()):
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    """Conjunto de métricas de un proceso; definir dos veces un nombre devuelve la existente"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, read, labelnames=()):
+        """Las gauges sí se sustituyen: apuntan a la instancia viva más reciente"""
+        gauge = Gauge(name, help_text, read, labelnames)
+        with self.lock:
+            self.metrics[name] = gauge
+        return gauge
+
+    def render(self, prefix=None):
+        """Texto de exposición de todas las métricas (o solo las que empiezan por `prefix`)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            if prefix is None or metric.name.startswith(prefix):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
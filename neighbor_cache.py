@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Caché de la tabla de vecinos (ARP) para el Portal Cautivo
+Carga /proc/net/arp completa en un diccionario IP -> MAC y la refresca en
+segundo plano; solo ante un fallo se vuelve a consultar el sistema
+Autor: SDN_Grupo2
+"""
+
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAC_PATTERN = re.compile(r'([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}')
+INCOMPLETE_MAC = '00:00:00:00:00:00'
+ATF_COM = 0x2   # Flag de entrada completa en /proc/net/arp
+
+def parse_proc_arp(content):
+    """Convertir el contenido de /proc/net/arp en {ip: mac}"""
+    table = {}
+    for line in content.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        ip, flags, mac = fields[0], fields[2], fields[3]
+        if mac == INCOMPLETE_MAC or not int(flags, 16) & ATF_COM:
+            continue
+        table[ip] = mac.lower()
+    return table
+
+class NeighborCache:
+    """Tabla IP -> MAC compartida por todos los logins
+    Las lecturas no toman lock: cada recarga sustituye el diccionario completo"""
+
+    def __init__(self, arp_path='/proc/net/arp', interval=2, miss_reload_interval=0.2):
+        self.arp_path = arp_path
+        self.interval = interval                        # Segundos entre recargas en segundo plano
+        self.miss_reload_interval = miss_reload_interval  # Recarga mínima entre fallos consecutivos
+        self.table = {}
+        self.loaded_at = 0.0
+        self.reload_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def reload(self):
+        """Volver a leer la tabla de vecinos; devuelve el número de entradas"""
+        with self.reload_lock:
+            try:
+                with open(self.arp_path) as arp_file:
+                    table = parse_proc_arp(arp_file.read())
+            except OSError as e:
+                logger.debug(f"Cannot read {self.arp_path}: {e}")
+                return len(self.table)
+
+            self.table = table
+            self.loaded_at = time.monotonic()
+            return len(table)
+
+    def lookup_system(self, client_ip):
+        """Consulta individual con `arp -n` cuando no hay /proc/net/arp"""
+        try:
+            result = subprocess.run(
+                ['arp', '-n', client_ip],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=5
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Error running arp for {client_ip}: {e}")
+            return None
+
+        if result.returncode == 0:
+            for line in result.stdout.split('\n'):
+                if client_ip in line:
+                    mac_match = MAC_PATTERN.search(line)
+                    if mac_match:
+                        return mac_match.group(0).lower()
+        return None
+
+    def lookup(self, client_ip):
+        """MAC de una IP, o None si el sistema tampoco la conoce"""
+        mac = self.table.get(client_ip)
+        if mac is not None:
+            self.hits += 1
+            return mac
+
+        self.misses += 1
+        if not os.path.exists(self.arp_path):
+            return self.lookup_system(client_ip)
+
+        # El cliente acaba de aparecer: una recarga (limitada) antes de darlo por desconocido
+        if time.monotonic() - self.loaded_at >= self.miss_reload_interval:
+            self.reload()
+        return self.table.get(client_ip)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.reload()
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """Iniciar la recarga periódica en un hilo daemon"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        return {'entries': len(self.table), 'hits': self.hits, 'misses': self.misses}
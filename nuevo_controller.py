@@ -7,6 +7,8 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import threading
 
+from switch_inventory import SwitchInventory
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -18,7 +20,7 @@ FLOODLIGHT_URL = "http://192.168.200.200:8080"
 CONTROLLER_IP = "192.168.201.200"
 CONTROLLER_PORT = 8081
 
-SWITCHES = [
+KNOWN_SWITCHES = [
     "00:00:72:e0:80:7e:85:4c",
     "00:00:f2:20:f9:45:4c:4e",
     "00:00:1a:74:72:3f:ef:44",
@@ -26,6 +28,9 @@ SWITCHES = [
     "00:00:5e:c7:6e:c6:11:4c"
 ]
 
+# Switches conectados a Floodlight (los conocidos hasta la primera lectura)
+switch_inventory = SwitchInventory(FLOODLIGHT_URL, seed={dpid: {} for dpid in KNOWN_SWITCHES})
+
 def generate_unique_cookie(flow_name, switch):
     """Generar cookie única basada en el hash del nombre del flujo + switch"""
     # Combinar nombre del flujo + switch para garantizar unicidad por switch
@@ -184,7 +189,7 @@ def user_authenticated():
 
     # Generar flujos según rol usando la nueva función
     flows = []
-    for switch in SWITCHES:
+    for switch in list(switch_inventory.live):
         role_flows = generate_flows_for_role(role, mac_address, switch)
         flows.extend(role_flows)
 
@@ -257,4 +262,5 @@ def health():
 
 if __name__ == '__main__':
     logger.info("=== Nuevo Controlador SDN para Portal Cautivo ===")
+    switch_inventory.start()
     app.run(host=CONTROLLER_IP, port=CONTROLLER_PORT, debug=False, threaded=False)
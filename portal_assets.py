@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Plantillas y recursos estáticos del Portal Cautivo
+Los recursos de static/ se cargan una vez al arrancar, con una huella del
+contenido en la URL (caché de un año en el navegador) y versiones gzip/brotli
+precalculadas. Las plantillas se compilan al arrancar y las páginas ya
+renderizadas se guardan en una LRU por parámetros
+Autor: SDN_Grupo2
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None   # Sin brotli se sirven gzip e identidad
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+class StaticAsset:
+    """Un fichero de static/ en memoria con sus codificaciones precalculadas"""
+
+    def __init__(self, name, body):
+        self.name = name
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted = f"{stem}.{self.digest}{ext}"
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.etag = f'W/"{self.digest}"'
+        self.encodings = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+
+    def encode(self, accept_encoding):
+        """(codificación, cuerpo) más pequeño de los que acepta el cliente"""
+        accepted = [encoding for encoding in ('br', 'gzip') if encoding in accept_encoding and encoding in self.encodings]
+        encoding = min(accepted, key=lambda name: len(self.encodings[name]), default='identity')
+        return encoding, self.encodings[encoding]
+
+class StaticAssets:
+    """Recursos de un directorio servidos como /static/<nombre>.<huella>.<ext>
+    El nombre sin huella también se sirve, pero el navegador debe revalidarlo"""
+
+    def __init__(self, directory, url_prefix='/static/'):
+        self.url_prefix = url_prefix
+        self.by_name = {}
+        self.by_fingerprint = {}
+        if os.path.isdir(directory):
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, directory).replace(os.sep, '/')
+                    with open(path, 'rb') as asset_file:
+                        asset = StaticAsset(name, asset_file.read())
+                    self.by_name[name] = asset
+                    self.by_fingerprint[asset.fingerprinted] = asset
+
+    def url(self, name):
+        """URL con huella de un recurso (para las plantillas)"""
+        asset = self.by_name.get(name)
+        return self.url_prefix + (asset.fingerprinted if asset is not None else name)
+
+    def response(self, filename, accept_encoding='', if_none_match=None):
+        """(estado, cabeceras, cuerpo) para /static/<filename>, o None si no existe"""
+        asset = self.by_fingerprint.get(filename)
+        cache_control = IMMUTABLE
+        if asset is None:
+            asset = self.by_name.get(filename)
+            cache_control = 'no-cache'
+            if asset is None:
+                return None
+
+        headers = [('ETag', asset.etag), ('Cache-Control', cache_control), ('Vary', 'Accept-Encoding')]
+        if if_none_match == asset.etag:
+            return 304, headers, b''
+        encoding, body = asset.encode(accept_encoding or '')
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Type', asset.content_type))
+        return 200, headers, body
+
+class PageRenderer:
+    """Plantillas compiladas una sola vez y páginas renderizadas en caché
+    Una página se identifica por su plantilla y sus parámetros: logout.html se
+    renderiza una vez, login.html una vez por IP/error, success.html por login"""
+
+    def __init__(self, jinja_env, templates, cache_size=1024):
+        self.templates = {name: jinja_env.get_template(name) for name in templates}
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def render(self, name, **context):
+        key = (name, tuple(sorted(context.items())))
+        with self.lock:
+            page = self.cache.get(key)
+            if page is not None:
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return page
+            self.stats['misses'] += 1
+
+        page = self.templates[name].render(context)
+        with self.lock:
+            self.cache[key] = page
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return page
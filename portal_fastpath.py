@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Camino rápido del Portal Cautivo para el tráfico no autenticado
+Las sondas de detección de portal cautivo de los sistemas operativos y cualquier
+URL redirigida por los switches llegan sin sesión; este middleware WSGI les
+responde antes de Flask (sin decodificar la cookie ni renderizar Jinja) con
+redirecciones precalculadas y páginas de login/logout pre-renderizadas,
+comprimidas con gzip y con ETag. Los clientes con sesión siguen por Flask
+Autor: SDN_Grupo2
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from markupsafe import escape
+
+from metrics import REGISTRY
+
+FASTPATH_RESPONSES_TOTAL = REGISTRY.counter(
+    'portal_fastpath_responses_total', 'Respuestas servidas por el camino rápido sin pasar por Flask', ['kind'])
+
+# URLs de detección de portal cautivo (Android, Apple, Windows, Firefox, Kindle...)
+PROBE_PATHS = frozenset((
+    '/generate_204', '/gen_204', '/hotspot-detect.html', '/library/test/success.html',
+    '/connecttest.txt', '/ncsi.txt', '/redirect', '/canonical.html', '/success.txt',
+    '/kindle-wifi/wifistub.html', '/check_network_status.txt'
+))
+
+CLIENT_IP_PLACEHOLDER = '__FASTPATH_CLIENT_IP__'
+HTML_TYPE = 'text/html; charset=utf-8'
+
+def client_address(environ, trusted_proxies=()):
+    """IP del cliente de una petición WSGI
+    Cualquier cliente puede escribir X-Forwarded-For: solo se acepta cuando la conexión
+    viene de un proxy de confianza, y de él el último salto (el que añadió ese proxy)"""
+    remote_addr = environ.get('REMOTE_ADDR')
+    forwarded = environ.get('HTTP_X_FORWARDED_FOR')
+    if forwarded and remote_addr in trusted_proxies:
+        return forwarded.rsplit(',', 1)[-1].strip()
+    return remote_addr
+
+class StaticPage:
+    """Página HTML pre-renderizada: cuerpo, versión gzip y ETag calculados una vez
+    El ETag es débil: identifica el contenido, con o sin gzip"""
+
+    def __init__(self, body, etag_seed=''):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etag = 'W/"' + hashlib.sha1(etag_seed.encode() + body).hexdigest()[:20] + '"'
+
+class CaptiveFastPath:
+    """Middleware WSGI delante de la app Flask del portal
+    `has_session(client_ip)` consulta el almacén de sesiones; `render(plantilla, **contexto)`
+    renderiza una plantilla una sola vez al construir el middleware; `trusted_proxies`,
+    orígenes cuyo X-Forwarded-For identifica al cliente"""
+
+    def __init__(self, wsgi_app, url_map, has_session, render, redirect_to='/', max_login_pages=4096,
+                 trusted_proxies=()):
+        self.wsgi_app = wsgi_app
+        self.has_session = has_session
+        self.trusted_proxies = trusted_proxies
+        self.redirect = self.redirect_response(redirect_to)
+        self.logout_page = StaticPage(render('logout.html').encode())
+
+        # login.html solo cambia en la IP del cliente: prefijo y sufijo fijos
+        login = render('login.html', client_ip=CLIENT_IP_PLACEHOLDER)
+        if login.count(CLIENT_IP_PLACEHOLDER) != 1:
+            raise ValueError('login.html must show client_ip exactly once for the fast path')
+        prefix, suffix = login.split(CLIENT_IP_PLACEHOLDER)
+        self.login_prefix = prefix.encode()
+        self.login_suffix = suffix.encode()
+        self.login_seed = hashlib.sha1(self.login_prefix + self.login_suffix).hexdigest()
+        self.login_pages = OrderedDict()    # client_ip -> StaticPage (LRU: cada móvil repite sus sondas)
+        self.max_login_pages = max_login_pages
+        self.lock = threading.Lock()
+
+        # Rutas propias de Flask (todo lo demás acabaría en catch_all)
+        self.flask_paths = set()
+        prefixes = []
+        for rule in url_map.iter_rules():
+            if rule.endpoint == 'catch_all':
+                continue
+            if rule.arguments:
+                prefixes.append(rule.rule.split('<', 1)[0])
+            else:
+                self.flask_paths.add(rule.rule)
+        self.flask_paths -= {'/', '/logout'}
+        self.flask_prefixes = tuple(prefixes)
+
+    @staticmethod
+    def redirect_response(location):
+        """Mismo 302 que flask.redirect(), calculado una vez"""
+        body = (
+            '<!doctype html>\n<html lang=en>\n<title>Redirecting...</title>\n<h1>Redirecting...</h1>\n'
+            f'<p>You should be redirected automatically to the target URL: <a href="{escape(location)}">'
+            f'{escape(location)}</a>. If not, click the link.\n'
+        ).encode()
+        headers = [('Content-Type', HTML_TYPE), ('Content-Length', str(len(body))),
+                   ('Location', location), ('Cache-Control', 'no-store')]
+        return headers, body
+
+    def login_page(self, client_ip):
+        with self.lock:
+            page = self.login_pages.get(client_ip)
+            if page is not None:
+                self.login_pages.move_to_end(client_ip)
+                return page
+        body = self.login_prefix + str(escape(client_ip)).encode() + self.login_suffix
+        page = StaticPage(body, self.login_seed)
+        with self.lock:
+            self.login_pages[client_ip] = page
+            if len(self.login_pages) > self.max_login_pages:
+                self.login_pages.popitem(last=False)
+        return page
+
+    def send_page(self, environ, start_response, page):
+        """200 con gzip si el cliente lo acepta, o 304 si ya tiene esta versión"""
+        headers = [('ETag', page.etag), ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+        if environ.get('HTTP_IF_NONE_MATCH') == page.etag:
+            start_response('304 Not Modified', headers)
+            return [b'']
+        body = page.body
+        if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+            body = page.gzipped
+            headers.append(('Content-Encoding', 'gzip'))
+        headers += [('Content-Type', HTML_TYPE), ('Content-Length', str(len(body)))]
+        start_response('200 OK', headers)
+        return [body if environ['REQUEST_METHOD'] == 'GET' else b'']
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '/')
+        if (environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or path in self.flask_paths
+                or path.startswith(self.flask_prefixes)):
+            return self.wsgi_app(environ, start_response)
+
+        client_ip = client_address(environ, self.trusted_proxies)
+        if self.has_session(client_ip):
+            return self.wsgi_app(environ, start_response)   # Redirección a internet, logout real...
+
+        if path == '/':
+            FASTPATH_RESPONSES_TOTAL.inc('login')
+            return self.send_page(environ, start_response, self.login_page(client_ip))
+        if path == '/logout':
+            FASTPATH_RESPONSES_TOTAL.inc('logout')
+            return self.send_page(environ, start_response, self.logout_page)
+
+        FASTPATH_RESPONSES_TOTAL.inc('probe' if path in PROBE_PATHS else 'redirect')
+        headers, body = self.redirect
+        start_response('302 FOUND', list(headers))
+        return [body if environ['REQUEST_METHOD'] == 'GET' else b'']
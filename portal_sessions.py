@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Almacén de sesiones de dispositivos del Portal Cautivo
+MemorySessionStore guarda las sesiones en el proceso (un único worker);
+SQLiteSessionStore las comparte entre los workers de un portal pre-fork a
+través de un fichero SQLite en modo WAL (por defecto en /dev/shm, en memoria)
+Autor: SDN_Grupo2
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from session_expiry import ExpiryQueue
+
+DEFAULT_SHARED_PATH = '/dev/shm/captive_portal_sessions.db'
+
+# Registro compacto por dispositivo: solo lo que leen /status, /logout y la expiración
+RECORD_FIELDS = ('username', 'mac_address', 'role', 'vlan_id', 'authenticated_at',
+                 'expires_at', 'session_timeout', 'provisioning_id', 'provisioning_state')
+
+def compact_record(session_data):
+    return json.dumps([session_data.get(field) for field in RECORD_FIELDS], separators=(',', ':'))
+
+def expand_record(client_ip, record):
+    session_data = dict(zip(RECORD_FIELDS, json.loads(record)))
+    session_data['client_ip'] = client_ip
+    return session_data
+
+class MemorySessionStore:
+    """Sesiones en un diccionario del proceso, con contadores por rol y cola de expiración"""
+
+    def __init__(self):
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.by_role = {}                   # Contadores por rol, mantenidos en cada alta/baja
+        self.expiry_queue = ExpiryQueue()   # Sesiones ordenadas por expires_at
+
+    def add(self, client_ip, session_data):
+        """Guardar (o reemplazar) la sesión de un dispositivo"""
+        with self.lock:
+            previous = self.devices.get(client_ip)
+            if previous is not None:
+                self.by_role[previous['role']] -= 1
+            self.devices[client_ip] = session_data
+            self.by_role[session_data['role']] = self.by_role.get(session_data['role'], 0) + 1
+        self.expiry_queue.schedule(client_ip, session_data['expires_at'])
+
+    def get(self, client_ip):
+        return self.devices.get(client_ip)
+
+    def update_if_present(self, client_ip, **fields):
+        """Actualizar campos de una sesión que sigue activa; False si ya no existe"""
+        with self.lock:
+            session_data = self.devices.get(client_ip)
+            if session_data is None:
+                return False
+            session_data.update(fields)
+            return True
+
+    def remove(self, client_ip, cancel_expiry=True):
+        """Quitar la sesión de un dispositivo; devuelve sus datos o None"""
+        with self.lock:
+            session_data = self.devices.pop(client_ip, None)
+            if session_data is not None:
+                self.by_role[session_data['role']] -= 1
+        if cancel_expiry:
+            self.expiry_queue.cancel(client_ip)
+        return session_data
+
+    def pop_expired(self, now=None):
+        """Retirar las sesiones vencidas; devuelve [(client_ip, datos)]"""
+        expired = []
+        for client_ip in self.expiry_queue.pop_expired(now):
+            session_data = self.remove(client_ip, cancel_expiry=False)
+            if session_data is not None:
+                expired.append((client_ip, session_data))
+        return expired
+
+    def count(self):
+        return len(self.devices)
+
+    def count_by_role(self):
+        return dict(self.by_role)
+
+    def publish_invalidation(self, username=None, mac_address=None):
+        pass   # Un solo proceso: la caché de autenticaciones ya se invalidó localmente
+
+    def invalidations_since(self, seq=None):
+        return seq or 0, []
+
+    def close(self):
+        pass
+
+class SQLiteSessionStore:
+    """Sesiones compartidas por varios procesos en SQLite (WAL)
+    Cada proceso abre su propia conexión (también tras un fork); dentro del
+    proceso la conexión se comparte entre hilos con un lock, como el estado del controlador"""
+
+    def __init__(self, path=DEFAULT_SHARED_PATH, timeout=5):
+        self.path = path
+        self.timeout = timeout      # Espera máxima por el lock de escritura de otro worker
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        # DELETE ... RETURNING necesita SQLite >= 3.35; en versiones anteriores, SELECT + DELETE en una transacción
+        self.returning = sqlite3.sqlite_version_info >= (3, 35, 0)
+        with self.lock:
+            self.connection().execute("""
+                CREATE TABLE IF NOT EXISTS devices (
+                    client_ip TEXT PRIMARY KEY,
+                    role TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    record TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS devices_expires_at ON devices (expires_at)")
+            # Invalidaciones de la caché de autenticaciones, para que las apliquen todos los workers
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS auth_invalidations (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT,
+                    mac_address TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def connection(self):
+        """Conexión del proceso actual (llamar con self.lock tomado)"""
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                        isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.pid = os.getpid()
+        return self.conn
+
+    @contextmanager
+    def transaction(self):
+        """Transacción con el lock de escritura tomado desde el principio (llamar con self.lock tomado)"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def add(self, client_ip, session_data):
+        with self.lock:
+            self.connection().execute(
+                "INSERT OR REPLACE INTO devices (client_ip, role, expires_at, record) VALUES (?, ?, ?, ?)",
+                (client_ip, session_data['role'], session_data['expires_at'], compact_record(session_data))
+            )
+
+    def get(self, client_ip):
+        with self.lock:
+            row = self.connection().execute("SELECT record FROM devices WHERE client_ip = ?",
+                                            (client_ip,)).fetchone()
+        return expand_record(client_ip, row[0]) if row else None
+
+    def update_if_present(self, client_ip, **fields):
+        """Actualizar campos de una sesión sin resucitarla si otro worker la retiró"""
+        with self.lock, self.transaction() as conn:
+            row = conn.execute("SELECT record FROM devices WHERE client_ip = ?", (client_ip,)).fetchone()
+            if row is not None:
+                session_data = expand_record(client_ip, row[0])
+                session_data.update(fields)
+                conn.execute("UPDATE devices SET record = ? WHERE client_ip = ?",
+                             (compact_record(session_data), client_ip))
+        return row is not None
+
+    def remove(self, client_ip):
+        with self.lock:
+            if self.returning:
+                row = self.connection().execute("DELETE FROM devices WHERE client_ip = ? RETURNING record",
+                                                (client_ip,)).fetchone()
+            else:
+                with self.transaction() as conn:
+                    row = conn.execute("SELECT record FROM devices WHERE client_ip = ?", (client_ip,)).fetchone()
+                    conn.execute("DELETE FROM devices WHERE client_ip = ?", (client_ip,))
+        return expand_record(client_ip, row[0]) if row else None
+
+    def pop_expired(self, now=None):
+        """Cada sesión vencida la retira un único worker (DELETE ... RETURNING o SELECT + DELETE atómicos)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.returning:
+                rows = self.connection().execute(
+                    "DELETE FROM devices WHERE expires_at <= ? RETURNING client_ip, record", (now,)).fetchall()
+            else:
+                with self.transaction() as conn:
+                    rows = conn.execute("SELECT client_ip, record FROM devices WHERE expires_at <= ?",
+                                        (now,)).fetchall()
+                    conn.executemany("DELETE FROM devices WHERE client_ip = ?", [(row[0],) for row in rows])
+        return [(client_ip, expand_record(client_ip, record)) for client_ip, record in rows]
+
+    def count(self):
+        with self.lock:
+            return self.connection().execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def count_by_role(self):
+        with self.lock:
+            return dict(self.connection().execute("SELECT role, COUNT(*) FROM devices GROUP BY role").fetchall())
+
+    def publish_invalidation(self, username=None, mac_address=None, retention=3600):
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            conn.execute("INSERT INTO auth_invalidations (username, mac_address, created_at) VALUES (?, ?, ?)",
+                         (username, mac_address, now))
+            conn.execute("DELETE FROM auth_invalidations WHERE created_at < ?", (now - retention,))
+
+    def invalidations_since(self, seq=None):
+        """(última secuencia, [(usuario, mac)]) publicadas después de `seq`
+        Sin `seq` solo devuelve la última secuencia (un worker que arranca no tiene nada que invalidar)"""
+        with self.lock:
+            conn = self.connection()
+            if seq is None:
+                return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM auth_invalidations").fetchone()[0], []
+            rows = conn.execute("SELECT seq, username, mac_address FROM auth_invalidations WHERE seq > ? ORDER BY seq",
+                                (seq,)).fetchall()
+        return (rows[-1][0] if rows else seq), [(username, mac_address) for _, username, mac_address in rows]
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+                self.pid = None
+
+def open_session_store(backend, path=None):
+    """Crear el almacén de sesiones indicado ('memory' o 'sqlite')"""
+    if backend == 'sqlite':
+        return SQLiteSessionStore(path or DEFAULT_SHARED_PATH)
+    if backend == 'memory':
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Servicios simulados y utilidades comunes de los benchmarks y las comprobaciones
+Floodlight y FreeRADIUS simulados en localhost (cada uno en su propio proceso),
+lanzamiento del portal y del controlador como subprocesos y carga HTTP concurrente
+Autor: SDN_Grupo2
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import requests
+
+import radius_client
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ROLES = ['ROLE_ADMIN', 'ROLE_PROFESOR', 'ROLE_ESTUDIANTE', 'ROLE_GUEST', 'ROLE_IOT', 'ROLE_SOPORTE']
+ROLE_VLANS = {'ROLE_ADMIN': '10', 'ROLE_PROFESOR': '15', 'ROLE_ESTUDIANTE': '20',
+              'ROLE_GUEST': '30', 'ROLE_IOT': '40', 'ROLE_SOPORTE': '50'}
+
+class FloodlightStub:
+    """Servidor Floodlight simulado con latencia configurable por petición
+    HTTP/1.1 keep-alive mínimo sobre asyncio, en un proceso aparte para no
+    competir por el GIL con el controlador medido"""
+
+    def __init__(self, switches, latency=0.002, port=0, links=()):
+        self.switches = list(switches)
+        self.latency = latency
+        self.links = list(links)   # Pares (switch, switch) de /wm/topology/links/json
+        self.hosts = {}            # MAC -> switch de acceso (/wm/device/)
+        self.flows = {}            # Nombre -> flujo: como Floodlight, un nombre es único en toda la red
+        self.posts = 0
+        self.offline_posts = 0     # Flujos enviados a switches desconectados
+        self.deletes = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', port))
+        self.sock.listen(1024)
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+
+    def handle(self, method, path, body):
+        """Resolver una petición REST; devuelve (status, payload)"""
+        path, _, query = path.partition('?')
+        if method == 'GET' and path == '/wm/core/controller/switches/json':
+            return 200, [{'switchDPID': dpid} for dpid in self.switches]
+        if method == 'GET' and path == '/wm/staticflowpusher/list/all/json':
+            table = {dpid: [] for dpid in self.switches}
+            for name, flow in self.flows.items():
+                table.setdefault(flow.get('switch'), []).append({name: flow})
+            return 200, table
+        if method == 'GET' and path.startswith('/wm/staticflowpusher/list/') and path.endswith('/json'):
+            dpid = path[len('/wm/staticflowpusher/list/'):-len('/json')]
+            return 200, {dpid: [{name: flow} for name, flow in self.flows.items() if flow.get('switch') == dpid]}
+        if method == 'GET' and path.startswith('/wm/core/switch/') and path.endswith('/port-desc/json'):
+            return 200, {'portDesc': [{'portNumber': str(port), 'name': f'eth{port}', 'state': '0'}
+                                      for port in range(1, 5)] + [{'portNumber': 'local', 'name': 'br0'}]}
+        if method == 'POST' and path == '/stub/switches':
+            # Desconectar un switch vacía su tabla, como un reinicio real
+            self.switches = json.loads(body or b'{}')['switches']
+            for name in [n for n, flow in self.flows.items() if flow.get('switch') not in self.switches]:
+                del self.flows[name]
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/wm/topology/links/json':
+            return 200, [{'src-switch': src, 'src-port': 1, 'dst-switch': dst, 'dst-port': 1,
+                          'type': 'internal', 'direction': 'bidirectional'} for src, dst in self.links]
+        if method == 'GET' and path == '/wm/device/':
+            macs = parse_qs(query).get('mac')
+            if macs:
+                # Cada MAC se conecta a un switch fijo derivado de su valor
+                mac = macs[0].lower()
+                self.hosts.setdefault(mac, self.switches[int(mac.replace(':', ''), 16) % len(self.switches)])
+                macs = [mac]
+            return 200, {'devices': [{'mac': [mac], 'attachmentPoint': [{'switch': self.hosts[mac], 'port': 2}]}
+                                     for mac in (macs or self.hosts)]}
+        if method == 'POST' and path == '/stub/move':
+            host = json.loads(body or b'{}')
+            self.hosts[host['mac'].lower()] = host['switch']
+            return 200, {'status': 'moved'}
+        if method == 'GET' and path == '/stub/stats':
+            by_switch = {}
+            for switch_dpid in (flow.get('switch') for flow in self.flows.values()):
+                by_switch[switch_dpid] = by_switch.get(switch_dpid, 0) + 1
+            return 200, {'posts': self.posts, 'deletes': self.deletes, 'flows': len(self.flows),
+                         'offline_posts': self.offline_posts, 'by_switch': by_switch}
+        if path == '/wm/staticflowpusher/json':
+            flow = json.loads(body or b'{}')
+            if method == 'POST':
+                self.flows[flow.get('name')] = flow   # Mismo nombre en otro switch: reemplaza al anterior
+                self.posts += 1
+                if flow.get('switch') not in self.switches:
+                    self.offline_posts += 1
+                return 200, {'status': 'Entry pushed'}
+            if method == 'DELETE':
+                self.flows.pop(flow.get('name'), None)
+                self.deletes += 1
+                return 200, {'status': f"Entry {flow.get('name')} deleted"}
+        return 404, {'error': 'not found'}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+                length = int(headers.get('Content-Length', headers.get('content-length', 0)))
+                body = await reader.readexactly(length) if length else b''
+                if self.latency and not path.startswith('/stub/'):
+                    await asyncio.sleep(self.latency)
+                status, payload = self.handle(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def serve_forever(self):
+        async def run():
+            server = await asyncio.start_server(self.serve_connection, sock=self.sock)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(run())
+
+    def start(self):
+        self.process = multiprocessing.Process(target=self.serve_forever, daemon=True)
+        self.process.start()
+        self.sock.close()  # El socket queda abierto en el proceso hijo
+        return self
+
+    def stats(self):
+        return requests.get(f"{self.url}/stub/stats", timeout=5).json()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+class RadiusStub:
+    """Servidor RADIUS simulado (UDP) con los atributos que entrega FreeRADIUS
+    `drop_every` descarta una de cada N peticiones para ejercitar los reintentos
+    `port` fija el puerto para simular un reinicio en la misma dirección"""
+
+    def __init__(self, secret, users, latency=0.0, drop_every=0, port=0):
+        self.secret = secret.encode('utf-8')
+        self.users = users      # username -> (password, role, vlan, session_timeout, filter_id)
+        self.latency = latency
+        self.drop_every = drop_every
+        self.received = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(('127.0.0.1', port))
+        self.port = self.sock.getsockname()[1]
+
+    def reply(self, packet):
+        """Responder un Access-Request; None si se descarta"""
+        self.received += 1
+        if self.drop_every and self.received % self.drop_every == 0:
+            return None
+
+        _, identifier, length, authenticator = radius_client.HEADER.unpack_from(packet)
+        attributes = radius_client.decode_attributes(packet[radius_client.HEADER.size:length])
+        username = attributes[radius_client.ATTR_USER_NAME][0].decode('utf-8')
+        password = radius_client.decrypt_password(attributes[radius_client.ATTR_USER_PASSWORD][0],
+                                                  self.secret, authenticator)
+
+        user = self.users.get(username)
+        if user is not None and user[0] == password:
+            _, role, vlan, session_timeout, filter_id = user
+            code = radius_client.ACCESS_ACCEPT
+            reply_attributes = [
+                (radius_client.ATTR_CLASS, role.encode('utf-8')),
+                (radius_client.ATTR_TUNNEL_PRIVATE_GROUP_ID, b'\x00' + str(vlan).encode('utf-8')),
+                (radius_client.ATTR_SESSION_TIMEOUT, struct.pack('!I', session_timeout)),
+                (radius_client.ATTR_FILTER_ID, filter_id.encode('utf-8'))
+            ]
+        else:
+            code = radius_client.ACCESS_REJECT
+            reply_attributes = []
+
+        response = radius_client.build_packet(code, identifier, authenticator, reply_attributes)
+        signature = radius_client.response_authenticator(response, authenticator, self.secret)
+        return response[:4] + signature + response[radius_client.HEADER.size:]
+
+    def serve_forever(self):
+        class Protocol(asyncio.DatagramProtocol):
+            def connection_made(protocol, transport):
+                protocol.transport = transport
+
+            def datagram_received(protocol, data, address):
+                response = self.reply(data)
+                if response is None:
+                    return
+                if self.latency:
+                    asyncio.get_running_loop().call_later(self.latency, protocol.transport.sendto, response, address)
+                else:
+                    protocol.transport.sendto(response, address)
+
+        async def run():
+            await asyncio.get_running_loop().create_datagram_endpoint(Protocol, sock=self.sock)
+            await asyncio.Event().wait()
+        asyncio.run(run())
+
+    def start(self):
+        self.process = multiprocessing.Process(target=self.serve_forever, daemon=True)
+        self.process.start()
+        self.sock.close()  # El socket queda abierto en el proceso hijo
+        return self
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+def login_payload(i, role=None):
+    """Datos de login como los envía el portal cautivo"""
+    return {
+        'username': f'user{i}',
+        'role': role or ROLES[i % len(ROLES)],
+        'client_ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+        'mac_address': f'02:00:00:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}',
+        'vlan_id': '20',
+        'session_timeout': 3600
+    }
+
+def radius_users(count):
+    """Usuarios del RADIUS simulado: username -> (password, role, vlan, timeout, filter_id)"""
+    return {f'user{i}': (f'pass{i}', ROLES[i % len(ROLES)], 10 + i % 6, 3600, f'filter{i % 6}')
+            for i in range(count)}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_http(url, timeout=15):
+    """Esperar a que un servicio lanzado como subproceso responda"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} no respondió en {timeout}s")
+
+def start_portal(port, controller_url, radius_port, radius_secret, extra_args=()):
+    """Lanzar captive_portal.py en localhost como subproceso
+    Los dispositivos simulados se distinguen por X-Forwarded-For: localhost es proxy de confianza"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'captive_portal.py'),
+         '--host', '127.0.0.1', '--port', str(port), '--controller-url', controller_url,
+         '--radius-server', '127.0.0.1', '--radius-port', str(radius_port), '--radius-secret', radius_secret,
+         '--trusted-proxy', '127.0.0.1', *extra_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_http(f"http://127.0.0.1:{port}/api/stats")
+    return process
+
+def start_controller(mode, floodlight_url, port, state_args=('--state-backend', 'memory'), extra_args=()):
+    """Lanzar sdn_controller.py en el modo indicado como subproceso"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'sdn_controller.py'), '--mode', mode,
+         '--floodlight-url', floodlight_url, '--port', str(port), *state_args, *extra_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_http(f"http://127.0.0.1:{port}/health")
+    return process
+
+def run_http_load(url, payloads, concurrency):
+    """POST concurrente de `payloads` a `url`; devuelve latencias y errores"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one_request(payload):
+        nonlocal errors
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.post(url, json=payload, timeout=60).status_code in (200, 202)
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, payloads))
+    return sorted(latencies), errors, time.perf_counter() - start
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Cola de aprovisionamiento de logins del Controlador SDN
+El controlador acepta la notificación del portal, la guarda en el almacén de
+estado y responde al momento con un ID de aprovisionamiento; un conjunto de
+workers instala los flujos después, por orden de prioridad del rol, y el
+portal consulta el estado con ese ID
+Autor: SDN_Grupo2
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATES = ('queued', 'provisioning')
+
+class QueueFull(Exception):
+    """Demasiados logins pendientes (o de baja prioridad con la cola cargada):
+    el portal debe reintentar más tarde"""
+
+class ProvisioningQueue:
+    """Trabajos de aprovisionamiento por ID
+    Los pendientes se guardan en el almacén de estado hasta terminar; los terminados
+    se conservan `retention` segundos en memoria para que el portal lea el resultado.
+    Con `shed_pending` pendientes o más solo se admiten roles de prioridad >= `shed_below_priority`"""
+
+    def __init__(self, state_store, max_pending=5000, shed_pending=None, shed_below_priority=0, retention=600):
+        self.state_store = state_store
+        self.max_pending = max_pending    # Pendientes antes de rechazar logins (backpressure)
+        self.shed_pending = shed_pending if shed_pending is not None else max_pending
+        self.shed_below_priority = shed_below_priority
+        self.retention = retention
+        self.jobs = {}                    # id -> trabajo
+        self.pending_by_client = {}       # client_ip -> id del trabajo pendiente más reciente
+        self.pending = 0
+        self.finished = deque()           # (terminado en, id) para purgar por antigüedad
+        self.lock = threading.Lock()
+        self.dispatch = None              # dispatch(trabajo): entregar el trabajo a los workers
+        self.stats = {'submitted': 0, 'restored': 0, 'rejected': 0, 'coalesced': 0,
+                      'active': 0, 'failed': 0, 'degraded': 0, 'cancelled': 0, 'expired': 0}
+        self.roles = {}                   # rol -> contadores de cola (queued, started, shed, espera)
+
+    def role_stats(self, role):
+        stats = self.roles.get(role)
+        if stats is None:
+            stats = self.roles[role] = {'queued': 0, 'started': 0, 'shed': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        return stats
+
+    def submit(self, user_data, login_key, trace_id=None, parent_span_id=None, priority=0):
+        """Aceptar un login; devuelve su trabajo (el pendiente si es un duplicado)
+        Lanza QueueFull si la cola está llena o si está cargada y el rol es de baja prioridad"""
+        now = time.time()
+        with self.lock:
+            job = self.jobs.get(self.pending_by_client.get(user_data['client_ip']))
+            if job is not None and job['login_key'] == list(login_key):
+                self.stats['coalesced'] += 1
+                return self.public(job)
+            if self.pending >= self.max_pending or (self.pending >= self.shed_pending
+                                                    and priority < self.shed_below_priority):
+                self.stats['rejected'] += 1
+                self.role_stats(user_data['role'])['shed'] += 1
+                raise QueueFull(f"{self.pending} logins pending")
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'state': 'queued',
+                'priority': priority,
+                'user_data': user_data,
+                'login_key': list(login_key),
+                'trace_id': trace_id,
+                'parent_span_id': parent_span_id,
+                'flows_installed': 0,
+                'error': None,
+                'created_at': now,
+                'updated_at': now
+            }
+            self.add_pending(job)
+            self.stats['submitted'] += 1
+
+        self.state_store.save_job(job)
+        self.dispatch(job)
+        return self.public(job)
+
+    def add_pending(self, job):
+        self.jobs[job['id']] = job
+        self.pending_by_client[job['user_data']['client_ip']] = job['id']
+        self.pending += 1
+        self.role_stats(job['user_data']['role'])['queued'] += 1
+
+    def remove_queued(self, job):
+        self.role_stats(job['user_data']['role'])['queued'] -= 1
+
+    def restore(self):
+        """Volver a encolar los logins que quedaron pendientes antes de un reinicio
+        Los que caducaron mientras tanto se descartan"""
+        now = time.time()
+        restored = []
+        expired = []
+        for job in self.state_store.load_jobs():
+            if job['created_at'] + job['user_data'].get('session_timeout', 3600) <= now:
+                expired.append(job['id'])
+                continue
+            job['state'] = 'queued'
+            job.setdefault('priority', 0)
+            with self.lock:
+                self.add_pending(job)
+            restored.append(job)
+
+        if expired:
+            self.state_store.delete_jobs(expired)
+        self.stats['restored'] += len(restored)
+        self.stats['expired'] += len(expired)
+        for job in restored:
+            self.dispatch(job)
+        if restored or expired:
+            logger.info(f"♻️ Re-queued {len(restored)} pending logins, discarded {len(expired)} expired")
+        return len(restored)
+
+    def begin(self, job_id):
+        """Marcar un trabajo en curso; None si se canceló (logout) antes de empezar"""
+        now = time.time()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'queued':
+                return None
+            job['state'] = 'provisioning'
+            job['updated_at'] = now
+            self.remove_queued(job)
+            stats = self.role_stats(job['user_data']['role'])
+            wait = now - job['created_at']
+            stats['started'] += 1
+            stats['wait_seconds'] += wait
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], wait)
+            return job
+
+    def finish(self, job_id, state, flows_installed=0, error=None):
+        """Cerrar un trabajo; devuelve el estado final
+        Un logout durante la instalación convierte 'active' en 'cancelled'"""
+        now = time.time()
+        with self.lock:
+            job = self.jobs[job_id]
+            if job['state'] not in PENDING_STATES:
+                return job['state']
+            if job.get('cancel_requested') and state == 'active':
+                state = 'cancelled'
+            if job['state'] == 'queued':
+                self.remove_queued(job)
+            job.update(state=state, flows_installed=flows_installed, error=error, updated_at=now)
+            self.pending -= 1
+            client_ip = job['user_data']['client_ip']
+            if self.pending_by_client.get(client_ip) == job_id:
+                del self.pending_by_client[client_ip]
+            self.finished.append((now, job_id))
+            self.stats[state] += 1
+            self.prune(now)
+
+        self.state_store.delete_jobs([job_id])
+        return state
+
+    def cancel_client(self, client_ip):
+        """Logout de un cliente con un login pendiente: los encolados no llegan a
+        aprovisionarse y los que están en curso se deshacen al terminar"""
+        with self.lock:
+            job = self.jobs.get(self.pending_by_client.get(client_ip))
+            if job is None:
+                return None
+            job['cancel_requested'] = True
+            queued = job['state'] == 'queued'
+        if queued:
+            self.finish(job['id'], 'cancelled')
+        return job['id']
+
+    def prune(self, now):
+        while self.finished and self.finished[0][0] < now - self.retention:
+            _, job_id = self.finished.popleft()
+            self.jobs.pop(job_id, None)
+
+    @staticmethod
+    def public(job):
+        """Estado de un trabajo tal como lo expone /api/provisioning/<id>"""
+        return {
+            'provisioning_id': job['id'],
+            'state': job['state'],
+            'client_ip': job['user_data']['client_ip'],
+            'username': job['user_data']['username'],
+            'role': job['user_data']['role'],
+            'flows_installed': job['flows_installed'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return self.public(job) if job is not None else None
+
+    def queue_depth_by_role(self):
+        return {role: stats['queued'] for role, stats in list(self.roles.items())}
+
+    def role_report(self):
+        """Profundidad de cola, espera media/máxima y logins descartados por rol"""
+        with self.lock:
+            return {role: {
+                'queued': stats['queued'],
+                'started': stats['started'],
+                'shed': stats['shed'],
+                'mean_wait_ms': round(stats['wait_seconds'] / stats['started'] * 1000, 1) if stats['started'] else None,
+                'max_wait_ms': round(stats['max_wait_seconds'] * 1000, 1)
+            } for role, stats in self.roles.items()}
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({'pending': self.pending, 'max_pending': self.max_pending, 'shed_pending': self.shed_pending,
+                      'tracked': len(self.jobs), 'by_role': self.role_report()})
+        return stats
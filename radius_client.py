@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Cliente RADIUS nativo para el Portal Cautivo
+Envía Access-Request por UDP (RFC 2865) sin lanzar radtest en cada login:
+un solo socket compartido, peticiones multiplexadas por identificador,
+reintentos y timeout por intento
+Autor: SDN_Grupo2
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import os
+import socket
+import struct
+import threading
+
+# Códigos de paquete
+ACCESS_REQUEST = 1
+ACCESS_ACCEPT = 2
+ACCESS_REJECT = 3
+ACCESS_CHALLENGE = 11
+
+PACKET_CODES = {
+    ACCESS_ACCEPT: 'Access-Accept',
+    ACCESS_REJECT: 'Access-Reject',
+    ACCESS_CHALLENGE: 'Access-Challenge'
+}
+
+# Atributos usados por el portal
+ATTR_USER_NAME = 1
+ATTR_USER_PASSWORD = 2
+ATTR_NAS_IP_ADDRESS = 4
+ATTR_FRAMED_IP_ADDRESS = 8
+ATTR_FILTER_ID = 11
+ATTR_REPLY_MESSAGE = 18
+ATTR_CLASS = 25
+ATTR_SESSION_TIMEOUT = 27
+ATTR_CALLING_STATION_ID = 31
+ATTR_NAS_IDENTIFIER = 32
+ATTR_MESSAGE_AUTHENTICATOR = 80
+ATTR_TUNNEL_PRIVATE_GROUP_ID = 81
+
+HEADER = struct.Struct('!BBH16s')
+MAX_PACKET_SIZE = 4096
+
+class RadiusTimeout(Exception):
+    """El servidor RADIUS no respondió tras todos los reintentos"""
+
+def encrypt_password(password, secret, authenticator):
+    """Ocultar User-Password con MD5(secreto + autenticador) en bloques de 16 bytes"""
+    data = password.encode('utf-8') or b'\x00'
+    data += b'\x00' * (-len(data) % 16)
+
+    result = b''
+    previous = authenticator
+    for i in range(0, len(data), 16):
+        digest = hashlib.md5(secret + previous).digest()
+        block = bytes(a ^ b for a, b in zip(data[i:i + 16], digest))
+        result += block
+        previous = block
+    return result
+
+def decrypt_password(hidden, secret, authenticator):
+    """Operación inversa de encrypt_password (usada por el RADIUS simulado)"""
+    result = b''
+    previous = authenticator
+    for i in range(0, len(hidden), 16):
+        digest = hashlib.md5(secret + previous).digest()
+        block = hidden[i:i + 16]
+        result += bytes(a ^ b for a, b in zip(block, digest))
+        previous = block
+    return result.rstrip(b'\x00').decode('utf-8')
+
+def encode_attributes(attributes):
+    """Serializar [(tipo, bytes)] en formato TLV"""
+    return b''.join(struct.pack('!BB', attr_type, len(value) + 2) + value for attr_type, value in attributes)
+
+def decode_attributes(data):
+    """Leer atributos TLV; devuelve {tipo: [valores]}"""
+    attributes = {}
+    offset = 0
+    while offset + 2 <= len(data):
+        attr_type, length = data[offset], data[offset + 1]
+        if length < 2 or offset + length > len(data):
+            raise ValueError("Malformed RADIUS attribute")
+        attributes.setdefault(attr_type, []).append(data[offset + 2:offset + length])
+        offset += length
+    return attributes
+
+def build_packet(code, identifier, authenticator, attributes, secret=None):
+    """Armar un paquete; con `secret` añade Message-Authenticator (HMAC-MD5)"""
+    if secret is not None:
+        attributes = list(attributes) + [(ATTR_MESSAGE_AUTHENTICATOR, b'\x00' * 16)]
+    body = encode_attributes(attributes)
+    packet = HEADER.pack(code, identifier, HEADER.size + len(body), authenticator) + body
+
+    if secret is not None:
+        signature = hmac.new(secret, packet, hashlib.md5).digest()
+        packet = packet[:-16] + signature
+    return packet
+
+def response_authenticator(packet, request_authenticator, secret):
+    """MD5(Code + ID + Length + RequestAuth + Atributos + Secreto)"""
+    return hashlib.md5(packet[:4] + request_authenticator + packet[HEADER.size:] + secret).digest()
+
+def parse_reply_attributes(raw_attributes):
+    """Traducir los atributos de la respuesta al formato que usa el portal"""
+    attributes = {}
+
+    if ATTR_CLASS in raw_attributes:
+        try:
+            attributes['role'] = raw_attributes[ATTR_CLASS][0].decode('utf-8')
+        except UnicodeDecodeError:
+            attributes['role'] = 'ROLE_GUEST'
+
+    if ATTR_TUNNEL_PRIVATE_GROUP_ID in raw_attributes:
+        value = raw_attributes[ATTR_TUNNEL_PRIVATE_GROUP_ID][0]
+        if value and value[0] <= 0x1F:  # Byte de tag opcional (RFC 2868)
+            value = value[1:]
+        attributes['vlan_id'] = value.decode('utf-8', 'replace')
+
+    if ATTR_SESSION_TIMEOUT in raw_attributes:
+        value = raw_attributes[ATTR_SESSION_TIMEOUT][0]
+        if len(value) == 4:
+            attributes['session_timeout'] = struct.unpack('!I', value)[0]
+
+    if ATTR_FILTER_ID in raw_attributes:
+        attributes['filter_id'] = raw_attributes[ATTR_FILTER_ID][0].decode('utf-8', 'replace')
+
+    if ATTR_REPLY_MESSAGE in raw_attributes:
+        attributes['reply_message'] = b''.join(raw_attributes[ATTR_REPLY_MESSAGE]).decode('utf-8', 'replace')
+
+    return attributes
+
+class PendingRequest:
+    """Petición en vuelo esperando su respuesta"""
+
+    def __init__(self, authenticator):
+        self.authenticator = authenticator
+        self.event = threading.Event()
+        self.reply = None
+
+def ipv4_attribute(value):
+    """Dirección IPv4 empaquetada para Framed-IP-Address, o None
+    Acepta listas de X-Forwarded-For (se usa el primer salto); IPv6 o valores
+    inválidos no llevan el atributo y no impiden la autenticación"""
+    if not value:
+        return None
+    try:
+        address = ipaddress.ip_address(value.split(',', 1)[0].strip())
+    except ValueError:
+        return None
+    return address.packed if address.version == 4 else None
+
+class RadiusClient:
+    """Cliente RADIUS thread-safe sobre un único socket UDP
+    Cada petición ocupa uno de los 256 identificadores mientras está en vuelo;
+    un hilo receptor entrega cada respuesta a quien la espera"""
+
+    def __init__(self, server, port, secret, timeout=3, retries=2, nas_ip=None, nas_identifier='captive-portal'):
+        self.server = server
+        self.port = port
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.timeout = timeout
+        self.retries = retries
+        self.nas_ip = nas_ip
+        self.nas_identifier = nas_identifier
+
+        self.lock = threading.Lock()
+        self.id_available = threading.Condition(self.lock)
+        self.pending = {}           # identificador -> PendingRequest
+        self.next_id = 0
+        self.sock = None
+        self.address = None
+        self.receiver = None
+
+    def _ensure_socket(self):
+        """Abrir el socket y el hilo receptor la primera vez que se usan"""
+        if self.sock is not None:
+            return
+        family, _, _, _, address = socket.getaddrinfo(self.server, self.port, 0, socket.SOCK_DGRAM)[0]
+        self.address = address
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.connect(address)  # Solo se aceptan datagramas del servidor configurado
+        self.receiver = threading.Thread(target=self._receive_loop, args=(self.sock,), daemon=True)
+        self.receiver.start()
+
+    def _acquire_id(self, pending):
+        with self.id_available:
+            self._ensure_socket()
+            while len(self.pending) >= 256:
+                self.id_available.wait()
+            while self.next_id in self.pending:
+                self.next_id = (self.next_id + 1) % 256
+            identifier = self.next_id
+            self.next_id = (self.next_id + 1) % 256
+            self.pending[identifier] = pending
+            return identifier
+
+    def _release_id(self, identifier):
+        with self.id_available:
+            self.pending.pop(identifier, None)
+            self.id_available.notify()
+
+    def _receive_loop(self, sock):
+        while True:
+            try:
+                packet = sock.recv(MAX_PACKET_SIZE)
+            except OSError:
+                if sock is not self.sock:
+                    return  # Socket cerrado con close()
+                continue  # p. ej. ICMP puerto inalcanzable mientras FreeRADIUS se reinicia
+            if sock is not self.sock:
+                return
+
+            if len(packet) < HEADER.size:
+                continue
+            code, identifier, length, authenticator = HEADER.unpack_from(packet)
+            if length < HEADER.size or length > len(packet):
+                continue
+            packet = packet[:length]
+
+            with self.lock:
+                pending = self.pending.get(identifier)
+            if pending is None or pending.event.is_set():
+                continue
+
+            # Descartar respuestas que no firmó el servidor con nuestro secreto
+            if authenticator != response_authenticator(packet, pending.authenticator, self.secret):
+                continue
+
+            pending.reply = (code, packet[HEADER.size:])
+            pending.event.set()
+
+    def authenticate(self, username, password, calling_station_id=None, framed_ip=None):
+        """Enviar un Access-Request y esperar la respuesta
+        Devuelve {'code': 'Access-Accept' | 'Access-Reject' | ..., 'attributes': {...}}"""
+        authenticator = os.urandom(16)
+        attributes = [
+            (ATTR_USER_NAME, username.encode('utf-8')),
+            (ATTR_USER_PASSWORD, encrypt_password(password, self.secret, authenticator)),
+            (ATTR_NAS_IDENTIFIER, self.nas_identifier.encode('utf-8'))
+        ]
+        if self.nas_ip:
+            attributes.append((ATTR_NAS_IP_ADDRESS, socket.inet_aton(self.nas_ip)))
+        framed_address = ipv4_attribute(framed_ip)
+        if framed_address:
+            attributes.append((ATTR_FRAMED_IP_ADDRESS, framed_address))
+        if calling_station_id:
+            attributes.append((ATTR_CALLING_STATION_ID, calling_station_id.encode('utf-8')))
+
+        pending = PendingRequest(authenticator)
+        identifier = self._acquire_id(pending)
+        try:
+            packet = build_packet(ACCESS_REQUEST, identifier, authenticator, attributes, secret=self.secret)
+            for _ in range(self.retries + 1):
+                try:
+                    self.sock.send(packet)
+                except ConnectionRefusedError:
+                    pass  # El servidor aún no escucha: el intento cuenta y se reintenta
+                if pending.event.wait(self.timeout):
+                    break
+            else:
+                raise RadiusTimeout(f"No reply from {self.server}:{self.port} after {self.retries + 1} attempts")
+        finally:
+            self._release_id(identifier)
+
+        code, body = pending.reply
+        return {
+            'code': PACKET_CODES.get(code, str(code)),
+            'attributes': parse_reply_attributes(decode_attributes(body))
+        }
+
+    def close(self):
+        with self.lock:
+            sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # Despierta al hilo receptor
+            except OSError:
+                pass
+            sock.close()
@@ -7,13 +7,29 @@ Autor: SDN_Grupo2
 Fecha: Julio 2025
 """
 
+import argparse
 import logging
 import time
 import json
 import requests
-from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future
 import threading
+import gc
+import queue
+import re
+
+from session_expiry import ExpiryQueue
+from controller_state import MemoryStateStore, open_state_store
+from flow_export import export_stream, parse_export_params
+from topology_cache import TopologyCache
+from switch_inventory import SwitchInventory
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import Tracer, OTLPExporter, parse_traceparent, parse_report_params
+from provisioning import ProvisioningQueue, QueueFull
+from admission import TokenBucket
 
 # Configuración de logging
 logging.basicConfig(
@@ -22,82 +38,727 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class SDNController:
+# Métricas de la instalación de flujos
+FLOW_PUSH_SECONDS = REGISTRY.histogram(
+    'sdn_controller_flow_push_seconds', 'Latencia por flujo del POST a Floodlight', ['switch'])
+FLOWS_PUSHED_TOTAL = REGISTRY.counter(
+    'sdn_controller_flows_pushed_total', 'Flujos enviados a Floodlight por rol y switch', ['role', 'switch'])
+FLOW_PUSH_ERRORS_TOTAL = REGISTRY.counter(
+    'sdn_controller_flow_push_errors_total', 'Flujos rechazados o sin respuesta por rol y switch', ['role', 'switch'])
+LOGIN_HANDLER_SECONDS = REGISTRY.histogram(
+    'sdn_controller_login_seconds', 'Duración de la configuración de red de un login', ['role'])
+LOGIN_NOTIFICATIONS_TOTAL = REGISTRY.counter(
+    'sdn_controller_login_notifications_total',
+    'Notificaciones de login por resultado: install, coalesced (unida a una en curso) o refreshed', ['outcome'])
+PROVISIONING_WAIT_SECONDS = REGISTRY.histogram(
+    'sdn_controller_provisioning_wait_seconds', 'Espera en la cola de aprovisionamiento por rol', ['role'])
+
+# Trazas de los logins notificados por el portal (/debug/traces)
+tracer = Tracer('sdn-controller')
+
+# Switches conocidos - BASADA EN TUS SWITCHES REALES
+# Solo aportan nombre, IP y rol de puertos: los switches en uso son los que
+# Floodlight tiene conectados (self.SWITCHES, mantenido por el inventario)
+KNOWN_SWITCHES = {
+    # Switch 1 - IP: 192.168.200.202
+    "00:00:72:e0:80:7e:85:4c": {
+        "name": "Switch-1",
+        "ip": "192.168.200.202",
+        "ports": {
+            1: "trunk_port",
+            2: "access_port_1", 
+            3: "access_port_2",
+            4: "access_port_3"
+        }
+    },
+    
+    # Switch 2 - IP: 192.168.200.203  
+    "00:00:f2:20:f9:45:4c:4e": {
+        "name": "Switch-2", 
+        "ip": "192.168.200.203",
+        "ports": {
+            1: "trunk_port",
+            2: "access_port_1",
+            3: "access_port_2", 
+            4: "access_port_3"
+        }
+    },
+    
+    # Switch 3 - IP: 192.168.200.205
+    "00:00:1a:74:72:3f:ef:44": {
+        "name": "Switch-3",
+        "ip": "192.168.200.205", 
+        "ports": {
+            1: "trunk_port",
+            2: "access_port_1",
+            3: "access_port_2",
+            4: "access_port_3"
+        }
+    },
+    
+    # Switch 4 - IP: 192.168.200.201
+    "00:00:5e:c7:6e:c6:11:4c": {
+        "name": "Switch-4",
+        "ip": "192.168.200.201",
+        "ports": {
+            1: "trunk_port", 
+            2: "access_port_1",
+            3: "access_port_2",
+            4: "access_port_3"
+        }
+    },
+    
+    # Switch 5 - IP: 192.168.200.204
+    "00:00:aa:51:aa:ba:72:41": {
+        "name": "Switch-5",
+        "ip": "192.168.200.204",
+        "ports": {
+            1: "trunk_port",
+            2: "access_port_1", 
+            3: "access_port_2",
+            4: "access_port_3"
+        }
+    }
+}
+
+class FloodlightFlowPusher:
+    """Motor de instalación de flujos sobre el Static Flow Pusher de Floodlight
+    Reutiliza conexiones keep-alive y limita la concurrencia por switch"""
+    
+    def __init__(self, floodlight_url, max_workers=32, per_switch_concurrency=4, timeout=5, rate_limiter=None):
+        self.FLOODLIGHT_URL = floodlight_url
+        self.PUSHER_URL = f"{floodlight_url}/wm/staticflowpusher/json"
+        self.timeout = timeout
+        self.per_switch_concurrency = per_switch_concurrency
+        self.rate_limiter = rate_limiter  # TokenBucket opcional para todas las escrituras
+        
+        # Sesión compartida con pool de conexiones persistentes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='flow-pusher')
+        
+        # Semáforos por switch para no saturar el flow pusher de un mismo DPID
+        self.switch_slots = {}
+        self.slots_lock = threading.Lock()
+    
+    def _get_switch_slot(self, switch_dpid):
+        """Obtener (o crear) el semáforo de concurrencia de un switch"""
+        with self.slots_lock:
+            slot = self.switch_slots.get(switch_dpid)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_switch_concurrency)
+                self.switch_slots[switch_dpid] = slot
+            return slot
+    
+    @staticmethod
+    def _result(flow, error=None):
+        """Resultado estructurado de un flujo, fallido hasta que Floodlight responda 200"""
+        return {
+            'name': flow.get('name'),
+            'switch': flow.get('switch'),
+            'status': 'error',
+            'http_status': None,
+            'latency': 0.0,
+            'started': None,
+            'error': error
+        }
+    
+    def _send(self, method, flow, deadline=None, admitted=False):
+        """Enviar un flujo a Floodlight y devolver un resultado estructurado
+        `admitted`: el token ya se tomó en _dispatch (trabajo de fondo)"""
+        result = self._result(flow)
+        if deadline is not None and time.monotonic() > deadline:
+            if admitted:
+                self.rate_limiter.refund()
+            result['error'] = 'deadline exceeded'
+            return result
+        
+        # El turno del token bucket (con prioridad) se espera fuera del semáforo del switch
+        if self.rate_limiter is not None and not admitted:
+            if not self.rate_limiter.acquire(deadline=deadline):
+                result['error'] = 'rate limit wait exceeded'
+                return result
+        
+        with self._get_switch_slot(flow.get('switch', 'all')):
+            if deadline is not None and time.monotonic() > deadline:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.refund()
+                result['error'] = 'deadline exceeded'
+                return result
+            
+            start = result['started'] = time.perf_counter()
+            try:
+                response = self.session.request(method, self.PUSHER_URL,
+                                                data=json.dumps(flow), timeout=self.timeout)
+                result['http_status'] = response.status_code
+                if response.status_code == 200:
+                    result['status'] = 'success'
+                else:
+                    result['error'] = f"HTTP {response.status_code}: {response.text}"
+            except requests.exceptions.RequestException as e:
+                result['error'] = str(e)
+            result['latency'] = time.perf_counter() - start
+        
+        return result
+    
+    def _dispatch(self, method, flows, deadline, login):
+        """Repartir los flujos entre los hilos del pool
+        El trabajo de fondo espera su turno del token bucket aquí, en el hilo que lo
+        pide, para no ocupar los hilos del pool que necesitan los logins"""
+        if self.rate_limiter is None or login:
+            return [self.executor.submit(self._send, method, flow, deadline) for flow in flows]
+        
+        futures = []
+        for flow in flows:
+            if self.rate_limiter.acquire(background=True, deadline=deadline):
+                futures.append(self.executor.submit(self._send, method, flow, deadline, True))
+            else:
+                future = Future()
+                future.set_result(self._result(flow, 'deadline exceeded'))
+                futures.append(future)
+        return futures
+    
+    def push(self, flows, deadline=None, login=False):
+        """Instalar flujos en paralelo; devuelve resultados en el mismo orden
+        `login`: flujos de un login, con preferencia en el token bucket"""
+        futures = self._dispatch('POST', flows, deadline, login)
+        return [future.result() for future in futures]
+    
+    def remove(self, flow_keys, deadline=None):
+        """Borrar flujos (switch, nombre) en paralelo (trabajo de fondo: logout, expiración...)
+        Floodlight borra por nombre, así que se envía un DELETE por nombre distinto"""
+        by_name = {}
+        for switch_dpid, flow_name in flow_keys:
+            by_name.setdefault(flow_name, switch_dpid)
+        
+        futures = self._dispatch('DELETE', [{'name': name, 'switch': switch_dpid}
+                                            for name, switch_dpid in by_name.items()], deadline, False)
+        return [future.result() for future in futures]
+    
+    def list_flows(self, timeout=10):
+        """Flujos estáticos instalados en Floodlight: {switch: {nombre: flujo}}"""
+        response = self.session.get(f"{self.FLOODLIGHT_URL}/wm/staticflowpusher/list/all/json", timeout=timeout)
+        response.raise_for_status()
+        
+        table = {}
+        for switch_dpid, entries in response.json().items():
+            flows = table.setdefault(switch_dpid, {})
+            for entry in entries:
+                flows.update(entry)
+        return table
+    
+    def list_switch_flows(self, switch_dpid, timeout=10):
+        """Flujos estáticos de un solo switch: {nombre: flujo}"""
+        response = self.session.get(f"{self.FLOODLIGHT_URL}/wm/staticflowpusher/list/{switch_dpid}/json",
+                                    timeout=timeout)
+        response.raise_for_status()
+        
+        flows = {}
+        for entry in response.json().get(switch_dpid, []):
+            flows.update(entry)
+        return flows
+    
+    def close(self):
+        """Liberar hilos y conexiones"""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+class FloodlightHealthMonitor:
+    """Sondeo periódico de Floodlight con circuit breaker
+    Las rutas consultan el último estado en memoria en lugar de hacer un GET por petición"""
+    
+    def __init__(self, floodlight_url, interval=5, timeout=3, max_staleness=15, failure_threshold=3, on_switches=None):
+        self.SWITCHES_URL = f"{floodlight_url}/wm/core/controller/switches/json"
+        self.on_switches = on_switches            # Recibe la lista de switches de cada sondeo correcto
+        self.interval = interval
+        self.timeout = timeout
+        self.max_staleness = max_staleness        # Segundos antes de desconfiar del último sondeo
+        self.failure_threshold = failure_threshold  # Fallos seguidos que abren el circuito
+        
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        
+        self.snapshot = {
+            'connected': False,
+            'latency': None,
+            'switch_count': 0,
+            'checked_at': 0.0,
+            'error': 'not probed yet'
+        }
+        self.consecutive_failures = 0
+        self.circuit_open = False
+    
+    def probe(self):
+        """Consultar Floodlight una vez y actualizar el estado"""
+        start = time.perf_counter()
+        switches = None
+        switch_count = 0
+        error = None
+        try:
+            response = self.session.get(self.SWITCHES_URL, timeout=self.timeout)
+            if response.status_code == 200:
+                switches = response.json()
+                switch_count = len(switches)
+            else:
+                error = f"HTTP {response.status_code}"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = str(e)
+        
+        connected = error is None
+        with self.lock:
+            self.snapshot = {
+                'connected': connected,
+                'latency': time.perf_counter() - start,
+                'switch_count': switch_count,
+                'checked_at': time.time(),
+                'error': error
+            }
+        
+        if connected:
+            self.record_success()
+            if self.on_switches is not None:
+                try:
+                    self.on_switches(switches)
+                except Exception as e:
+                    logger.error(f"Error updating switch inventory: {e}")
+        else:
+            self.record_failure(error)
+        return connected
+    
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            if self.circuit_open:
+                self.circuit_open = False
+                logger.info("✅ Floodlight reachable again, circuit closed")
+    
+    def record_failure(self, error=None):
+        """Registrar un fallo de transporte (sondeo o push de flujos)"""
+        with self.lock:
+            self.consecutive_failures += 1
+            if not self.circuit_open and self.consecutive_failures >= self.failure_threshold:
+                self.circuit_open = True
+                logger.warning(f"⚠️ Floodlight failed {self.consecutive_failures} times, circuit open: {error}")
+    
+    def is_stale(self):
+        return time.time() - self.snapshot['checked_at'] > self.max_staleness
+    
+    def is_available(self):
+        """Floodlight conectado según un sondeo reciente y circuito cerrado"""
+        with self.lock:
+            return self.snapshot['connected'] and not self.circuit_open and not self.is_stale()
+    
+    def get_snapshot(self):
+        """Último estado conocido con su antigüedad"""
+        with self.lock:
+            snapshot = dict(self.snapshot)
+            snapshot['age'] = time.time() - snapshot['checked_at'] if snapshot['checked_at'] else None
+            snapshot['stale'] = self.is_stale()
+            snapshot['circuit'] = 'open' if self.circuit_open else 'closed'
+            snapshot['consecutive_failures'] = self.consecutive_failures
+        return snapshot
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.probe()
+            except Exception as e:
+                logger.error(f"Error in Floodlight health probe: {e}")
+            self.stop_event.wait(self.interval)
+    
+    def start(self):
+        """Iniciar el sondeo en un hilo de fondo"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='floodlight-health', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+
+class FlowRegistry:
+    """Registro de los flujos instalados para cada usuario
+    Indexado por IP de cliente, MAC, switch y nombre de flujo"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_client = {}         # client_ip -> {'mac_address': mac, 'flows': {switch: {name}}, 'count': n}
+        self.by_mac = {}            # mac -> client_ip
+        self.by_switch = {}         # switch -> {client_ip}
+        self.pending_removal = set()  # (switch, name) cuyo borrado falló y se reintentará
+        self.total = 0              # Flujos registrados, mantenido en cada alta/baja
+    
+    def add(self, client_ip, mac_address, flows):
+        """Registrar flujos instalados (dicts o resultados con 'switch' y 'name')"""
+        self.add_keys(client_ip, mac_address, [(flow['switch'], flow['name']) for flow in flows])
+    
+    def add_keys(self, client_ip, mac_address, flow_keys):
+        """Registrar flujos (switch, nombre) de un usuario"""
+        flows_by_switch = {}
+        for switch_dpid, flow_name in flow_keys:
+            flows_by_switch.setdefault(switch_dpid, []).append(flow_name)
+        self.add_grouped(client_ip, mac_address, flows_by_switch)
+    
+    def add_grouped(self, client_ip, mac_address, flows_by_switch):
+        """Registrar flujos de un usuario agrupados como {switch: [nombres]}"""
+        with self.lock:
+            entry = self.by_client.get(client_ip)
+            if entry is None:
+                entry = self.by_client[client_ip] = {'mac_address': mac_address, 'flows': {}, 'count': 0}
+            entry['mac_address'] = mac_address
+            if mac_address:
+                self.by_mac[mac_address] = client_ip
+            
+            for switch_dpid, names in flows_by_switch.items():
+                switch_flows = entry['flows'].get(switch_dpid)
+                if switch_flows is None:
+                    switch_flows = entry['flows'][switch_dpid] = set()
+                    self.by_switch.setdefault(switch_dpid, set()).add(client_ip)
+                before = len(switch_flows)
+                switch_flows.update(names)
+                added = len(switch_flows) - before
+                entry['count'] += added
+                self.total += added
+                
+                if self.pending_removal:
+                    self.pending_removal.difference_update((switch_dpid, name) for name in names)
+    
+    def pop_client(self, client_ip):
+        """Quitar un usuario del registro; devuelve sus flujos (switch, nombre)"""
+        with self.lock:
+            entry = self.by_client.pop(client_ip, None)
+            if entry is None:
+                return []
+            
+            self.total -= entry['count']
+            if self.by_mac.get(entry['mac_address']) == client_ip:
+                del self.by_mac[entry['mac_address']]
+            for switch_dpid in entry['flows']:
+                switch_clients = self.by_switch.get(switch_dpid)
+                if switch_clients is not None:
+                    switch_clients.discard(client_ip)
+                    if not switch_clients:
+                        del self.by_switch[switch_dpid]
+            
+            return [(switch_dpid, name) for switch_dpid, names in entry['flows'].items() for name in names]
+    
+    def mark_failed(self, flow_keys):
+        """Guardar flujos que no se pudieron borrar para reintentarlo"""
+        with self.lock:
+            self.pending_removal.update(flow_keys)
+    
+    def pop_pending(self):
+        with self.lock:
+            pending = list(self.pending_removal)
+            self.pending_removal.clear()
+            return pending
+    
+    def flows_for(self, client_ip):
+        """Flujos (switch, nombre) registrados para un usuario"""
+        with self.lock:
+            entry = self.by_client.get(client_ip)
+            if entry is None:
+                return []
+            return [(switch_dpid, name) for switch_dpid, names in entry['flows'].items() for name in names]
+    
+    def grouped_flows_for(self, client_ip):
+        """Flujos de un usuario como {switch: [nombres]}"""
+        with self.lock:
+            entry = self.by_client.get(client_ip)
+            if entry is None:
+                return {}
+            return {switch_dpid: sorted(names) for switch_dpid, names in entry['flows'].items()}
+    
+    def client_for_mac(self, mac_address):
+        with self.lock:
+            return self.by_mac.get(mac_address)
+    
+    def mac_for(self, client_ip):
+        with self.lock:
+            entry = self.by_client.get(client_ip)
+            return entry['mac_address'] if entry else None
+    
+    def clients(self, switch_dpid=None):
+        """IPs con flujos registrados (en un switch concreto si se indica)"""
+        with self.lock:
+            if switch_dpid is not None:
+                return list(self.by_switch.get(switch_dpid, ()))
+            return list(self.by_client)
+    
+    def flows_on_switch(self, switch_dpid):
+        """Flujos (client_ip, nombre) registrados en un switch"""
+        with self.lock:
+            return {
+                (client_ip, name)
+                for client_ip in self.by_switch.get(switch_dpid, ())
+                for name in self.by_client[client_ip]['flows'][switch_dpid]
+            }
+    
+    def count(self):
+        return self.total
+    
+    def count_for(self, client_ip):
+        with self.lock:
+            entry = self.by_client.get(client_ip)
+            return entry['count'] if entry else 0
+    
+    def snapshot(self):
+        """Nombres de flujos por usuario, en el formato de /api/flows"""
+        with self.lock:
+            return {
+                client_ip: sorted(set().union(*entry['flows'].values()))
+                for client_ip, entry in self.by_client.items()
+            }
+
+class LoginCoalescer:
+    """Notificaciones de login en curso por (client_ip, mac, rol, usuario)
+    Los duplicados (doble envío del formulario, reintentos del portal) esperan el
+    resultado del primero en lugar de volver a instalar los flujos"""
+    
     def __init__(self):
+        self.in_flight = {}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def key(user_data):
+        return (user_data['client_ip'], user_data['mac_address'].lower(), user_data['role'], user_data['username'])
+    
+    def claim(self, key):
+        """(future, True) si esta llamada debe hacer la instalación; (future del dueño, False) si ya hay una en curso"""
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = self.in_flight[key] = Future()
+            return future, True
+    
+    def release(self, key, future):
+        with self.lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+    
+    def count(self):
+        return len(self.in_flight)
+
+class FlowReconciler:
+    """Reconciliación periódica e incremental con Floodlight
+    Revisa un switch por turno y solo aplica las altas/bajas necesarias. Una
+    diferencia se corrige cuando aparece en dos pasadas seguidas, para no
+    tocar flujos de un login o logout que está en curso"""
+    
+    def __init__(self, controller, interval=60, max_changes=500):
+        self.controller = controller
+        self.interval = interval          # Segundos para recorrer todos los switches
+        self.max_changes = max_changes    # Altas + bajas máximas por switch y pasada
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.suspected = {}               # switch -> {'missing': nombres, 'orphans': nombres}
+        self.stats = {
+            'passes': 0,
+            'errors': 0,
+            'reinstalled': 0,
+            'removed': 0,
+            'drift': {'missing': 0, 'orphans': 0},
+            'last_duration': None,
+            'last_cycle_duration': None,
+            'last_reconcile_at': None,
+            'by_switch': {}
+        }
+    
+    def reconcile_switch(self, switch_dpid):
+        """Una pasada sobre un switch; devuelve el resumen o None si Floodlight no respondió"""
+        start = time.perf_counter()
+        previous = self.suspected.get(switch_dpid, {'missing': set(), 'orphans': set()})
+        result = self.controller.reconcile_switch(switch_dpid, confirmed=previous, max_changes=self.max_changes)
+        duration = time.perf_counter() - start
+        
+        with self.lock:
+            if result is None:
+                self.stats['errors'] += 1
+                return None
+            
+            self.suspected[switch_dpid] = {'missing': result['missing'], 'orphans': result['orphans']}
+            self.stats['passes'] += 1
+            self.stats['reinstalled'] += result['reinstalled']
+            self.stats['removed'] += result['removed']
+            self.stats['last_duration'] = duration
+            self.stats['last_reconcile_at'] = time.time()
+            self.stats['by_switch'][switch_dpid] = {
+                'missing': len(result['missing']),
+                'orphans': len(result['orphans']),
+                'duration': duration
+            }
+            self.stats['drift'] = {
+                'missing': sum(entry['missing'] for entry in self.stats['by_switch'].values()),
+                'orphans': sum(entry['orphans'] for entry in self.stats['by_switch'].values())
+            }
+        return result
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            switches = list(self.controller.SWITCHES.keys())
+            cycle_duration = 0.0
+            for switch_dpid in switches:
+                if self.stop_event.is_set():
+                    return
+                # Un switch por turno: la carga sobre Floodlight queda repartida en el intervalo
+                if self.controller.health_monitor.is_available():
+                    try:
+                        self.reconcile_switch(switch_dpid)
+                        cycle_duration += self.stats['by_switch'].get(switch_dpid, {}).get('duration', 0.0)
+                    except Exception as e:
+                        logger.error(f"Error reconciling switch {switch_dpid}: {e}")
+                self.stop_event.wait(self.interval / max(len(switches), 1))
+            with self.lock:
+                self.stats['last_cycle_duration'] = cycle_duration
+    
+    def start(self):
+        """Iniciar la reconciliación en un hilo de fondo"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='flow-reconciler', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def forget_switch(self, switch_dpid):
+        """Olvidar las sospechas y métricas de un switch que se conectó o desconectó"""
+        with self.lock:
+            self.suspected.pop(switch_dpid, None)
+            self.stats['by_switch'].pop(switch_dpid, None)
+    
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['by_switch'] = {switch: dict(entry) for switch, entry in self.stats['by_switch'].items()}
+            return stats
+
+class SDNController:
+    def __init__(self, floodlight_url="http://192.168.200.200:8080", state_store=None, flow_aggregation='per_user',
+                 flow_placement='all', provisioning='inline', flow_push_rate=None):
         # Configuración de Floodlight
-        self.FLOODLIGHT_URL = "http://192.168.200.200:8080"  # SDN interno
+        self.FLOODLIGHT_URL = floodlight_url  # SDN interno
         
         # Configuración del controlador
         self.CONTROLLER_IP = "0.0.0.0"  # Escuchar en todas las interfaces
         self.CONTROLLER_PORT = 8081
         
+        # Configuración del motor de instalación de flujos
+        self.FLOW_PUSH_WORKERS = 32         # Conexiones/hilos simultáneos hacia Floodlight
+        self.FLOW_PUSH_PER_SWITCH = 4       # Flujos simultáneos por switch
+        self.FLOW_PUSH_TIMEOUT = 5          # Segundos por flujo
+        self.FLOW_PUSH_RATE = flow_push_rate            # Escrituras/s en Floodlight (None: sin límite)
+        self.FLOW_PUSH_BURST = flow_push_rate // 5 if flow_push_rate else None  # Ráfaga de 200 ms
+        self.FLOW_PUSH_MAX_WAIT = 2         # Deuda máxima del bucket: más espera y el flujo de un login falla
+        self.FLOW_PUSH_LOGIN_RESERVE = self.FLOW_PUSH_BURST // 2 if flow_push_rate else 0  # Tokens solo para logins
+        self.flow_push_limiter = TokenBucket(self.FLOW_PUSH_RATE, self.FLOW_PUSH_BURST, max_wait=self.FLOW_PUSH_MAX_WAIT,
+                                             reserved=self.FLOW_PUSH_LOGIN_RESERVE) if flow_push_rate else None
+        self.flow_pusher = FloodlightFlowPusher(
+            self.FLOODLIGHT_URL,
+            max_workers=self.FLOW_PUSH_WORKERS,
+            per_switch_concurrency=self.FLOW_PUSH_PER_SWITCH,
+            timeout=self.FLOW_PUSH_TIMEOUT,
+            rate_limiter=self.flow_push_limiter
+        )
+        
+        # Sondeo de Floodlight en segundo plano con circuit breaker
+        self.HEALTH_CHECK_INTERVAL = 5      # Segundos entre sondeos
+        self.HEALTH_CHECK_TIMEOUT = 3       # Timeout de cada sondeo
+        self.HEALTH_MAX_STALENESS = 15      # Antigüedad máxima aceptable del último sondeo
+        self.CIRCUIT_FAILURE_THRESHOLD = 3  # Fallos seguidos antes de pasar a modo degradado
+        self.health_monitor = FloodlightHealthMonitor(
+            self.FLOODLIGHT_URL,
+            interval=self.HEALTH_CHECK_INTERVAL,
+            timeout=self.HEALTH_CHECK_TIMEOUT,
+            max_staleness=self.HEALTH_MAX_STALENESS,
+            failure_threshold=self.CIRCUIT_FAILURE_THRESHOLD
+        )
+        
         # Almacenamiento de usuarios activos y flujos
         self.active_users = {}
-        self.installed_flows = {}
-        
-        # Configuración de switches - BASADA EN TUS SWITCHES REALES
-        self.SWITCHES = {
-            # Switch 1 - IP: 192.168.200.202
-            "00:00:72:e0:80:7e:85:4c": {
-                "name": "Switch-1",
-                "ip": "192.168.200.202",
-                "ports": {
-                    1: "trunk_port",
-                    2: "access_port_1", 
-                    3: "access_port_2",
-                    4: "access_port_3"
-                }
-            },
-            
-            # Switch 2 - IP: 192.168.200.203  
-            "00:00:f2:20:f9:45:4c:4e": {
-                "name": "Switch-2", 
-                "ip": "192.168.200.203",
-                "ports": {
-                    1: "trunk_port",
-                    2: "access_port_1",
-                    3: "access_port_2", 
-                    4: "access_port_3"
-                }
-            },
-            
-            # Switch 3 - IP: 192.168.200.205
-            "00:00:1a:74:72:3f:ef:44": {
-                "name": "Switch-3",
-                "ip": "192.168.200.205", 
-                "ports": {
-                    1: "trunk_port",
-                    2: "access_port_1",
-                    3: "access_port_2",
-                    4: "access_port_3"
-                }
-            },
-            
-            # Switch 4 - IP: 192.168.200.201
-            "00:00:5e:c7:6e:c6:11:4c": {
-                "name": "Switch-4",
-                "ip": "192.168.200.201",
-                "ports": {
-                    1: "trunk_port", 
-                    2: "access_port_1",
-                    3: "access_port_2",
-                    4: "access_port_3"
-                }
-            },
-            
-            # Switch 5 - IP: 192.168.200.204
-            "00:00:aa:51:aa:ba:72:41": {
-                "name": "Switch-5",
-                "ip": "192.168.200.204",
-                "ports": {
-                    1: "trunk_port",
-                    2: "access_port_1", 
-                    3: "access_port_2",
-                    4: "access_port_3"
-                }
-            }
+        self.users_lock = threading.Lock()
+        self.users_by_role = {}             # Contadores por rol, mantenidos en cada alta/baja
+        self.expiry_queue = ExpiryQueue()   # Sesiones ordenadas por expires_at
+        self.EXPIRY_CHECK_INTERVAL = 1      # Segundos entre revisiones de expiración
+        self.flow_registry = FlowRegistry()
+        self.login_coalescer = LoginCoalescer()  # Notificaciones duplicadas se unen a la instalación en curso
+        
+        # Agregación de flujos: 'per_user' (eth_src por usuario) o 'per_role' (flujos
+        # compartidos por rol y VLAN; por usuario solo la excepción de bloqueo)
+        if flow_aggregation not in ('per_user', 'per_role'):
+            raise ValueError(f"Unknown flow aggregation mode: {flow_aggregation}")
+        self.FLOW_AGGREGATION = flow_aggregation
+        self.role_groups = {}               # (rol, vlan) -> {client_ip}
+        self.group_of = {}                  # client_ip -> (rol, vlan)
+        self.role_groups_lock = threading.Lock()
+        
+        # Persistencia de sesiones y flujos entre reinicios
+        self.state_store = state_store or MemoryStateStore()
+        
+        # Aprovisionamiento de logins: 'inline' (la notificación espera a Floodlight) o
+        # 'queued' (respuesta inmediata con un ID; un conjunto de workers instala los flujos)
+        if provisioning not in ('inline', 'queued'):
+            raise ValueError(f"Unknown provisioning mode: {provisioning}")
+        self.PROVISIONING = provisioning
+        self.PROVISIONING_WORKERS = 4           # Logins instalándose a la vez
+        self.PROVISIONING_MAX_PENDING = 5000    # Logins en cola antes de responder 503
+        self.PROVISIONING_SHED_PENDING = 1000   # Con esta cola solo se admiten roles prioritarios...
+        self.PROVISIONING_SHED_BELOW_PRIORITY = 500  # ...de prioridad >= 500 (GUEST e IOT esperan)
+        self.PROVISIONING_RETRY_AFTER = 2       # Segundos sugeridos al portal tras un 503
+        self.provisioning = ProvisioningQueue(
+            self.state_store,
+            max_pending=self.PROVISIONING_MAX_PENDING,
+            shed_pending=self.PROVISIONING_SHED_PENDING,
+            shed_below_priority=self.PROVISIONING_SHED_BELOW_PRIORITY
+        )
+        self.provisioning_jobs = queue.PriorityQueue()  # (-prioridad, llegada, id) para los workers con hilos
+        
+        # Borrado masivo de flujos (logout/expiración)
+        self.FLOW_REMOVAL_DEADLINE = 30     # Segundos máximos por lote de borrado
+        self.flow_removal_lock = threading.Lock()
+        self.flow_removal_stats = {
+            'removed': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch': None
         }
         
+        # Reconciliación periódica con la tabla de flujos de Floodlight
+        self.RECONCILE_INTERVAL = 60        # Segundos para recorrer todos los switches
+        self.RECONCILE_MAX_CHANGES = 500    # Altas + bajas máximas por switch y pasada
+        self.reconciler = FlowReconciler(self, interval=self.RECONCILE_INTERVAL,
+                                         max_changes=self.RECONCILE_MAX_CHANGES)
+        
+        # Switches conocidos (KNOWN_SWITCHES); los switches en uso los mantiene el inventario
+        self.KNOWN_SWITCHES = KNOWN_SWITCHES
+        self.switch_inventory = SwitchInventory(self.FLOODLIGHT_URL, seed=self.KNOWN_SWITCHES,
+                                                timeout=self.HEALTH_CHECK_TIMEOUT)
+        self.switch_inventory.subscribe(on_join=self.on_switch_join, on_leave=self.on_switch_leave)
+        self.health_monitor.on_switches = self.switch_inventory.update  # Cada sondeo refresca el inventario
+        
+        # Ubicación de flujos: 'all' (en todos los switches) o 'topology' (políticas del rol
+        # en el switch de acceso y solo la excepción en los del camino hasta el uplink)
+        if flow_placement not in ('all', 'topology'):
+            raise ValueError(f"Unknown flow placement mode: {flow_placement}")
+        self.FLOW_PLACEMENT = flow_placement
+        self.UPLINK_SWITCH = "00:00:72:e0:80:7e:85:4c"  # Switch-1: salida hacia el router y el portal
+        self.TOPOLOGY_REFRESH_INTERVAL = 10             # Segundos entre lecturas de dispositivos y enlaces
+        self.topology = None
+        if flow_placement == 'topology':
+            self.topology = TopologyCache(
+                self.FLOODLIGHT_URL,
+                self.UPLINK_SWITCH,
+                interval=self.TOPOLOGY_REFRESH_INTERVAL,
+                timeout=self.HEALTH_CHECK_TIMEOUT,
+                on_change=self.refresh_placements
+            )
+        
         # Políticas de flujos por rol
         self.FLOW_POLICIES = {
             'ROLE_ADMIN': {
@@ -149,155 +810,817 @@ class SDNController:
                 ]
             }
         }
+        
+        # Plantillas precompiladas por rol (se regeneran con reload_flow_policies)
+        self.compiled_policies = self.compile_flow_policies(self.FLOW_POLICIES)
+        
+        REGISTRY.gauge('sdn_controller_active_users', 'Usuarios activos', lambda: len(self.active_users))
+        REGISTRY.gauge('sdn_controller_installed_flows', 'Flujos en el registro', self.flow_registry.count)
+        REGISTRY.gauge('sdn_controller_live_switches', 'Switches conectados', lambda: len(self.SWITCHES))
+        REGISTRY.gauge('sdn_controller_provisioning_pending', 'Logins en la cola de aprovisionamiento',
+                       lambda: self.provisioning.pending)
+        REGISTRY.gauge('sdn_controller_provisioning_queue_depth', 'Logins esperando worker por rol',
+                       self.provisioning.queue_depth_by_role, ['role'])
     
-    def test_floodlight_connection(self):
-        """Verificar conectividad con Floodlight"""
-        try:
-            response = requests.get(f"{self.FLOODLIGHT_URL}/wm/core/controller/switches/json", timeout=10)
-            if response.status_code == 200:
-                switches = response.json()
-                logger.info(f"Connected to Floodlight. Found {len(switches)} switches")
-                return True
-            else:
-                logger.error(f"Floodlight connection failed: HTTP {response.status_code}")
+    @property
+    def SWITCHES(self):
+        """Switches conectados ahora mismo: índice DPID -> metadatos del inventario"""
+        return self.switch_inventory.live
+    
+    def on_switch_join(self, switch_dpid):
+        """Un switch se conectó: instalar en segundo plano los flujos que le faltan
+        Los huérfanos quedan para la reconciliación periódica (doble confirmación)"""
+        self.reconciler.forget_switch(switch_dpid)
+        threading.Thread(target=self.reconcile_switch, args=(switch_dpid,), kwargs={'add_only': True},
+                         name='switch-join', daemon=True).start()
+    
+    def on_switch_leave(self, switch_dpid):
+        """Un switch se desconectó: deja de recibir flujos hasta que vuelva
+        Sus entradas del registro se conservan y se contrastan al reconectar"""
+        self.reconciler.forget_switch(switch_dpid)
+    
+    # Traducción de los campos de match de FLOW_POLICIES al formato Floodlight
+    MATCH_FIELDS = {
+        'tp-dst': ('tp_dst', {'ip_proto': '6'}),   # TCP
+        'tp-src': ('tp_src', {'ip_proto': '6'}),   # TCP
+        'nw-dst': ('ipv4_dst', {}),
+        'nw-src': ('ipv4_src', {}),
+        'ip-proto': ('ip_proto', {})
+    }
+    
+    def compile_flow_template(self, flow_template, policy):
+        """Convertir una entrada de FLOW_POLICIES en un flujo Floodlight a falta de switch, MAC y VLAN"""
+        flow = {
+            "switch": None,
+            "name": None,
+            "priority": str(flow_template.get('priority', policy['priority'])),
+            "eth_src": None,
+            "eth_type": "0x0800",  # IPv4
+            "active": "true"
+        }
+        
+        # Criterios de match (soportar múltiples condiciones)
+        for item in (flow_template.get('match') or '').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if '=' not in item:
+                raise ValueError(f"Invalid match '{item}' in flow {flow_template['name']}")
+            key, value = item.split('=', 1)
+            key = key.strip()
+            if key not in self.MATCH_FIELDS:
+                raise ValueError(f"Unsupported match field '{key}' in flow {flow_template['name']}")
+            field, implied = self.MATCH_FIELDS[key]
+            flow.update(implied)
+            flow[field] = value.strip()
+        
+        # Configurar acción
+        action = flow_template['action']
+        if action == "drop":
+            flow["actions"] = ""  # Sin acción = drop
+        else:
+            flow["actions"] = action
+        
+        return flow_template['name'], flow
+    
+    def compile_flow_policies(self, policies):
+        """Precompilar las plantillas de flujos de todos los roles"""
+        return {
+            role: [self.compile_flow_template(flow_template, policy) for flow_template in policy['flows']]
+            for role, policy in policies.items()
+        }
+    
+    def reload_flow_policies(self, policies):
+        """Sustituir FLOW_POLICIES; las plantillas se validan antes de activarse"""
+        compiled = self.compile_flow_policies(policies)
+        self.FLOW_POLICIES = policies
+        self.compiled_policies = compiled
+        logger.info(f"Flow policies reloaded: {len(policies)} roles")
+    
+    def aggregation_group(self, user_data):
+        """Grupo (rol, vlan) cuyos flujos comparte el usuario, o None si lleva flujos propios
+        Sin VLAN no hay forma de distinguir el tráfico del rol y se usan flujos por usuario"""
+        if self.FLOW_AGGREGATION != 'per_role':
+            return None
+        vlan_id = user_data.get('vlan_id')
+        if not vlan_id or str(vlan_id) == '0':
+            return None
+        role = user_data['role'] if user_data['role'] in self.compiled_policies else 'ROLE_GUEST'
+        return role, str(vlan_id)
+    
+    def group_registry_key(self, group):
+        """Clave del registro de flujos bajo la que se anotan los flujos de un grupo"""
+        return f"group:{group[0]}:{group[1]}"
+    
+    def switch_flow_name(self, name, switch_dpid):
+        """Nombre de un flujo en un switch concreto
+        Floodlight identifica los flujos estáticos solo por nombre: el mismo nombre en otro
+        switch reemplaza al anterior, así que cada nombre lleva el DPID de su switch"""
+        return f"{name}_{switch_dpid.replace(':', '')}"
+    
+    def generate_role_group_flows(self, group):
+        """Flujos de un rol para todos sus usuarios de una VLAN: match por vlan_vid, sin eth_src
+        El aislamiento depende de que la VLAN la asigne la red (RADIUS), no el cliente"""
+        role, vlan_vid = group
+        flows = []
+        for switch_dpid in self.SWITCHES.keys():
+            for name, template in self.compiled_policies[role]:
+                flow = template.copy()
+                del flow["eth_src"]
+                flow["switch"] = switch_dpid
+                flow["name"] = self.switch_flow_name(f"{name}_v{vlan_vid}", switch_dpid)
+                flow["vlan_vid"] = vlan_vid
+                flows.append(flow)
+        return flows
+    
+    def join_role_group(self, client_ip, group):
+        """Añadir un usuario a su grupo; True si es el primero (hay que instalar los flujos)"""
+        with self.role_groups_lock:
+            previous = self.group_of.get(client_ip)
+            if previous == group:
                 return False
-        except Exception as e:
-            logger.error(f"Cannot connect to Floodlight: {e}")
-            return False
+            if previous is not None:
+                self.role_groups[previous].discard(client_ip)
+            members = self.role_groups.setdefault(group, set())
+            members.add(client_ip)
+            self.group_of[client_ip] = group
+            return len(members) == 1 and not self.flow_registry.count_for(self.group_registry_key(group))
+    
+    def leave_role_group(self, client_ip):
+        """Sacar a un usuario de su grupo; devuelve el grupo si quedó vacío"""
+        with self.role_groups_lock:
+            group = self.group_of.pop(client_ip, None)
+            if group is None:
+                return None
+            members = self.role_groups.get(group)
+            members.discard(client_ip)
+            if members:
+                return None
+            del self.role_groups[group]
+            return group
+    
+    def release_user_flows(self, client_ips):
+        """Quitar del registro los flujos de estos usuarios y los de grupos que quedan vacíos"""
+        flow_keys = []
+        for client_ip in client_ips:
+            flow_keys.extend(self.flow_registry.pop_client(client_ip))
+            group = self.leave_role_group(client_ip)
+            if group is not None:
+                flow_keys.extend(self.flow_registry.pop_client(self.group_registry_key(group)))
+        return flow_keys
+    
+    def role_flows_for_user(self, client_ip, user_data):
+        """Flujos de rol que hay que instalar en el login de un usuario
+        Devuelve (clave del registro, MAC a anotar, flujos)"""
+        group = self.aggregation_group(user_data)
+        if group is None:
+            return client_ip, user_data['mac_address'], self.generate_flows_for_user(
+                user_data, self.edge_switches(user_data.get('switches')))
+        if self.join_role_group(client_ip, group):
+            return self.group_registry_key(group), None, self.generate_role_group_flows(group)
+        return self.group_registry_key(group), None, []
+    
+    def place_user(self, user_data):
+        """Decidir en qué switches van los flujos de un usuario y anotarlo en user_data['switches']
+        Lista con el switch de acceso primero y después el camino al uplink; None = todos"""
+        switches = None
+        if self.topology is not None:
+            path = self.topology.placement(user_data['mac_address'])
+            if path and all(switch_dpid in self.SWITCHES for switch_dpid in path):
+                switches = path
+        user_data['switches'] = switches
+        return switches
+    
+    def edge_switches(self, switches):
+        """Switches que llevan las políticas del rol: solo el de acceso si el usuario está ubicado"""
+        return switches[:1] if switches else None
     
-    # ...existing code...
-    def generate_flows_for_user(self, user_data):
-        """Generar flujos SDN específicos para un usuario según su rol"""
+    def generate_flows_for_user(self, user_data, switches=None):
+        """Generar flujos SDN específicos para un usuario según su rol
+        Sin `switches` se generan para todos los switches configurados"""
         role = user_data['role']
         mac_address = user_data['mac_address']
-        client_ip = user_data['client_ip']
         vlan_id = user_data['vlan_id']
         
-        if role not in self.FLOW_POLICIES:
+        if role not in self.compiled_policies:
             logger.warning(f"Unknown role {role}, using GUEST policy")
             role = 'ROLE_GUEST'
         
-        policy = self.FLOW_POLICIES[role]
+        templates = self.compiled_policies[role]
+        mac_suffix = mac_address.replace(':', '')
+        vlan_vid = str(vlan_id) if vlan_id and vlan_id != '0' else None
         flows = []
         
-        # Generar flujos para cada switch
-        for switch_dpid in self.SWITCHES.keys():
-            for flow_template in policy['flows']:
-                flow = {
-                    "switch": switch_dpid,
-                    "name": f"{flow_template['name']}_{mac_address.replace(':', '')}",
-                    "priority": str(flow_template.get('priority', policy['priority'])),
-                    "eth_src": mac_address,
-                    "eth_type": "0x0800",  # IPv4
-                    "active": "true"
-                }
-                
-                # Agregar criterios de match si existen (soportar múltiples condiciones)
-                if 'match' in flow_template and flow_template['match']:
-                    match_items = flow_template['match'].split(',')
-                    for item in match_items:
-                        item = item.strip()
-                        if '=' in item:
-                            key, value = item.split('=', 1)
-                            key = key.strip()
-                            value = value.strip()
-                            # Mapear campos a formato Floodlight
-                            if key == "tp-dst":
-                                flow["ip_proto"] = "6"  # TCP
-                                flow["tp_dst"] = value
-                            elif key == "tp-src":
-                                flow["ip_proto"] = "6"  # TCP
-                                flow["tp_src"] = value
-                            elif key == "nw-dst":
-                                flow["ipv4_dst"] = value
-                            elif key == "nw-src":
-                                flow["ipv4_src"] = value
-                            elif key == "ip-proto":
-                                flow["ip_proto"] = value
-                
-                # Configurar acción
-                action = flow_template['action']
-                if action == "output=normal":
-                    flow["actions"] = "output=normal"
-                elif action == "drop":
-                    flow["actions"] = ""  # Sin acción = drop
-                else:
-                    flow["actions"] = action
+        # Generar flujos para cada switch sustituyendo solo los campos del usuario
+        for switch_dpid in switches or self.SWITCHES.keys():
+            for name, template in templates:
+                flow = template.copy()
+                flow["switch"] = switch_dpid
+                flow["name"] = self.switch_flow_name(f"{name}_{mac_suffix}", switch_dpid)
+                flow["eth_src"] = mac_address
                 
                 # Agregar VLAN si corresponde
-                if vlan_id and vlan_id != '0':
-                    flow["vlan_vid"] = str(vlan_id)
+                if vlan_vid:
+                    flow["vlan_vid"] = vlan_vid
                 
                 flows.append(flow)
         
         return flows
     
-    def install_flows_to_floodlight(self, flows):
-        """Instalar flujos en Floodlight usando la API REST"""
-        FLOODLIGHT_URL = "http://192.168.200.200:8080/wm/staticflowpusher/json"
-        for flow in flows:
-            response = requests.post(
-                FLOODLIGHT_URL,
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(flow)
-            )
-            if response.status_code == 200:
-                print(f"✅ Flujo instalado: {flow['name']}")
+    def install_flows_to_floodlight(self, flows, role=None):
+        """Instalar flujos en Floodlight usando la API REST
+        Devuelve una lista de resultados con status, latency y error por flujo
+        Los flujos de un login llevan su rol y pasan antes que el trabajo de fondo"""
+        results = self.flow_pusher.push(flows, login=role is not None)
+        self.record_push_health(results)
+        self.record_push_metrics(results, role)
+        self.record_push_spans(results)
+        
+        for result in results:
+            if result['status'] == 'success':
+                logger.info(f"✅ Flujo instalado: {result['name']} en {result['switch']} ({result['latency'] * 1000:.1f} ms)")
             else:
-                print(f"❌ Error instalando {flow['name']}: {response.text}")
+                logger.error(f"❌ Error instalando {result['name']}: {result['error']}")
+        
+        return results
+    
+    def record_push_metrics(self, results, role=None):
+        """Latencia y errores por switch; `role` es None para flujos que no son de un login"""
+        role = role or 'none'
+        for result in results:
+            switch_dpid = result['switch'] or 'unknown'
+            FLOW_PUSH_SECONDS.observe(result['latency'], switch_dpid)
+            FLOWS_PUSHED_TOTAL.inc(role, switch_dpid)
+            if result['status'] != 'success':
+                FLOW_PUSH_ERRORS_TOTAL.inc(role, switch_dpid)
+    
+    def record_push_spans(self, results):
+        """Un span por POST a Floodlight en la traza del login en curso (si la hay)"""
+        if tracer.current_trace_id() is None:
+            return
+        for result in results:
+            if result['started'] is not None:
+                tracer.add_span('floodlight_post', result['started'], result['latency'],
+                                switch=result['switch'], flow=result['name'], status=result['status'])
     
-    def remove_flows_from_floodlight(self, flow_names):
-        """Remover flujos específicos de Floodlight"""
-        removed_count = 0
+    def record_push_health(self, results):
+        """Alimentar el circuit breaker: sin ninguna respuesta HTTP cuenta como fallo"""
+        if results and all(r['http_status'] is None for r in results):
+            self.health_monitor.record_failure(results[0]['error'])
+    
+    def remove_flows_from_floodlight(self, flow_keys, deadline=None):
+        """Remover flujos (switch, nombre) de Floodlight en paralelo
+        Devuelve una lista de resultados con status, latency y error por flujo"""
+        results = self.flow_pusher.remove(flow_keys, deadline=deadline)
+        self.record_push_health(results)
         
-        for flow_name in flow_names:
-            try:
-                # ✅ MÉTODO ALTERNATIVO: Usar DELETE con parámetros
-                url = f"{self.FLOODLIGHT_URL}/wm/staticflowpusher/json"
-                
-                # Crear payload para remover flujo específico
-                payload = {
-                    "name": flow_name,
-                    "switch": "all"  # O especificar switch específico
-                }
-
-
-                
-                response = requests.delete(url, json=payload, timeout=10)
-                
-                if response.status_code == 200:
-                    removed_count += 1
-                    logger.info(f"✅ Flow removed: {flow_name}")
-                else:
-                    logger.error(f"❌ Failed to remove flow {flow_name}: HTTP {response.status_code}")
-                    logger.debug(f"Response: {response.text}")
-                    
-            except Exception as e:
-                logger.error(f"❌ Error removing flow {flow_name}: {e}")
+        for result in results:
+            if result['status'] == 'success':
+                logger.info(f"✅ Flow removed: {result['name']}")
+            else:
+                logger.error(f"❌ Failed to remove flow {result['name']}: {result['error']}")
+        
+        return results
     
-        return removed_count
+    def remove_user_flows(self, client_ips):
+        """Borrar de una vez los flujos de varios usuarios (logout o expiración)
+        Incluye los borrados pendientes de lotes anteriores"""
+        start = time.perf_counter()
+        
+        # Reintentar borrados pendientes solo si Floodlight responde
+        flow_keys = self.flow_registry.pop_pending() if self.health_monitor.is_available() else []
+        flow_keys.extend(self.release_user_flows(client_ips))
+        
+        if not flow_keys:
+            return 0
+        
+        deadline = time.monotonic() + self.FLOW_REMOVAL_DEADLINE
+        results = self.remove_flows_from_floodlight(flow_keys, deadline=deadline)
+        return self.record_flow_removal(client_ips, flow_keys, results, time.perf_counter() - start)
+    
+    def record_flow_removal(self, client_ips, flow_keys, results, duration):
+        """Actualizar métricas de borrado y guardar los fallidos para reintentar"""
+        failed_names = {r['name'] for r in results if r['status'] != 'success'}
+        if failed_names:
+            self.flow_registry.mark_failed([key for key in flow_keys if key[1] in failed_names])
+        
+        removed = len(results) - len(failed_names)
+        with self.flow_removal_lock:
+            self.flow_removal_stats['removed'] += removed
+            self.flow_removal_stats['failed'] += len(failed_names)
+            self.flow_removal_stats['batches'] += 1
+            self.flow_removal_stats['last_batch'] = {
+                'users': len(client_ips),
+                'flow_names': len(results),
+                'removed': removed,
+                'failed': len(failed_names),
+                'duration': round(duration, 3)
+            }
+        
+        return removed
+    
+    def get_flow_removal_stats(self):
+        with self.flow_removal_lock:
+            return dict(self.flow_removal_stats)
+    
+    def pop_expired_users(self):
+        """Retirar usuarios expirados; devuelve (client_ip, user_data) de cada uno
+        Solo visita las sesiones vencidas gracias a la cola de expiración"""
+        expired = []
+        for client_ip in self.expiry_queue.pop_expired():
+            user_data = self.unregister_user(client_ip, cancel_expiry=False)
+            if user_data is not None:
+                expired.append((client_ip, user_data))
+        return expired
     
     def cleanup_expired_users(self):
         """Limpiar usuarios expirados y sus flujos"""
-        current_time = time.time()
-        expired_users = []
+        expired = self.pop_expired_users()
+        for client_ip, user_data in expired:
+            logger.info(f"Session expired for user {user_data['username']}")
         
-        for client_ip, user_data in self.active_users.items():
-            if current_time > user_data.get('expires_at', 0):
-                expired_users.append(client_ip)
+        # Remover flujos de todos los expirados en un único lote
+        removed = self.remove_user_flows([client_ip for client_ip, _ in expired])
+        if expired:
+            logger.info(f"Expired {len(expired)} sessions, removed {removed} flows")
+    
+    def register_user(self, user_data, degraded_mode=False):
+        """Guardar información de un usuario autenticado"""
+        session_timeout = user_data.get('session_timeout', 3600)
+        client_ip = user_data['client_ip']
+        now = time.time()
+        record = {
+            'username': user_data['username'],
+            'role': user_data['role'],
+            'mac_address': user_data['mac_address'],
+            'vlan_id': user_data.get('vlan_id'),
+            'authenticated_at': now,
+            'expires_at': now + session_timeout,
+            'session_timeout': session_timeout,
+            'degraded_mode': degraded_mode,
+            'switches': user_data.get('switches')
+        }
         
-        for client_ip in expired_users:
-            user_data = self.active_users[client_ip]
-            logger.info(f"Session expired for user {user_data['username']}")
+        self.activate_user(client_ip, record)
+        self.state_store.save_session(client_ip, record, self.flow_registry.grouped_flows_for(client_ip))
+    
+    def refresh_user_session(self, user_data):
+        """Re-login de una sesión activa con el mismo rol: solo se renueva su caducidad
+        Devuelve los flujos que ya dan acceso al usuario, o None si hay que instalarlos"""
+        client_ip = user_data['client_ip']
+        with self.users_lock:
+            record = self.active_users.get(client_ip)
+            if (record is None or record['degraded_mode'] or record['role'] != user_data['role']
+                    or record['username'] != user_data['username']
+                    or record['mac_address'].lower() != user_data['mac_address'].lower()
+                    or record.get('vlan_id') != user_data.get('vlan_id')):
+                return None
+        
+        group = self.group_of.get(client_ip)
+        owner_key = self.group_registry_key(group) if group is not None else client_ip
+        flows_installed = self.installed_flow_count(client_ip, owner_key, self.flow_registry.count_for(client_ip))
+        if flows_installed == 0:
+            return None
+        
+        session_timeout = user_data.get('session_timeout', record['session_timeout'])
+        record = dict(record, expires_at=time.time() + session_timeout, session_timeout=session_timeout)
+        self.activate_user(client_ip, record)
+        self.state_store.save_session(client_ip, record, self.flow_registry.grouped_flows_for(client_ip))
+        logger.info(f"🔁 Session refreshed for {user_data['username']} ({client_ip}), flows kept")
+        return flows_installed
+    
+    def authenticate_user(self, user_data):
+        """Configurar la red de un login y registrar la sesión, de forma idempotente:
+        un re-login con el mismo rol renueva la sesión y los duplicados simultáneos
+        devuelven el resultado de la instalación en curso"""
+        flows_installed = self.refresh_user_session(user_data)
+        if flows_installed is not None:
+            LOGIN_NOTIFICATIONS_TOTAL.inc('refreshed')
+            return flows_installed
+        
+        key = LoginCoalescer.key(user_data)
+        future, owner = self.login_coalescer.claim(key)
+        if not owner:
+            LOGIN_NOTIFICATIONS_TOTAL.inc('coalesced')
+            return future.result()
+        
+        try:
+            # Otra instalación pudo terminar entre la comprobación y claim()
+            flows_installed = self.refresh_user_session(user_data)
+            if flows_installed is not None:
+                LOGIN_NOTIFICATIONS_TOTAL.inc('refreshed')
+            else:
+                LOGIN_NOTIFICATIONS_TOTAL.inc('install')
+                flows_installed = self.user_authenticated_handler(user_data)
+                if flows_installed > 0:
+                    self.register_user(user_data)
+            future.set_result(flows_installed)
+            return flows_installed
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.login_coalescer.release(key, future)
+    
+    def submit_login(self, user_data, trace_id=None, parent_span_id=None):
+        """Aceptar un login en la cola de aprovisionamiento: (respuesta, código HTTP, cabeceras)"""
+        try:
+            job = self.provisioning.submit(user_data, LoginCoalescer.key(user_data), trace_id, parent_span_id,
+                                           priority=self.role_priority(user_data['role']))
+        except QueueFull as e:
+            logger.warning(f"⚠️ Provisioning queue full, deferring {user_data['username']} ({user_data['role']}): {e}")
+            return ({'status': 'error', 'message': 'Provisioning queue full, retry later'}, 503,
+                    {'Retry-After': str(self.PROVISIONING_RETRY_AFTER)})
+        body = dict(job, status='queued', status_url=f"/api/provisioning/{job['provisioning_id']}")
+        return body, 202, {}
+    
+    def role_priority(self, role):
+        """Prioridad de un rol en la cola de aprovisionamiento (la de sus políticas de flujos)"""
+        return self.FLOW_POLICIES.get(role, {}).get('priority', 0)
+    
+    @staticmethod
+    def provisioning_order(job):
+        """Clave de la cola de workers: mayor prioridad primero y, dentro del rol, por llegada"""
+        return (-job['priority'], job['created_at'], job['id'])
+    
+    def start_provisioning(self):
+        """Workers de la cola (modo 'queued') y logins pendientes de la ejecución anterior"""
+        if self.PROVISIONING != 'queued':
+            return
+        self.provisioning.dispatch = lambda job: self.provisioning_jobs.put(self.provisioning_order(job))
+        for i in range(self.PROVISIONING_WORKERS):
+            threading.Thread(target=self.provisioning_worker, name=f'provisioning-{i}', daemon=True).start()
+        self.provisioning.restore()
+    
+    def provisioning_worker(self):
+        while True:
+            _, _, job_id = self.provisioning_jobs.get()
+            try:
+                self.provision(job_id)
+            except Exception as e:
+                logger.error(f"❌ Error in provisioning worker: {e}")
+    
+    def provision(self, job_id):
+        """Instalar los flujos de un login aceptado por la cola; devuelve su estado final"""
+        job = self.provisioning.begin(job_id)
+        if job is None:
+            return None  # Logout antes de empezar
+        user_data = job['user_data']
+        client_ip = user_data['client_ip']
+        PROVISIONING_WAIT_SECONDS.observe(job['updated_at'] - job['created_at'], user_data['role'])
+        
+        with tracer.trace('provision', job['trace_id'], job['parent_span_id'], username=user_data['username'],
+                          role=user_data['role'], client_ip=client_ip, provisioning_id=job_id):
+            if not self.health_monitor.is_available():
+                logger.warning(f"⚠️ Floodlight unavailable, degraded mode for {user_data['username']}")
+                return self.provisioning.finish(job_id, 'degraded')
             
-            # Remover flujos
-            if client_ip in self.installed_flows:
-                flow_names = self.installed_flows[client_ip]
-                self.remove_flows_from_floodlight(flow_names)
-                del self.installed_flows[client_ip]
+            error = None
+            try:
+                flows_installed = self.authenticate_user(user_data)
+            except Exception as e:
+                logger.error(f"❌ Error provisioning {user_data['username']}: {e}")
+                flows_installed, error = 0, str(e)
             
-            # Remover usuario
-            del self.active_users[client_ip]
+            if flows_installed == 0:
+                self.remove_user_flows([client_ip])
+                return self.provisioning.finish(job_id, 'failed', error=error or 'Failed to configure network flows')
+            
+            state = self.provisioning.finish(job_id, 'active', flows_installed)
+            if state == 'cancelled':
+                # Logout mientras se instalaban los flujos
+                self.remove_user_flows([client_ip])
+                self.unregister_user(client_ip)
+            return state
+    
+    def activate_user(self, client_ip, record):
+        """Poner un usuario activo en memoria y programar su expiración"""
+        with self.users_lock:
+            previous = self.active_users.get(client_ip)
+            if previous is not None:
+                self.users_by_role[previous['role']] -= 1
+            self.active_users[client_ip] = record
+            self.users_by_role[record['role']] = self.users_by_role.get(record['role'], 0) + 1
+        self.expiry_queue.schedule(client_ip, record['expires_at'])
+    
+    def unregister_user(self, client_ip, cancel_expiry=True):
+        """Quitar un usuario activo; devuelve sus datos o None si no existía"""
+        with self.users_lock:
+            user_data = self.active_users.pop(client_ip, None)
+            if user_data is not None:
+                self.users_by_role[user_data['role']] -= 1
+        if cancel_expiry:
+            self.expiry_queue.cancel(client_ip)
+        if user_data is not None:
+            self.state_store.delete_sessions([client_ip])
+        return user_data
+    
+    def restore_state(self):
+        """Recuperar sesiones y flujos guardados tras un reinicio
+        Las sesiones que expiraron mientras el controlador estaba caído se descartan
+        y sus flujos quedan pendientes de borrar"""
+        start = time.perf_counter()
+        now = time.time()
+        restored = 0
+        expired = []
+        
+        # La carga crea ~1M de objetos de larga vida: sin pausar el GC se recorren una y otra vez
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for client_ip, record, flows_by_switch in self.state_store.load_sessions():
+                if record['expires_at'] <= now:
+                    expired.append(client_ip)
+                    self.flow_registry.mark_failed([(switch_dpid, name)
+                                                    for switch_dpid, names in flows_by_switch.items()
+                                                    for name in names])
+                    continue
+                self.flow_registry.add_grouped(client_ip, record['mac_address'], flows_by_switch)
+                self.activate_user(client_ip, record)
+                self.restore_role_group(client_ip, record)
+                restored += 1
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        
+        if expired:
+            self.state_store.delete_sessions(expired)
+        
+        duration = time.perf_counter() - start
+        logger.info(f"♻️ Restored {restored} sessions ({self.flow_registry.count()} flows), "
+                    f"discarded {len(expired)} expired in {duration:.3f}s")
+        return {'restored': restored, 'expired': len(expired), 'duration': duration}
+    
+    def restore_role_group(self, client_ip, record):
+        """Volver a unir una sesión recuperada a su grupo; los flujos del grupo se dan
+        por instalados y la reconciliación repone los que falten"""
+        group = self.aggregation_group(record)
+        if group is not None and self.join_role_group(client_ip, group):
+            self.flow_registry.add(self.group_registry_key(group), None, self.generate_role_group_flows(group))
+    
+    def desired_flows_for_user(self, client_ip, user_data):
+        """Flujos que deberían existir en Floodlight para un usuario activo"""
+        switches = user_data.get('switches')
+        flows = self.generate_user_exception_flows(user_data['mac_address'], switches)
+        group = self.aggregation_group(user_data)
+        if group is not None:
+            flows.extend(self.generate_role_group_flows(group))
+            return flows
+        flows.extend(self.generate_flows_for_user({
+            'role': user_data['role'],
+            'mac_address': user_data['mac_address'],
+            'vlan_id': user_data.get('vlan_id'),
+            'client_ip': client_ip
+        }, self.edge_switches(switches)))
+        return flows
+    
+    def flow_owner(self, client_ip, user_data, flow_name):
+        """Clave del registro y MAC bajo las que anotar un flujo reinstalado"""
+        group = self.aggregation_group(user_data)
+        if group is not None and not flow_name.startswith('allow_authenticated_'):
+            return self.group_registry_key(group), None
+        return client_ip, user_data['mac_address']
+    
+    def managed_flow_pattern(self):
+        """Expresión que reconoce los nombres de flujos por usuario que crea este controlador
+        (también los de versiones anteriores, sin el DPID del switch, para retirarlos)"""
+        prefixes = {'allow_authenticated'}
+        for templates in self.compiled_policies.values():
+            prefixes.update(name for name, _ in templates)
+        return re.compile(r'^(?:%s)_(?:[0-9a-fA-F]{12}|v\d{1,4})(?:_[0-9a-fA-F]{16})?$' % '|'.join(map(re.escape, sorted(prefixes))))
+    
+    def desired_flow_names(self, user_data, switch_dpid):
+        """Nombres de los flujos que debe tener un usuario en `switch_dpid`
+        (los mismos que generan generate_user_exception_flows y generate_flows_for_user)"""
+        role = user_data['role'] if user_data['role'] in self.compiled_policies else 'ROLE_GUEST'
+        mac_suffix = user_data['mac_address'].replace(':', '')
+        exception_name = f"allow_authenticated_{mac_suffix}"
+        group = self.aggregation_group(user_data)
+        suffix = f"v{group[1]}" if group is not None else mac_suffix
+        role_names = [f"{name}_{suffix}" for name, _ in self.compiled_policies[role]]
+        
+        switches = user_data.get('switches')
+        if not switches:
+            names = [exception_name] + role_names
+        else:
+            # Los flujos de grupo van en todos los switches; los propios, según la ubicación
+            names = role_names if group is not None or switch_dpid == switches[0] else []
+            if switch_dpid in switches:
+                names = [exception_name] + names
+        return [self.switch_flow_name(name, switch_dpid) for name in names]
+    
+    def reconcile_switch(self, switch_dpid, confirmed=None, max_changes=None, add_only=False):
+        """Comparar la tabla de un switch con las sesiones activas y aplicar la diferencia
+        Con `confirmed` solo se corrigen las diferencias ya vistas en la pasada anterior;
+        con `add_only` solo se reinstalan los que faltan
+        Devuelve {'missing', 'orphans'} (nombres) y {'reinstalled', 'removed'} (cantidades)"""
+        try:
+            installed = self.flow_pusher.list_switch_flows(switch_dpid)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"❌ Cannot read flow table of {switch_dpid} for reconciliation: {e}")
+            return None
+        
+        with self.users_lock:
+            active_users = list(self.active_users.items())
+        
+        # Estado deseado: nombres de flujo en este switch -> sesión que los necesita
+        owners = {}
+        for client_ip, user_data in active_users:
+            for name in self.desired_flow_names(user_data, switch_dpid):
+                owners[name] = (client_ip, user_data)
+        
+        managed = self.managed_flow_pattern()
+        missing = {name for name in owners if name not in installed}
+        orphans = {name for name in installed if name not in owners and managed.match(name)}
+        
+        to_add = missing if confirmed is None else missing & confirmed['missing']
+        to_remove = orphans if confirmed is None else orphans & confirmed['orphans']
+        if add_only:
+            to_remove = set()
+        if max_changes is not None:
+            to_add = sorted(to_add)[:max_changes]
+            to_remove = sorted(to_remove)[:max(max_changes - len(to_add), 0)]
+        
+        reinstalled = 0
+        if to_add:
+            flows = []
+            to_add = set(to_add)
+            users = dict(active_users)
+            for client_ip in {owners[name][0] for name in to_add}:
+                for flow in self.desired_flows_for_user(client_ip, users[client_ip]):
+                    if flow['switch'] == switch_dpid and flow['name'] in to_add:
+                        flows.append(flow)
+                        to_add.discard(flow['name'])  # Un flujo de grupo se instala una sola vez
+            
+            touched = set()
+            for result in self.install_flows_to_floodlight(flows):
+                if result['status'] == 'success':
+                    client_ip, user_data = owners[result['name']]
+                    owner_key, owner_mac = self.flow_owner(client_ip, user_data, result['name'])
+                    self.flow_registry.add(owner_key, owner_mac, [result])
+                    if owner_key == client_ip:
+                        touched.add(client_ip)
+                    reinstalled += 1
+            
+            # Persistir el nuevo conjunto de flujos de los usuarios afectados
+            for client_ip in touched:
+                self.state_store.save_session(client_ip, users[client_ip],
+                                              self.flow_registry.grouped_flows_for(client_ip))
+        
+        removed = 0
+        if to_remove:
+            results = self.remove_flows_from_floodlight([(switch_dpid, name) for name in to_remove])
+            removed = len([r for r in results if r['status'] == 'success'])
+        
+        if missing or orphans:
+            logger.info(f"🔄 Reconciled {switch_dpid}: {len(missing)} missing, {len(orphans)} orphans, "
+                        f"reinstalled {reinstalled}, removed {removed}")
+        return {'missing': missing, 'orphans': orphans, 'reinstalled': reinstalled, 'removed': removed}
+    
+    def reconcile_with_floodlight(self):
+        """Reconciliación completa de todos los switches (arranque)
+        Reinstala los flujos que faltan y borra los huérfanos de usuarios que ya no existen"""
+        summary = {'missing': 0, 'reinstalled': 0, 'orphans': 0, 'removed': 0}
+        for switch_dpid in self.SWITCHES.keys():
+            result = self.reconcile_switch(switch_dpid)
+            if result is None:
+                return None
+            summary['missing'] += len(result['missing'])
+            summary['orphans'] += len(result['orphans'])
+            summary['reinstalled'] += result['reinstalled']
+            summary['removed'] += result['removed']
+        
+        logger.info(f"🔄 Reconciled with Floodlight: {summary}")
+        return summary
+    
+    def start_topology(self):
+        """Primera lectura de dispositivos y enlaces y refresco periódico (ubicación por topología)"""
+        if self.topology is None:
+            return
+        try:
+            self.topology.refresh()
+            logger.info(f"🧭 Topology loaded: {self.topology.get_stats()}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"⚠️ Cannot read topology from Floodlight, flows go to every switch for now: {e}")
+        self.topology.start()
+    
+    def refresh_placements(self, moved_macs=None):
+        """Reubicar los flujos de los usuarios cuyo camino al uplink cambió
+        `moved_macs`: MACs que cambiaron de switch; None si cambiaron los enlaces (se revisan todos)"""
+        if self.topology is None or not self.health_monitor.is_available():
+            return 0
+        
+        if moved_macs is None:
+            with self.users_lock:
+                candidates = list(self.active_users.items())
+        else:
+            candidates = []
+            for mac_address in moved_macs:
+                client_ip = self.flow_registry.client_for_mac(mac_address)
+                record = self.active_users.get(client_ip) if client_ip else None
+                if record is not None:
+                    candidates.append((client_ip, record))
+        
+        relocated = 0
+        for client_ip, record in candidates:
+            placement = self.place_user({'mac_address': record['mac_address']})
+            if placement != record.get('switches'):
+                self.relocate_user(client_ip, record, placement)
+                relocated += 1
+        
+        if relocated:
+            logger.info(f"🧭 Relocated flows of {relocated} users after topology change")
+        return relocated
+    
+    def relocate_user(self, client_ip, record, switches):
+        """Mover los flujos propios de un usuario a su nueva ubicación
+        Un switch común a los dos caminos conserva los nombres de sus flujos: primero se
+        retiran y después se instalan en el nuevo camino. Los flujos de grupo no cambian de sitio"""
+        old_keys = self.flow_registry.pop_client(client_ip)
+        if old_keys:
+            # Un borrado fallido no se reintenta: borraría por nombre los flujos recién instalados
+            self.remove_flows_from_floodlight(old_keys)
+        
+        record = dict(record, switches=switches)
+        user_data = dict(record, client_ip=client_ip)
+        flows = self.generate_user_exception_flows(record['mac_address'], switches)
+        if self.aggregation_group(record) is None:
+            flows.extend(self.generate_flows_for_user(user_data, self.edge_switches(switches)))
+        self.register_installed_flows(client_ip, record['mac_address'], self.install_flows_to_floodlight(flows))
+        
+        with self.users_lock:
+            active = client_ip in self.active_users
+            if active:
+                self.active_users[client_ip] = record
+        if not active:
+            # Logout durante la reubicación: retirar lo que se acaba de instalar
+            self.remove_flows_from_floodlight(self.flow_registry.pop_client(client_ip))
+            return
+        self.state_store.save_session(client_ip, record, self.flow_registry.grouped_flows_for(client_ip))
+    
+    def status_report(self, floodlight_connected, uptime):
+        """Estado del controlador tal como lo expone /api/status"""
+        return {
+            'controller_status': 'running',
+            'floodlight_connected': floodlight_connected,
+            'active_users': len(self.active_users),
+            'total_flows': self.flow_registry.count(),
+            'flow_removal': self.get_flow_removal_stats(),
+            'reconciliation': self.reconciler.get_stats(),
+            'flow_aggregation': self.FLOW_AGGREGATION,
+            'role_groups': len(self.role_groups),
+            'flow_placement': self.FLOW_PLACEMENT,
+            'logins_in_flight': self.login_coalescer.count(),
+            'provisioning': dict(self.provisioning.get_stats(), mode=self.PROVISIONING),
+            'flow_push_rate_limit': self.flow_push_limiter.get_stats() if self.flow_push_limiter is not None else None,
+            'switches': self.switch_inventory.get_stats(),
+            'topology': self.topology.get_stats() if self.topology is not None else None,
+            'uptime': uptime,
+            'users_by_role': {
+                role: self.users_by_role.get(role, 0)
+                for role in self.FLOW_POLICIES.keys()
+            }
+        }
+    
+    def users_report(self):
+        """Usuarios activos tal como los expone /api/users"""
+        users = []
+        with self.users_lock:
+            active_users = list(self.active_users.items())
+        for client_ip, user_data in active_users:
+            users.append({
+                'username': user_data['username'],
+                'role': user_data['role'],
+                'client_ip': client_ip,
+                'mac_address': user_data.get('mac_address'),
+                'vlan_id': user_data.get('vlan_id'),
+                'authenticated_at': user_data['authenticated_at'],
+                'expires_at': user_data['expires_at'],
+                'flows_count': self.flow_registry.count_for(client_ip),
+                'switches': user_data.get('switches'),
+                'degraded_mode': user_data.get('degraded_mode', False)
+            })
+        
+        return {
+            'active_users': users,
+            'total_count': len(users)
+        }
+    
+    def health_report(self):
+        """Estado de salud tal como lo expone /health"""
+        return {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'floodlight_status': 'connected' if self.health_monitor.is_available() else 'disconnected',
+            'floodlight': self.health_monitor.get_snapshot()
+        }
+    
+    def flows_report(self):
+        """Flujos instalados tal como los expone /api/flows"""
+        return {
+            'installed_flows': self.flow_registry.snapshot(),
+            'total_flows': self.flow_registry.count()
+        }
 
     def generate_flows_for_role(self, role, vlan_id, client_ip, mac_address, switch_dpid, in_port):
         """Generar flujos SDN según el rol del usuario"""
@@ -350,7 +1673,7 @@ class SDNController:
             # Flujo de entrada - asignar VLAN
             flow_in = {
                 "switch": dpid,
-                "name": f"vlan_tag_{mac_address.replace(':', '')}",
+                "name": self.switch_flow_name(f"vlan_tag_{mac_address.replace(':', '')}", dpid),
                 "cookie": "0",
                 "priority": str(config['priority']),
                 "in_port": str(in_port) if dpid == switch_dpid else "1",
@@ -363,7 +1686,7 @@ class SDNController:
             # Flujo de salida - remover VLAN tag
             flow_out = {
                 "switch": dpid,
-                "name": f"vlan_untag_{mac_address.replace(':', '')}", 
+                "name": self.switch_flow_name(f"vlan_untag_{mac_address.replace(':', '')}", dpid),
                 "cookie": "0",
                 "priority": str(config['priority']),
                 "vlan_vid": str(vlan_id),
@@ -379,7 +1702,7 @@ class SDNController:
                 # Bloquear tráfico hacia internet
                 block_internet = {
                     "switch": dpid,
-                    "name": f"block_internet_{mac_address.replace(':', '')}",
+                    "name": self.switch_flow_name(f"block_internet_{mac_address.replace(':', '')}", dpid),
                     "priority": str(config['priority'] + 100),
                     "eth_src": mac_address,
                     "eth_type": "0x0800", 
@@ -392,15 +1715,8 @@ class SDNController:
         return flows
 
     def validate_switch_dpid(self, dpid):
-        """Validar que el DPID existe en la configuración"""
-        valid_dpids = [
-            "00:00:72:e0:80:7e:85:4c",
-            "00:00:f2:20:f9:45:4c:4e", 
-            "00:00:1a:74:72:3f:ef:44",
-            "00:00:5e:c7:6e:c6:11:4c",
-            "00:00:aa:51:aa:ba:72:41"
-        ]
-        return dpid in valid_dpids
+        """Validar que el DPID es de un switch conectado (búsqueda O(1) en el inventario)"""
+        return dpid in self.switch_inventory
 
     def start_controller(self):
         """Iniciar el controlador SDN"""
@@ -417,20 +1733,44 @@ class SDNController:
     def user_authenticated_handler(self, user_data):
         """Cuando un usuario se autentica exitosamente"""
         
+        start = time.perf_counter()
         client_ip = user_data['client_ip']
         mac_address = user_data['mac_address']
         role = user_data['role']
         vlan_id = user_data.get('vlan_id')
         
-        # 1. Remover flujos de bloqueo para este usuario
-        exceptions_installed = self.remove_user_blocking_flows(client_ip, mac_address)
+        # 1. Remover flujos de bloqueo para este usuario en su camino hasta el uplink
+        with tracer.span('place_user'):
+            switches = self.place_user(user_data)
+        with tracer.span('exception_flows'):
+            exceptions_installed = self.remove_user_blocking_flows(client_ip, mac_address, switches, role=role)
         logger.info(f"✅ Installed {exceptions_installed} exception flows for {mac_address}")
         
-        # 2. Instalar flujos según el rol
-        flows = self.generate_flows_for_user(user_data)
-        results = self.install_flows_to_floodlight(flows)
+        # 2. Instalar flujos según el rol (o unirse a los ya instalados del grupo)
+        with tracer.span('role_flows') as span:
+            owner_key, owner_mac, flows = self.role_flows_for_user(client_ip, user_data)
+            results = self.install_flows_to_floodlight(flows, role=role)
+            self.register_installed_flows(owner_key, owner_mac, results)
+            if span is not None:
+                span['flows'] = len(flows)
         
-        return len([r for r in results if r.get('status') == 'success'])
+        LOGIN_HANDLER_SECONDS.observe(time.perf_counter() - start, role)
+        return self.installed_flow_count(client_ip, owner_key, exceptions_installed)
+    
+    def installed_flow_count(self, client_ip, owner_key, exceptions_installed):
+        """Flujos que dan acceso al usuario tras el login
+        Con flujos de grupo se suman sus excepciones propias: otro login del mismo
+        grupo puede estar todavía instalando los flujos compartidos"""
+        role_installed = self.flow_registry.count_for(owner_key)
+        if owner_key == client_ip:
+            return role_installed
+        return exceptions_installed + role_installed
+    
+    def register_installed_flows(self, client_ip, mac_address, results):
+        """Anotar en el registro los flujos instalados con éxito; devuelve cuántos son"""
+        installed = [r for r in results if r.get('status') == 'success']
+        self.flow_registry.add(client_ip, mac_address, installed)
+        return len(installed)
 
     def install_default_blocking_flows(self):
         """Instalar flujos que bloquean todo excepto portal cautivo"""
@@ -441,7 +1781,7 @@ class SDNController:
             # 1. ✅ PERMITIR acceso al portal cautivo (puerto 5000)
             allow_portal = {
                 "switch": switch_dpid,
-                "name": "allow_captive_portal",
+                "name": self.switch_flow_name("allow_captive_portal", switch_dpid),
                 "priority": "2000",
                 "eth_type": "0x0800",
                 "ipv4_dst": "10.0.0.1",
@@ -454,7 +1794,7 @@ class SDNController:
             # 2. ✅ PERMITIR DNS (necesario para resolución)
             allow_dns = {
                 "switch": switch_dpid,
-                "name": "allow_dns",
+                "name": self.switch_flow_name("allow_dns", switch_dpid),
                 "priority": "1900",
                 "eth_type": "0x0800",
                 "ip_proto": "17",
@@ -466,7 +1806,7 @@ class SDNController:
             # 3. ✅ PERMITIR DHCP cliente
             allow_dhcp_client = {
                 "switch": switch_dpid,
-                "name": "allow_dhcp_client",
+                "name": self.switch_flow_name("allow_dhcp_client", switch_dpid),
                 "priority": "1900",
                 "eth_type": "0x0800",
                 "ip_proto": "17",
@@ -479,7 +1819,7 @@ class SDNController:
             # 4. ✅ PERMITIR DHCP servidor
             allow_dhcp_server = {
                 "switch": switch_dpid,
-                "name": "allow_dhcp_server",
+                "name": self.switch_flow_name("allow_dhcp_server", switch_dpid),
                 "priority": "1900",
                 "eth_type": "0x0800",
                 "ip_proto": "17",
@@ -492,7 +1832,7 @@ class SDNController:
             # 5. 🔄 REDIRIGIR tráfico HTTP al portal cautivo
             redirect_http = {
                 "switch": switch_dpid,
-                "name": "redirect_http_to_portal",
+                "name": self.switch_flow_name("redirect_http_to_portal", switch_dpid),
                 "priority": "1000",
                 "eth_type": "0x0800",
                 "ip_proto": "6",
@@ -504,7 +1844,7 @@ class SDNController:
             # 6. 🔄 REDIRIGIR tráfico HTTPS al portal
             redirect_https = {
                 "switch": switch_dpid,
-                "name": "redirect_https_to_portal", 
+                "name": self.switch_flow_name("redirect_https_to_portal", switch_dpid),
                 "priority": "1000",
                 "eth_type": "0x0800",
                 "ip_proto": "6",
@@ -516,7 +1856,7 @@ class SDNController:
             # 7. ❌ BLOQUEAR todo lo demás
             block_all = {
                 "switch": switch_dpid,
-                "name": "block_unauthorized",
+                "name": self.switch_flow_name("block_unauthorized", switch_dpid),
                 "priority": "100",
                 "eth_type": "0x0800",
                 "active": "true",
@@ -537,17 +1877,23 @@ class SDNController:
         results = self.install_flows_to_floodlight(default_flows)
         return len([r for r in results if r.get('status') == 'success'])
 
-    def remove_user_blocking_flows(self, client_ip, mac_address):
+    def remove_user_blocking_flows(self, client_ip, mac_address, switches=None, role=None):
         """Remover flujos de bloqueo para un usuario específico autenticado"""
         
-        # Crear flujos que permitan acceso completo para este usuario
+        # Instalar excepciones para el usuario autenticado
+        user_exception_flows = self.generate_user_exception_flows(mac_address, switches)
+        results = self.install_flows_to_floodlight(user_exception_flows, role=role)
+        return self.register_installed_flows(client_ip, mac_address, results)
+    
+    def generate_user_exception_flows(self, mac_address, switches=None):
+        """Crear flujos que permitan acceso completo para este usuario"""
         user_exception_flows = []
         
-        for switch_dpid in self.SWITCHES.keys():
+        for switch_dpid in switches or self.SWITCHES.keys():
             # Permitir todo el tráfico de este usuario (prioridad muy alta)
             allow_user = {
                 "switch": switch_dpid,
-                "name": f"allow_authenticated_{mac_address.replace(':', '')}",
+                "name": self.switch_flow_name(f"allow_authenticated_{mac_address.replace(':', '')}", switch_dpid),
                 "priority": "3000",
                 "eth_src": mac_address,
                 "eth_type": "0x0800",
@@ -557,201 +1903,259 @@ class SDNController:
             
             user_exception_flows.append(allow_user)
         
-        # Instalar excepciones para el usuario autenticado
-        results = self.install_flows_to_floodlight(user_exception_flows)
-        return len([r for r in results if r.get('status') == 'success'])
+        return user_exception_flows
 
-# Inicializar Flask app
-app = Flask(__name__)
-
-# Instancia global del controlador
-controller = SDNController()
-
-@app.route('/api/user_authenticated', methods=['POST'])
-def user_authenticated():
-    """API para recibir notificaciones de autenticación exitosa"""
-    try:
-        data = request.json
-        
-        if not data or 'username' not in data:
-            return jsonify({'error': 'Invalid request data'}), 400
-        
-        username = data['username']
-        role = data['role']
-        client_ip = data['client_ip']
-        mac_address = data['mac_address']
-        
-        logger.info(f"🔐 Processing authentication for user {username} ({role}) from {client_ip}")
-        
-        # Verificar conectividad con Floodlight
-        floodlight_available = controller.test_floodlight_connection()
-        
-        if floodlight_available:
-            # Configurar acceso para usuario autenticado
-            flows_installed = controller.user_authenticated_handler(data)
-            
-            if flows_installed > 0:
-                # Guardar información del usuario
-                controller.active_users[client_ip] = {
-                    'username': username,
-                    'role': role,
-                    'mac_address': mac_address,
-                    'vlan_id': data.get('vlan_id'),
-                    'authenticated_at': time.time(),
-                    'expires_at': time.time() + data.get('session_timeout', 3600),
-                    'session_timeout': data.get('session_timeout', 3600)
-                }
+def create_app(controller):
+    """Construir la aplicación Flask con las rutas del controlador
+    Importar el módulo no crea controlador, conexiones ni hilos: main() crea uno y su app"""
+    app = Flask(__name__)
+    app.start_time = time.time()
+    
+    @app.route('/api/user_authenticated', methods=['POST'])
+    def user_authenticated():
+        """API para recibir notificaciones de autenticación exitosa"""
+        try:
+            data = request.json
+            
+            if not data or 'username' not in data:
+                return jsonify({'error': 'Invalid request data'}), 400
+            
+            username = data['username']
+            role = data['role']
+            client_ip = data['client_ip']
+            mac_address = data['mac_address']
+            
+            logger.info(f"🔐 Processing authentication for user {username} ({role}) from {client_ip}")
+            
+            # Verificar conectividad con Floodlight (último sondeo, sin esperar timeouts)
+            floodlight_available = controller.health_monitor.is_available()
+            
+            if floodlight_available:
+                # Continuar la traza del portal (traceparent o, en su defecto, el trace_id del cuerpo)
+                trace_id, parent_span_id = parse_traceparent(request.headers.get('traceparent'))
+                if controller.PROVISIONING == 'queued':
+                    # Respuesta inmediata; el portal consulta /api/provisioning/<id>
+                    body, status, headers = controller.submit_login(data, trace_id or data.get('trace_id'), parent_span_id)
+                    return jsonify(body), status, headers
                 
-                logger.info(f"✅ Successfully configured network access for user {username}")
+                with tracer.trace('user_authenticated', trace_id or data.get('trace_id'), parent_span_id,
+                                  username=username, role=role, client_ip=client_ip):
+                    # Configurar acceso y guardar la sesión (duplicados y re-logins no reinstalan)
+                    flows_installed = controller.authenticate_user(data)
                 
+                if flows_installed > 0:
+                    logger.info(f"✅ Successfully configured network access for user {username}")
+                    
+                    return jsonify({
+                        'status': 'success',
+                        'flows_installed': flows_installed,
+                        'message': f'Network access configured for {username}'
+                    })
+                else:
+                    logger.error(f"❌ Failed to configure flows for user {username}")
+                    controller.remove_user_flows([client_ip])
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'Failed to configure network flows'
+                    }), 500
+            else:
+                logger.warning(f"⚠️ Floodlight unavailable, degraded mode for {username}")
                 return jsonify({
                     'status': 'success',
-                    'flows_installed': flows_installed,
-                    'message': f'Network access configured for {username}'
+                    'degraded_mode': True,
+                    'message': f'Access granted in degraded mode for {username}'
                 })
-            else:
-                logger.error(f"❌ Failed to configure flows for user {username}")
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Failed to configure network flows'
-                }), 500
-        else:
-            logger.warning(f"⚠️ Floodlight unavailable, degraded mode for {username}")
+                
+        except Exception as e:
+            logger.error(f"❌ Error processing user authentication: {e}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/user_logout', methods=['POST'])
+    def user_logout():
+        """API para recibir notificaciones de logout"""
+        try:
+            data = request.json
+            
+            if not data or 'client_ip' not in data:
+                return jsonify({'error': 'Invalid request data'}), 400
+            
+            client_ip = data['client_ip']
+            username = data.get('username', 'unknown')
+            
+            logger.info(f"Processing logout for user {username} from {client_ip}")
+            
+            # Un login todavía en la cola ya no se aprovisiona
+            controller.provisioning.cancel_client(client_ip)
+            
+            # Remover flujos si existen
+            removed_count = controller.remove_user_flows([client_ip])
+            if removed_count:
+                logger.info(f"Removed {removed_count} flows for user {username}")
+            
+            # Remover usuario activo
+            controller.unregister_user(client_ip)
+            
             return jsonify({
                 'status': 'success',
-                'degraded_mode': True,
-                'message': f'Access granted in degraded mode for {username}'
+                'message': f'User {username} logged out successfully'
             })
             
-    except Exception as e:
-        logger.error(f"❌ Error processing user authentication: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
-
-@app.route('/api/user_logout', methods=['POST'])
-def user_logout():
-    """API para recibir notificaciones de logout"""
-    try:
-        data = request.json
-        
-        if not data or 'client_ip' not in data:
-            return jsonify({'error': 'Invalid request data'}), 400
-        
-        client_ip = data['client_ip']
-        username = data.get('username', 'unknown')
-        
-        logger.info(f"Processing logout for user {username} from {client_ip}")
-        
-        # Remover flujos si existen
-        if client_ip in controller.installed_flows:
-            flow_names = controller.installed_flows[client_ip]
-            removed_count = controller.remove_flows_from_floodlight(flow_names)
-            del controller.installed_flows[client_ip]
-            logger.info(f"Removed {removed_count} flows for user {username}")
-        
-        # Remover usuario activo
-        if client_ip in controller.active_users:
-            del controller.active_users[client_ip]
-        
-        return jsonify({
-            'status': 'success',
-            'message': f'User {username} logged out successfully'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error processing user logout: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
-
-@app.route('/api/status', methods=['GET'])
-def controller_status():
-    """API para obtener estado del controlador"""
-    controller.cleanup_expired_users()
-    
-    return jsonify({
-        'controller_status': 'running',
-        'floodlight_connected': controller.test_floodlight_connection(),
-        'active_users': len(controller.active_users),
-        'total_flows': sum(len(flows) for flows in controller.installed_flows.values()),
-        'uptime': int(time.time() - app.start_time) if hasattr(app, 'start_time') else 0,
-        'users_by_role': {
-            role: len([u for u in controller.active_users.values() if u.get('role') == role])
-            for role in controller.FLOW_POLICIES.keys()
-        }
-    })
+        except Exception as e:
+            logger.error(f"Error processing user logout: {e}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/provisioning/<job_id>', methods=['GET'])
+    def provisioning_status(job_id):
+        """Estado de un login aceptado por la cola de aprovisionamiento"""
+        job = controller.provisioning.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown provisioning id'}), 404
+        return jsonify(job)
+
+    @app.route('/api/status', methods=['GET'])
+    def controller_status():
+        """API para obtener estado del controlador"""
+        return jsonify(controller.status_report(
+            controller.health_monitor.is_available(),
+            int(time.time() - app.start_time)
+        ))
+
+    @app.route('/api/users', methods=['GET'])
+    def list_active_users():
+        """API para listar usuarios activos"""
+        return jsonify(controller.users_report())
+
+    @app.route('/api/flows', methods=['GET'])
+    def list_flows():
+        """API para listar flujos instalados"""
+        return jsonify(controller.flows_report())
+
+    @app.route('/api/flows/export', methods=['GET'])
+    def export_flows():
+        """Exportar flujos como NDJSON o columnar en una respuesta por trozos
+        Parámetros: source=registry|floodlight, format=ndjson|columnar, switch, role, mac, offset, limit"""
+        try:
+            params = parse_export_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        stream, content_type = export_stream(controller, params)
+        return Response(stream, mimetype=content_type)
+
+    @app.route('/api/switches', methods=['GET'])
+    def list_switches():
+        """API para listar los switches conectados y sus puertos"""
+        return jsonify(controller.switch_inventory.report())
+
+    @app.route('/debug/traces', methods=['GET'])
+    def debug_traces():
+        """Logins recientes del controlador, los más lentos primero (parámetros: limit, order, min_ms)"""
+        try:
+            params = parse_report_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(tracer.report(**params))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Métricas del controlador en formato de texto de Prometheus"""
+        return Response(REGISTRY.render(prefix='sdn_controller_'), content_type=METRICS_CONTENT_TYPE)
 
-@app.route('/api/users', methods=['GET'])
-def list_active_users():
-    """API para listar usuarios activos"""
-    controller.cleanup_expired_users()
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        """Health check endpoint"""
+        return jsonify(controller.health_report())
     
-    users = []
-    for client_ip, user_data in controller.active_users.items():
-        users.append({
-            'username': user_data['username'],
-            'role': user_data['role'],
-            'client_ip': client_ip,
-            'mac_address': user_data.get('mac_address'),
-            'vlan_id': user_data.get('vlan_id'),
-            'authenticated_at': user_data['authenticated_at'],
-            'expires_at': user_data['expires_at'],
-            'flows_count': len(controller.installed_flows.get(client_ip, [])),
-            'degraded_mode': user_data.get('degraded_mode', False)
-        })
-    
-    return jsonify({
-        'active_users': users,
-        'total_count': len(users)
-    })
-
-@app.route('/api/flows', methods=['GET'])
-def list_flows():
-    """API para listar flujos instalados"""
-    return jsonify({
-        'installed_flows': controller.installed_flows,
-        'total_flows': sum(len(flows) for flows in controller.installed_flows.values())
-    })
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'floodlight_status': 'connected' if controller.test_floodlight_connection() else 'disconnected'
-    })
-
-def periodic_cleanup():
+    return app
+
+def periodic_cleanup(controller):
     """Tarea periódica para limpiar usuarios expirados"""
     while True:
         try:
             controller.cleanup_expired_users()
-            time.sleep(60)  # Ejecutar cada minuto
         except Exception as e:
             logger.error(f"Error in periodic cleanup: {e}")
-            time.sleep(60)
+        time.sleep(controller.EXPIRY_CHECK_INTERVAL)  # Solo visita las sesiones vencidas
 
-if __name__ == '__main__':
-    app.start_time = time.time()
+def parse_args():
+    """Opciones de arranque del controlador"""
+    parser = argparse.ArgumentParser(description='Controlador SDN para Portal Cautivo')
+    parser.add_argument('--mode', choices=['threaded', 'asyncio'], default='threaded',
+                        help='Servidor Flask con hilos (por defecto) o servicio asyncio con aiohttp')
+    parser.add_argument('--floodlight-url', default=None, help='URL base de la API REST de Floodlight')
+    parser.add_argument('--port', type=int, default=None, help='Puerto de la API del controlador')
+    parser.add_argument('--flow-aggregation', choices=['per_user', 'per_role'], default='per_user',
+                        help='Flujos de rol por usuario (eth_src) o compartidos por rol y VLAN')
+    parser.add_argument('--flow-placement', choices=['all', 'topology'], default='all',
+                        help='Flujos en todos los switches o solo en el de acceso y el camino al uplink')
+    parser.add_argument('--provisioning', choices=['inline', 'queued'], default='inline',
+                        help='Instalar los flujos antes de responder al portal o responder con un ID y encolarlos')
+    parser.add_argument('--flow-push-rate', type=int, default=0,
+                        help='Máximo de escrituras por segundo en Floodlight (0: sin límite)')
+    parser.add_argument('--otlp-endpoint', default=None,
+                        help='Colector OTLP/HTTP al que enviar las trazas (p. ej. http://localhost:4318)')
+    parser.add_argument('--state-backend', choices=['sqlite', 'memory'], default='memory',
+                        help='Dónde guardar sesiones y flujos (sqlite: se recuperan tras un reinicio)')
+    parser.add_argument('--state-db', default=None,
+                        help='Fichero SQLite del estado del controlador (por defecto /var/lib/sdn_grupo2/controller_state.db)')
+    return parser.parse_args()
+
+def main():
+    """Arrancar exactamente un controlador: SDNController con Flask o AsyncSDNController"""
+    args = parse_args()
+    
+    state_store = open_state_store(args.state_backend, args.state_db)
+    options = dict(state_store=state_store, flow_aggregation=args.flow_aggregation,
+                   flow_placement=args.flow_placement, provisioning=args.provisioning,
+                   flow_push_rate=args.flow_push_rate or None)
+    if args.floodlight_url:
+        options['floodlight_url'] = args.floodlight_url
+    
+    if args.mode == 'asyncio':
+        # Servicio asyncio: mismas rutas sin un hilo por autenticación
+        from sdn_controller_async import run_async_controller
+        run_async_controller(port=args.port, otlp_endpoint=args.otlp_endpoint, **options)
+        return
     
+    controller = SDNController(**options)
+    if args.port:
+        controller.CONTROLLER_PORT = args.port
+    app = create_app(controller)
+    
+    if args.otlp_endpoint:
+        tracer.exporter = OTLPExporter(args.otlp_endpoint, tracer.service).start()
+
     logger.info("=== Controlador SDN para Portal Cautivo ===")
     logger.info(f"Floodlight URL: {controller.FLOODLIGHT_URL}")
     logger.info(f"Controller API: http://{controller.CONTROLLER_IP}:{controller.CONTROLLER_PORT}")
     logger.info(f"Configured switches: {list(controller.SWITCHES.keys())}")
-    
-    # Verificar conexión inicial con Floodlight
-    if controller.test_floodlight_connection():
+
+    # Recuperar sesiones de la ejecución anterior
+    controller.restore_state()
+
+    # Verificar conexión inicial con Floodlight y mantenerla sondeada
+    if controller.health_monitor.probe():
         logger.info("✅ Floodlight connection successful")
+        controller.reconcile_with_floodlight()
     else:
         logger.warning("⚠️ Floodlight not available - will run in degraded mode")
-    
+    controller.health_monitor.start()
+    controller.reconciler.start()
+    controller.start_topology()
+    controller.start_provisioning()
+
     # Iniciar tarea de limpieza en background
-    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
+    cleanup_thread = threading.Thread(target=periodic_cleanup, args=(controller,), daemon=True)
     cleanup_thread.start()
-    
+
     logger.info("Starting SDN Controller...")
-    
+
     app.run(
         host=controller.CONTROLLER_IP,
         port=controller.CONTROLLER_PORT,
         debug=False,
         threaded=True
     )
+
+if __name__ == '__main__':
+    main()
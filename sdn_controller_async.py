@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Controlador SDN para Portal Cautivo - modo asyncio
+Mismas rutas que sdn_controller.py servidas con aiohttp: cada autenticación es
+una corrutina en vuelo en lugar de un hilo bloqueado esperando a Floodlight
+Uso: python3 sdn_controller.py --mode asyncio
+Autor: SDN_Grupo2
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from aiohttp import web, ClientSession, ClientTimeout, TCPConnector, ClientError
+except ImportError:  # pragma: no cover - dependencia opcional
+    raise SystemExit("El modo asyncio requiere aiohttp: pip3 install aiohttp")
+
+from sdn_controller import (SDNController, FloodlightFlowPusher, LoginCoalescer, LOGIN_HANDLER_SECONDS,
+                            LOGIN_NOTIFICATIONS_TOTAL, PROVISIONING_WAIT_SECONDS, tracer)
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import OTLPExporter, parse_traceparent, parse_report_params
+from flow_export import export_stream, parse_export_params
+
+logger = logging.getLogger(__name__)
+
+class AsyncFloodlightFlowPusher:
+    """Equivalente asyncio de FloodlightFlowPusher
+    Una sola sesión aiohttp con conexiones keep-alive y semáforos por switch"""
+
+    def __init__(self, floodlight_url, max_connections=32, per_switch_concurrency=4, timeout=5, rate_limiter=None):
+        self.FLOODLIGHT_URL = floodlight_url
+        self.PUSHER_URL = f"{floodlight_url}/wm/staticflowpusher/json"
+        self.max_connections = max_connections
+        self.per_switch_concurrency = per_switch_concurrency
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.session = None
+        self.switch_slots = {}
+
+    async def start(self):
+        """Abrir la sesión HTTP (debe llamarse dentro del event loop)"""
+        self.session = ClientSession(
+            connector=TCPConnector(limit=self.max_connections, keepalive_timeout=30),
+            timeout=ClientTimeout(total=self.timeout),
+            headers={'Content-Type': 'application/json'}
+        )
+
+    def _get_switch_slot(self, switch_dpid):
+        slot = self.switch_slots.get(switch_dpid)
+        if slot is None:
+            slot = asyncio.Semaphore(self.per_switch_concurrency)
+            self.switch_slots[switch_dpid] = slot
+        return slot
+
+    async def _send(self, method, flow, deadline=None, login=True):
+        """Enviar un flujo a Floodlight y devolver un resultado estructurado"""
+        result = FloodlightFlowPusher._result(flow)
+        if deadline is not None and time.monotonic() > deadline:
+            result['error'] = 'deadline exceeded'
+            return result
+
+        # Los logins reservan turno con prioridad; el trabajo de fondo no deja deuda
+        if self.rate_limiter is not None:
+            if not await self.rate_limiter.acquire_async(background=not login, deadline=deadline):
+                result['error'] = 'rate limit wait exceeded' if login else 'deadline exceeded'
+                return result
+
+        async with self._get_switch_slot(flow.get('switch', 'all')):
+            if deadline is not None and time.monotonic() > deadline:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.refund()
+                result['error'] = 'deadline exceeded'
+                return result
+
+            start = result['started'] = time.perf_counter()
+            try:
+                async with self.session.request(method, self.PUSHER_URL, data=json.dumps(flow)) as response:
+                    body = await response.text()
+                    result['http_status'] = response.status
+                    if response.status == 200:
+                        result['status'] = 'success'
+                    else:
+                        result['error'] = f"HTTP {response.status}: {body}"
+            except (ClientError, asyncio.TimeoutError) as e:
+                result['error'] = str(e) or type(e).__name__
+            result['latency'] = time.perf_counter() - start
+
+        return result
+
+    async def push(self, flows):
+        """Instalar flujos concurrentemente; resultados en el mismo orden"""
+        return await asyncio.gather(*(self._send('POST', flow) for flow in flows))
+
+    async def remove(self, flow_keys, deadline=None):
+        """Borrar flujos (switch, nombre); un DELETE por nombre distinto (trabajo de fondo)"""
+        by_name = {}
+        for switch_dpid, flow_name in flow_keys:
+            by_name.setdefault(flow_name, switch_dpid)
+
+        return await asyncio.gather(*(self._send('DELETE', {'name': name, 'switch': switch_dpid}, deadline, False)
+                                      for name, switch_dpid in by_name.items()))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+class AsyncSDNController(SDNController):
+    """SDNController cuyas llamadas a Floodlight son corrutinas"""
+
+    def __init__(self, floodlight_url="http://192.168.200.200:8080", state_store=None, flow_aggregation='per_user',
+                 flow_placement='all', provisioning='inline', flow_push_rate=None):
+        super().__init__(floodlight_url=floodlight_url, state_store=state_store, flow_aggregation=flow_aggregation,
+                         flow_placement=flow_placement, provisioning=provisioning, flow_push_rate=flow_push_rate)
+
+        # El motor con hilos solo se usa para tareas puntuales fuera del loop (reconciliación)
+        self.async_pusher = AsyncFloodlightFlowPusher(
+            self.FLOODLIGHT_URL,
+            max_connections=self.FLOW_PUSH_WORKERS,
+            per_switch_concurrency=self.FLOW_PUSH_PER_SWITCH,
+            timeout=self.FLOW_PUSH_TIMEOUT,
+            rate_limiter=self.flow_push_limiter
+        )
+
+        # Las escrituras en el almacén de estado (SQLite) bloquean: van a un único hilo fuera
+        # del loop y se aplican en orden de llegada (un logout no adelanta al registro de su login)
+        self.state_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-writer')
+
+    async def in_state_writer(self, function, *args, **kwargs):
+        """Ejecutar en el hilo escritor un método que guarda en el almacén de estado"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.state_writer, functools.partial(function, *args, **kwargs))
+
+    async def install_flows_async(self, flows, role=None):
+        """Instalar flujos en Floodlight; misma estructura de resultados que el modo con hilos"""
+        results = await self.async_pusher.push(flows)
+        self.record_push_health(results)
+        self.record_push_metrics(results, role)
+        self.record_push_spans(results)
+
+        for result in results:
+            if result['status'] == 'success':
+                logger.info(f"✅ Flujo instalado: {result['name']} en {result['switch']} ({result['latency'] * 1000:.1f} ms)")
+            else:
+                logger.error(f"❌ Error instalando {result['name']}: {result['error']}")
+
+        return results
+
+    async def install_flows_traced(self, span_name, flows, role=None):
+        """install_flows_async dentro de un span (cada tarea de gather lleva su propio contexto)"""
+        with tracer.span(span_name, flows=len(flows)):
+            return await self.install_flows_async(flows, role=role)
+
+    async def remove_flows_async(self, flow_keys, deadline=None):
+        """Remover flujos (switch, nombre) de Floodlight"""
+        results = await self.async_pusher.remove(flow_keys, deadline=deadline)
+        self.record_push_health(results)
+
+        for result in results:
+            if result['status'] == 'success':
+                logger.info(f"✅ Flow removed: {result['name']}")
+            else:
+                logger.error(f"❌ Failed to remove flow {result['name']}: {result['error']}")
+
+        return results
+
+    async def remove_user_flows_async(self, client_ips):
+        """Borrar de una vez los flujos de varios usuarios (logout o expiración)"""
+        start = time.perf_counter()
+        flow_keys = self.flow_registry.pop_pending() if self.health_monitor.is_available() else []
+        flow_keys.extend(self.release_user_flows(client_ips))
+
+        if not flow_keys:
+            return 0
+
+        deadline = time.monotonic() + self.FLOW_REMOVAL_DEADLINE
+        results = await self.remove_flows_async(flow_keys, deadline=deadline)
+        return self.record_flow_removal(client_ips, flow_keys, results, time.perf_counter() - start)
+
+    async def user_authenticated_handler_async(self, user_data):
+        """Cuando un usuario se autentica exitosamente"""
+        start = time.perf_counter()
+        client_ip = user_data['client_ip']
+        mac_address = user_data['mac_address']
+        role = user_data['role']
+
+        with tracer.span('place_user'):
+            if self.topology is not None:
+                # Un cliente nuevo se consulta a la API de dispositivos de Floodlight (cliente síncrono)
+                await asyncio.get_running_loop().run_in_executor(None, self.place_user, user_data)
+            else:
+                self.place_user(user_data)
+
+        # Excepciones de bloqueo y flujos del rol viajan en paralelo
+        exception_flows = self.generate_user_exception_flows(mac_address, user_data['switches'])
+        owner_key, owner_mac, role_flows = self.role_flows_for_user(client_ip, user_data)
+        exception_results, role_results = await asyncio.gather(
+            self.install_flows_traced('exception_flows', exception_flows, role=role),
+            self.install_flows_traced('role_flows', role_flows, role=role)
+        )
+
+        exceptions_installed = self.register_installed_flows(client_ip, mac_address, exception_results)
+        logger.info(f"✅ Installed {exceptions_installed} exception flows for {mac_address}")
+
+        self.register_installed_flows(owner_key, owner_mac, role_results)
+        LOGIN_HANDLER_SECONDS.observe(time.perf_counter() - start, role)
+        return self.installed_flow_count(client_ip, owner_key, exceptions_installed)
+
+    async def authenticate_user_async(self, user_data):
+        """Equivalente asyncio de authenticate_user: los duplicados esperan la instalación en curso"""
+        flows_installed = await self.in_state_writer(self.refresh_user_session, user_data)
+        if flows_installed is not None:
+            LOGIN_NOTIFICATIONS_TOTAL.inc('refreshed')
+            return flows_installed
+
+        key = LoginCoalescer.key(user_data)
+        future, owner = self.login_coalescer.claim(key)
+        if not owner:
+            LOGIN_NOTIFICATIONS_TOTAL.inc('coalesced')
+            return await asyncio.wrap_future(future)
+
+        try:
+            flows_installed = await self.in_state_writer(self.refresh_user_session, user_data)
+            if flows_installed is not None:
+                LOGIN_NOTIFICATIONS_TOTAL.inc('refreshed')
+            else:
+                LOGIN_NOTIFICATIONS_TOTAL.inc('install')
+                flows_installed = await self.user_authenticated_handler_async(user_data)
+                if flows_installed > 0:
+                    await self.in_state_writer(self.register_user, user_data)
+            future.set_result(flows_installed)
+            return flows_installed
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()  # Petición cancelada: los duplicados no se quedan esperando
+            self.login_coalescer.release(key, future)
+
+    async def start_provisioning_async(self):
+        """Workers de la cola como tareas del event loop (modo 'queued'); devuelve las tareas"""
+        if self.PROVISIONING != 'queued':
+            return []
+        loop = asyncio.get_running_loop()
+        jobs = asyncio.PriorityQueue()
+        self.provisioning.dispatch = lambda job: loop.call_soon_threadsafe(jobs.put_nowait,
+                                                                           self.provisioning_order(job))
+
+        async def worker():
+            while True:
+                _, _, job_id = await jobs.get()
+                try:
+                    await self.provision_async(job_id)
+                except Exception as e:
+                    logger.error(f"❌ Error in provisioning worker: {e}")
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.PROVISIONING_WORKERS)]
+        await loop.run_in_executor(None, self.provisioning.restore)
+        return tasks
+
+    async def provision_async(self, job_id):
+        """Equivalente asyncio de provision"""
+        job = self.provisioning.begin(job_id)
+        if job is None:
+            return None
+        user_data = job['user_data']
+        client_ip = user_data['client_ip']
+        PROVISIONING_WAIT_SECONDS.observe(job['updated_at'] - job['created_at'], user_data['role'])
+
+        with tracer.trace('provision', job['trace_id'], job['parent_span_id'], username=user_data['username'],
+                          role=user_data['role'], client_ip=client_ip, provisioning_id=job_id):
+            if not self.health_monitor.is_available():
+                logger.warning(f"⚠️ Floodlight unavailable, degraded mode for {user_data['username']}")
+                return await self.in_state_writer(self.provisioning.finish, job_id, 'degraded')
+
+            error = None
+            try:
+                flows_installed = await self.authenticate_user_async(user_data)
+            except Exception as e:
+                logger.error(f"❌ Error provisioning {user_data['username']}: {e}")
+                flows_installed, error = 0, str(e)
+
+            if flows_installed == 0:
+                await self.remove_user_flows_async([client_ip])
+                return await self.in_state_writer(self.provisioning.finish, job_id, 'failed',
+                                                  error=error or 'Failed to configure network flows')
+
+            state = await self.in_state_writer(self.provisioning.finish, job_id, 'active', flows_installed)
+            if state == 'cancelled':
+                await self.remove_user_flows_async([client_ip])
+                await self.in_state_writer(self.unregister_user, client_ip)
+            return state
+
+    async def cleanup_expired_users_async(self):
+        """Limpiar usuarios expirados y sus flujos"""
+        expired = await self.in_state_writer(self.pop_expired_users)
+        for client_ip, user_data in expired:
+            logger.info(f"Session expired for user {user_data['username']}")
+
+        removed = await self.remove_user_flows_async([client_ip for client_ip, _ in expired])
+        if expired:
+            logger.info(f"Expired {len(expired)} sessions, removed {removed} flows")
+
+def create_app(controller):
+    """Construir la aplicación aiohttp con las rutas del controlador"""
+    app = web.Application()
+
+    async def user_authenticated(request):
+        """API para recibir notificaciones de autenticación exitosa"""
+        try:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+
+            if not data or 'username' not in data:
+                return web.json_response({'error': 'Invalid request data'}, status=400)
+
+            username = data['username']
+            role = data['role']
+            client_ip = data['client_ip']
+
+            logger.info(f"🔐 Processing authentication for user {username} ({role}) from {client_ip}")
+
+            # Último sondeo del monitor de salud, sin esperar timeouts
+            if controller.health_monitor.is_available():
+                # Continuar la traza del portal (traceparent o, en su defecto, el trace_id del cuerpo)
+                trace_id, parent_span_id = parse_traceparent(request.headers.get('traceparent'))
+                if controller.PROVISIONING == 'queued':
+                    body, status, headers = await controller.in_state_writer(
+                        controller.submit_login, data, trace_id or data.get('trace_id'), parent_span_id)
+                    return web.json_response(body, status=status, headers=headers)
+
+                with tracer.trace('user_authenticated', trace_id or data.get('trace_id'), parent_span_id,
+                                  username=username, role=role, client_ip=client_ip):
+                    flows_installed = await controller.authenticate_user_async(data)
+
+                if flows_installed > 0:
+                    logger.info(f"✅ Successfully configured network access for user {username}")
+                    return web.json_response({
+                        'status': 'success',
+                        'flows_installed': flows_installed,
+                        'message': f'Network access configured for {username}'
+                    })
+
+                logger.error(f"❌ Failed to configure flows for user {username}")
+                await controller.remove_user_flows_async([client_ip])
+                return web.json_response({
+                    'status': 'error',
+                    'message': 'Failed to configure network flows'
+                }, status=500)
+
+            logger.warning(f"⚠️ Floodlight unavailable, degraded mode for {username}")
+            return web.json_response({
+                'status': 'success',
+                'degraded_mode': True,
+                'message': f'Access granted in degraded mode for {username}'
+            })
+
+        except Exception as e:
+            logger.error(f"❌ Error processing user authentication: {e}")
+            return web.json_response({'error': 'Internal server error'}, status=500)
+
+    async def user_logout(request):
+        """API para recibir notificaciones de logout"""
+        try:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+
+            if not data or 'client_ip' not in data:
+                return web.json_response({'error': 'Invalid request data'}, status=400)
+
+            client_ip = data['client_ip']
+            username = data.get('username', 'unknown')
+
+            logger.info(f"Processing logout for user {username} from {client_ip}")
+
+            await controller.in_state_writer(controller.provisioning.cancel_client, client_ip)
+            removed_count = await controller.remove_user_flows_async([client_ip])
+            if removed_count:
+                logger.info(f"Removed {removed_count} flows for user {username}")
+
+            await controller.in_state_writer(controller.unregister_user, client_ip)
+
+            return web.json_response({
+                'status': 'success',
+                'message': f'User {username} logged out successfully'
+            })
+
+        except Exception as e:
+            logger.error(f"Error processing user logout: {e}")
+            return web.json_response({'error': 'Internal server error'}, status=500)
+
+    async def controller_status(request):
+        """API para obtener estado del controlador"""
+        return web.json_response(controller.status_report(
+            controller.health_monitor.is_available(),
+            int(time.time() - app['start_time'])
+        ))
+
+    async def list_active_users(request):
+        """API para listar usuarios activos"""
+        return web.json_response(controller.users_report())
+
+    async def list_flows(request):
+        """API para listar flujos instalados"""
+        return web.json_response(controller.flows_report())
+
+    async def export_flows(request):
+        """Exportar flujos como NDJSON o columnar en una respuesta por trozos"""
+        try:
+            params = parse_export_params(request.query)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+
+        stream, content_type = export_stream(controller, params)
+        response = web.StreamResponse(headers={'Content-Type': content_type})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+
+        # Cada trozo se genera fuera del loop: la fuente floodlight hace HTTP bloqueante
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, next, stream, None)
+            if chunk is None:
+                break
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    async def metrics(request):
+        """Métricas del controlador en formato de texto de Prometheus"""
+        return web.Response(body=REGISTRY.render(prefix='sdn_controller_').encode('utf-8'),
+                            headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+    async def debug_traces(request):
+        """Logins recientes del controlador, los más lentos primero (parámetros: limit, order, min_ms)"""
+        try:
+            params = parse_report_params(request.query)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response(tracer.report(**params))
+
+    async def provisioning_status(request):
+        """Estado de un login aceptado por la cola de aprovisionamiento"""
+        job = controller.provisioning.get(request.match_info['job_id'])
+        if job is None:
+            return web.json_response({'error': 'Unknown provisioning id'}, status=404)
+        return web.json_response(job)
+
+    async def list_switches(request):
+        """API para listar los switches conectados y sus puertos"""
+        return web.json_response(controller.switch_inventory.report())
+
+    async def health_check(request):
+        """Health check endpoint"""
+        return web.json_response(controller.health_report())
+
+    async def periodic_cleanup():
+        """Tarea periódica para limpiar usuarios expirados"""
+        while True:
+            try:
+                await controller.cleanup_expired_users_async()
+            except Exception as e:
+                logger.error(f"Error in periodic cleanup: {e}")
+            await asyncio.sleep(controller.EXPIRY_CHECK_INTERVAL)  # Solo visita las sesiones vencidas
+
+    async def lifecycle(app):
+        app['start_time'] = time.time()
+        await controller.async_pusher.start()
+
+        # El sondeo de Floodlight corre en su propio hilo, fuera del event loop
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, controller.health_monitor.probe):
+            logger.info("✅ Floodlight connection successful")
+            await loop.run_in_executor(None, controller.reconcile_with_floodlight)
+        else:
+            logger.warning("⚠️ Floodlight not available - will run in degraded mode")
+        controller.health_monitor.start()
+        controller.reconciler.start()  # Hilo propio con el cliente síncrono, fuera del event loop
+        await loop.run_in_executor(None, controller.start_topology)
+        provisioning_tasks = await controller.start_provisioning_async()
+
+        cleanup_task = asyncio.create_task(periodic_cleanup())
+        yield
+        cleanup_task.cancel()
+        for task in provisioning_tasks:
+            task.cancel()
+        controller.health_monitor.stop()
+        controller.reconciler.stop()
+        if controller.topology is not None:
+            controller.topology.stop()
+        await controller.async_pusher.close()
+        controller.state_writer.shutdown(wait=True)
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_post('/api/user_authenticated', user_authenticated)
+    app.router.add_post('/api/user_logout', user_logout)
+    app.router.add_get('/api/status', controller_status)
+    app.router.add_get('/api/users', list_active_users)
+    app.router.add_get('/api/flows', list_flows)
+    app.router.add_get('/api/flows/export', export_flows)
+    app.router.add_get('/api/switches', list_switches)
+    app.router.add_get('/api/provisioning/{job_id}', provisioning_status)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/debug/traces', debug_traces)
+    app.router.add_get('/health', health_check)
+    app['controller'] = controller
+    return app
+
+def run_async_controller(host=None, port=None, otlp_endpoint=None, **options):
+    """Arrancar el controlador en modo asyncio (el único controlador del proceso)
+    `options` son los argumentos de SDNController (floodlight_url, state_store...)"""
+    if otlp_endpoint:
+        tracer.exporter = OTLPExporter(otlp_endpoint, tracer.service).start()
+    controller = AsyncSDNController(**options)
+    host = host or controller.CONTROLLER_IP
+    port = port or controller.CONTROLLER_PORT
+    controller.restore_state()
+
+    logger.info("=== Controlador SDN para Portal Cautivo (asyncio) ===")
+    logger.info(f"Floodlight URL: {controller.FLOODLIGHT_URL}")
+    logger.info(f"Controller API: http://{host}:{port}")
+    logger.info("Starting SDN Controller...")
+
+    web.run_app(create_app(controller), host=host, port=port, print=None,
+                backlog=1024, access_log=None)
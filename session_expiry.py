@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Cola de expiración de sesiones para el Portal Cautivo y el Controlador SDN
+Min-heap ordenado por expires_at: obtener las sesiones vencidas cuesta
+O(vencidas · log n) en lugar de recorrer todas las sesiones activas
+Autor: SDN_Grupo2
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+class ExpiryQueue:
+    """Min-heap de (expires_at, clave) con cancelación perezosa
+    Reprogramar o cancelar una clave no toca el heap: la entrada vieja se
+    descarta cuando llega a la cima"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []          # (expires_at, seq, key)
+        self.deadlines = {}     # key -> (expires_at, seq) vigente
+        self.sequence = itertools.count()
+
+    def schedule(self, key, expires_at):
+        """Programar (o reprogramar) la expiración de una clave"""
+        with self.lock:
+            seq = next(self.sequence)
+            self.deadlines[key] = (expires_at, seq)
+            heapq.heappush(self.heap, (expires_at, seq, key))
+
+            # Evitar que las entradas canceladas hagan crecer el heap sin límite
+            if len(self.heap) > 2 * len(self.deadlines) + 1024:
+                self._compact()
+
+    def cancel(self, key):
+        with self.lock:
+            self.deadlines.pop(key, None)
+
+    def pop_expired(self, now=None):
+        """Extraer las claves cuyo expires_at ya pasó"""
+        now = time.time() if now is None else now
+        expired = []
+
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                expires_at, seq, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == (expires_at, seq):
+                    del self.deadlines[key]
+                    expired.append(key)
+
+        return expired
+
+    def next_deadline(self):
+        """Próxima expiración vigente, o None si no hay sesiones"""
+        with self.lock:
+            while self.heap:
+                expires_at, seq, key = self.heap[0]
+                if self.deadlines.get(key) == (expires_at, seq):
+                    return expires_at
+                heapq.heappop(self.heap)
+        return None
+
+    def _compact(self):
+        self.heap = [(expires_at, seq, key) for key, (expires_at, seq) in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.deadlines)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Inventario dinámico de switches del Controlador SDN
+Sigue la lista de switches conectados a Floodlight (/wm/core/controller/switches/json)
+en un índice DPID -> metadatos con la descripción de puertos, y avisa cuando un
+switch se conecta o se desconecta. Los switches configurados solo aportan nombre,
+IP y rol de cada puerto
+Autor: SDN_Grupo2
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+def normalize_dpid(dpid):
+    return dpid.lower() if dpid else dpid
+
+def parse_switches(data):
+    """Convertir la respuesta de switches/json en {dpid: datos de conexión}
+    Floodlight 1.x usa 'switchDPID'; versiones anteriores, 'dpid'"""
+    switches = {}
+    for switch in data or []:
+        dpid = normalize_dpid(switch.get('switchDPID') or switch.get('dpid'))
+        if dpid:
+            switches[dpid] = {
+                'inet_address': switch.get('inetAddress'),
+                'connected_since': switch.get('connectedSince')
+            }
+    return switches
+
+def parse_port_desc(data, dpid):
+    """Convertir /wm/core/switch/<dpid>/port-desc/json en {puerto: descripción}"""
+    if isinstance(data, dict) and 'portDesc' not in data:
+        data = data.get(dpid, {})
+    ports = {}
+    for port in (data or {}).get('portDesc', []):
+        number = str(port.get('portNumber', ''))
+        if not number.isdigit():
+            continue  # Puerto 'local' del switch
+        ports[int(number)] = {
+            'name': port.get('name'),
+            'hardware_address': port.get('hardwareAddress'),
+            'state': port.get('state')
+        }
+    return ports
+
+class SwitchInventory:
+    """Índice de switches vivos con búsqueda O(1) por DPID
+    Las lecturas no toman lock: cada cambio sustituye el diccionario completo"""
+
+    def __init__(self, floodlight_url, seed=None, interval=5, timeout=3):
+        self.SWITCHES_URL = f"{floodlight_url}/wm/core/controller/switches/json"
+        self.PORT_DESC_URL = f"{floodlight_url}/wm/core/switch/{{dpid}}/port-desc/json"
+        self.interval = interval      # Segundos entre lecturas (solo con start())
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.known = {normalize_dpid(dpid): dict(meta) for dpid, meta in (seed or {}).items()}
+        self.live = dict(self.known)  # Hasta la primera lectura se asumen los switches configurados
+        self.update_lock = threading.Lock()
+        self.listeners = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {'updates': 0, 'joins': 0, 'leaves': 0, 'synced_at': None}
+
+    def subscribe(self, on_join=None, on_leave=None):
+        """Registrar callbacks on_join(dpid) / on_leave(dpid)"""
+        self.listeners.append((on_join, on_leave))
+
+    def __contains__(self, dpid):
+        return dpid in self.live
+
+    def get(self, dpid):
+        return self.live.get(dpid)
+
+    def fetch_ports(self, dpid):
+        """Descripción de puertos de un switch recién conectado ({} si Floodlight no la da)"""
+        try:
+            response = self.session.get(self.PORT_DESC_URL.format(dpid=dpid), timeout=self.timeout)
+            response.raise_for_status()
+            return parse_port_desc(response.json(), dpid)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"Cannot read ports of {dpid}: {e}")
+            return {}
+
+    def update(self, switch_list):
+        """Aplicar una lista de switches de Floodlight; devuelve (conectados, desconectados)"""
+        current = parse_switches(switch_list)
+        with self.update_lock:
+            previous = self.live
+            joined = [dpid for dpid in current if dpid not in previous]
+            left = [dpid for dpid in previous if dpid not in current]
+
+            live = {}
+            for dpid, connection in current.items():
+                entry = previous.get(dpid)
+                if entry is None:
+                    entry = dict(self.known.get(dpid, {'name': dpid, 'ip': None, 'ports': {}}))
+                    entry['port_desc'] = self.fetch_ports(dpid)
+                else:
+                    entry = dict(entry)
+                entry.update(connection)
+                live[dpid] = entry
+
+            self.live = live
+            self.stats['updates'] += 1
+            self.stats['joins'] += len(joined)
+            self.stats['leaves'] += len(left)
+            self.stats['synced_at'] = time.time()
+
+        for dpid in joined:
+            logger.info(f"🔌 Switch connected: {dpid}")
+        for dpid in left:
+            logger.warning(f"⚠️ Switch disconnected: {dpid}")
+        for on_join, on_leave in self.listeners:
+            for dpid in joined:
+                if on_join is not None:
+                    on_join(dpid)
+            for dpid in left:
+                if on_leave is not None:
+                    on_leave(dpid)
+        return joined, left
+
+    def sync(self):
+        """Leer la lista de switches de Floodlight y aplicarla"""
+        response = self.session.get(self.SWITCHES_URL, timeout=self.timeout)
+        response.raise_for_status()
+        return self.update(response.json())
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sync()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.debug(f"Cannot read switch list: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """Leer la lista periódicamente en un hilo daemon (sin un sondeo que la comparta)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='switch-inventory', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['live'] = len(self.live)
+        stats['configured'] = len(self.known)
+        return stats
+
+    def report(self):
+        """Switches vivos con sus metadatos, tal como los expone /api/switches"""
+        return {
+            'switches': [dict(entry, dpid=dpid) for dpid, entry in self.live.items()],
+            'total_count': len(self.live)
+        }
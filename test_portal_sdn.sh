@@ -280,6 +280,21 @@ performance_tests() {
     else
         log_warning "Tiempo de respuesta alto: ${response_time}s"
     fi
+
+    log_info "Para carga completa portal → controlador → Floodlight (JSON comparable entre ejecuciones):"
+    log_info "  python3 benchmark_portal_sdn.py --output resultados.json end-to-end --baseline anterior.json"
+}
+
+# Comprobaciones de comportamiento con Floodlight y RADIUS simulados (no necesitan el sistema instalado)
+behavior_checks() {
+    log_info "=== COMPROBACIONES DE COMPORTAMIENTO ==="
+    if python3 "$(dirname "$0")/check_portal_sdn.py" "$@"; then
+        log_success "Todas las comprobaciones de comportamiento pasaron"
+        return 0
+    else
+        log_error "Fallaron comprobaciones de comportamiento"
+        return 1
+    fi
 }
 
 # Función para verificar logs
@@ -398,6 +413,11 @@ case "${1:-menu}" in
     performance)
         performance_tests
         ;;
+    checks)
+        shift
+        behavior_checks "$@"
+        exit $?
+        ;;
     logs)
         check_logs
         ;;
@@ -408,10 +428,11 @@ case "${1:-menu}" in
         main_menu
         ;;
     *)
-        echo "Uso: $0 {all|performance|logs|info|menu}"
+        echo "Uso: $0 {all|performance|checks|logs|info|menu}"
         echo ""
         echo "  all         - Ejecutar todas las pruebas"
         echo "  performance - Pruebas de rendimiento"
+        echo "  checks      - Comprobaciones de comportamiento con servicios simulados"
         echo "  logs        - Verificar logs del sistema"
         echo "  info        - Mostrar información del sistema"
         echo "  menu        - Mostrar menú interactivo"
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Caché de topología para la ubicación de flujos del Controlador SDN
+Aprende de Floodlight en qué switch y puerto está cada cliente (/wm/device/)
+y los enlaces entre switches (/wm/topology/links/json), y calcula el camino
+del switch de acceso al uplink. Un hilo de fondo refresca ambas tablas y
+avisa cuando un host se mueve o cambian los enlaces
+Autor: SDN_Grupo2
+"""
+
+import logging
+import threading
+from collections import deque
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+def parse_devices(data):
+    """Convertir la respuesta de /wm/device/ en {mac: (switch, puerto)}
+    Acepta la lista de Floodlight 1.0/1.1 y el objeto {'devices': [...]} de 1.2"""
+    devices = data.get('devices', []) if isinstance(data, dict) else data
+    table = {}
+    for device in devices or []:
+        attachment_points = device.get('attachmentPoint') or []
+        if not attachment_points:
+            continue
+        point = attachment_points[0]
+        switch_dpid = point.get('switch') or point.get('switchDPID')
+        if not switch_dpid:
+            continue
+        for mac in device.get('mac', []):
+            table[mac.lower()] = (switch_dpid, str(point.get('port')))
+    return table
+
+def parse_links(data):
+    """Convertir la respuesta de /wm/topology/links/json en un conjunto de pares de switches"""
+    links = set()
+    for link in data or []:
+        src, dst = link.get('src-switch'), link.get('dst-switch')
+        if src and dst and src != dst:
+            links.add((src, dst) if src < dst else (dst, src))
+    return frozenset(links)
+
+class TopologyCache:
+    """Puntos de conexión de clientes y caminos hasta el uplink
+    Las lecturas no toman lock: cada refresco sustituye las tablas completas"""
+
+    def __init__(self, floodlight_url, uplink_switch, interval=10, timeout=3, on_change=None):
+        self.FLOODLIGHT_URL = floodlight_url
+        self.uplink_switch = uplink_switch    # Switch hacia el router/portal
+        self.interval = interval              # Segundos entre refrescos en segundo plano
+        self.timeout = timeout
+        self.on_change = on_change            # on_change(macs movidas o None si cambiaron enlaces)
+        self.session = requests.Session()
+        self.links = frozenset()
+        self.adjacency = {}                   # switch -> {vecinos}
+        self.attachments = {}                 # mac -> (switch, puerto)
+        self.paths = {}                       # switch de acceso -> camino hasta el uplink
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {'refreshes': 0, 'errors': 0, 'device_queries': 0, 'moves': 0, 'link_changes': 0}
+
+    def fetch_json(self, path):
+        response = self.session.get(f"{self.FLOODLIGHT_URL}{path}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def set_links(self, links):
+        """Sustituir los enlaces; devuelve True si cambiaron"""
+        if links == self.links:
+            return False
+        adjacency = {}
+        for src, dst in links:
+            adjacency.setdefault(src, set()).add(dst)
+            adjacency.setdefault(dst, set()).add(src)
+        self.links = links
+        self.adjacency = adjacency
+        self.paths = {}   # Los caminos calculados con los enlaces anteriores ya no valen
+        self.stats['link_changes'] += 1
+        return True
+
+    def set_attachments(self, table):
+        """Sustituir la tabla de dispositivos; devuelve las MACs que cambiaron de punto de conexión"""
+        previous = self.attachments
+        moved = {mac for mac, point in table.items() if mac in previous and previous[mac] != point}
+        self.attachments = table
+        self.stats['moves'] += len(moved)
+        return moved
+
+    def refresh(self):
+        """Volver a leer enlaces y dispositivos; devuelve (enlaces cambiados, MACs movidas)"""
+        links = parse_links(self.fetch_json('/wm/topology/links/json'))
+        devices = parse_devices(self.fetch_json('/wm/device/'))
+        self.stats['refreshes'] += 1
+        return self.set_links(links), self.set_attachments(devices)
+
+    def attachment_point(self, mac_address):
+        """(switch, puerto) de un cliente; un cliente nuevo se consulta a Floodlight"""
+        mac_address = mac_address.lower()
+        point = self.attachments.get(mac_address)
+        if point is not None:
+            return point
+
+        self.stats['device_queries'] += 1
+        try:
+            table = parse_devices(self.fetch_json(f'/wm/device/?mac={mac_address}'))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"Cannot query attachment point of {mac_address}: {e}")
+            return None
+        point = table.get(mac_address)
+        if point is not None:
+            self.attachments[mac_address] = point
+        return point
+
+    def path_to_uplink(self, switch_dpid):
+        """Switches desde `switch_dpid` hasta el uplink (ambos incluidos), o None si no hay camino"""
+        path = self.paths.get(switch_dpid)
+        if path is not None:
+            return path
+        if switch_dpid == self.uplink_switch:
+            path = [switch_dpid]
+        else:
+            # BFS: todos los enlaces cuentan igual
+            previous = {switch_dpid: None}
+            queue = deque([switch_dpid])
+            while queue and self.uplink_switch not in previous:
+                node = queue.popleft()
+                for neighbor in self.adjacency.get(node, ()):
+                    if neighbor not in previous:
+                        previous[neighbor] = node
+                        queue.append(neighbor)
+            if self.uplink_switch not in previous:
+                return None
+            path = []
+            node = self.uplink_switch
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            path.reverse()
+        self.paths[switch_dpid] = path
+        return path
+
+    def placement(self, mac_address):
+        """Switches donde deben ir los flujos de un cliente: el de acceso primero
+        y después los del camino al uplink. None si no se conoce su ubicación"""
+        point = self.attachment_point(mac_address)
+        if point is None:
+            return None
+        return self.path_to_uplink(point[0])
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                links_changed, moved = self.refresh()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.stats['errors'] += 1
+                logger.debug(f"Cannot refresh topology: {e}")
+                continue
+            if self.on_change is not None and (links_changed or moved):
+                try:
+                    self.on_change(None if links_changed else moved)
+                except Exception as e:
+                    logger.error(f"Error applying topology change: {e}")
+
+    def start(self):
+        """Iniciar el refresco periódico en un hilo daemon"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='topology-cache', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({'hosts': len(self.attachments), 'links': len(self.links), 'cached_paths': len(self.paths)})
+        return stats
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Trazas por login para el portal y el controlador
+Cada login recibe un trace ID (formato W3C traceparent) que viaja del portal al
+controlador; cada etapa queda como un span cronometrado. Las trazas terminadas
+se guardan en un buffer circular en memoria (/debug/traces) y, opcionalmente,
+se envían como OTLP/HTTP JSON a un colector local
+Autor: SDN_Grupo2
+"""
+
+import contextvars
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+def parse_traceparent(header):
+    """(trace_id, span_id padre) de una cabecera traceparent, o (None, None)"""
+    match = TRACEPARENT.match(header.strip().lower()) if header else None
+    return match.groups() if match else (None, None)
+
+class Trace:
+    """Una operación (un login) con sus spans; los tiempos son relativos a su inicio"""
+
+    def __init__(self, service, name, trace_id=None, parent_span_id=None, attributes=None):
+        self.service = service
+        self.name = name
+        self.trace_id = trace_id or new_trace_id()
+        self.span_id = new_span_id()
+        self.parent_span_id = parent_span_id   # Span remoto (p. ej. la notificación del portal)
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+
+    def add_span(self, name, start, duration, parent_span_id=None, attributes=None):
+        """Añadir un span ya medido (`start` en segundos de perf_counter)"""
+        span = {
+            'name': name,
+            'span_id': new_span_id(),
+            'parent_span_id': parent_span_id or self.span_id,
+            'start_ms': round((start - self.start) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'attributes': attributes or {}
+        }
+        self.spans.append(span)   # list.append es atómico: spans de varios hilos a la vez
+        return span
+
+    def traceparent(self, span_id=None):
+        return f"00-{self.trace_id}-{span_id or self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'service': self.service,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'parent_span_id': self.parent_span_id,
+            'attributes': self.attributes,
+            'spans': sorted(self.spans, key=lambda span: span['start_ms'])
+        }
+
+class Tracer:
+    """Trazas del proceso: contexto actual en contextvars (hilos y corrutinas)
+    Sin traza activa, span() y add_span() no hacen nada"""
+
+    def __init__(self, service, capacity=500, exporter=None):
+        self.service = service
+        self.finished = deque(maxlen=capacity)   # Buffer circular de trazas terminadas
+        self.exporter = exporter
+
+    @contextmanager
+    def trace(self, name, trace_id=None, parent_span_id=None, **attributes):
+        """Abrir una traza para la operación en curso"""
+        trace = Trace(self.service, name, trace_id, parent_span_id, attributes)
+        trace_token = current_trace.set(trace)
+        span_token = current_span.set(None)
+        try:
+            yield trace
+        except Exception as e:
+            trace.attributes['error'] = str(e)
+            raise
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            self.finished.append(trace)
+            if self.exporter is not None:
+                self.exporter.export(trace)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Cronometrar una etapa de la traza actual"""
+        trace = current_trace.get()
+        if trace is None:
+            yield None
+            return
+        span_id = new_span_id()
+        token = current_span.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield attributes   # La etapa puede añadir atributos (resultado, códigos...)
+        except Exception as e:
+            attributes['error'] = str(e)
+            raise
+        finally:
+            current_span.reset(token)
+            span = trace.add_span(name, start, time.perf_counter() - start, current_span.get(), attributes)
+            span['span_id'] = span_id
+
+    def add_span(self, name, start, duration, **attributes):
+        """Span medido fuera del contexto (p. ej. POSTs en el pool de conexiones)"""
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, current_span.get(), attributes)
+
+    def current_trace_id(self):
+        trace = current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    def propagation_headers(self):
+        """Cabeceras para continuar la traza actual en otro servicio"""
+        trace = current_trace.get()
+        if trace is None:
+            return {}
+        return {'traceparent': trace.traceparent(current_span.get())}
+
+    def report(self, limit=20, order='slowest', min_ms=0.0):
+        """Trazas recientes tal como las expone /debug/traces"""
+        traces = [trace for trace in list(self.finished) if trace.duration * 1000 >= min_ms]
+        if order == 'slowest':
+            traces.sort(key=lambda trace: trace.duration, reverse=True)
+        else:
+            traces.reverse()
+        return {
+            'service': self.service,
+            'buffered': len(self.finished),
+            'traces': [trace.to_dict() for trace in traces[:limit]]
+        }
+
+def parse_report_params(params):
+    """Validar los parámetros de /debug/traces (query string)"""
+    order = params.get('order', 'slowest')
+    if order not in ('slowest', 'recent'):
+        raise ValueError("order must be one of slowest, recent")
+    try:
+        limit = int(params.get('limit', 20))
+        min_ms = float(params.get('min_ms', 0))
+    except ValueError:
+        raise ValueError("limit and min_ms must be numbers")
+    if limit < 0:
+        raise ValueError("limit must be non-negative")
+    return {'limit': limit, 'order': order, 'min_ms': min_ms}
+
+def otlp_attributes(attributes):
+    return [{'key': str(key), 'value': {'stringValue': str(value)}} for key, value in attributes.items()]
+
+def to_otlp_spans(trace):
+    """Spans de una traza en el formato JSON de OTLP"""
+    start_ns = int(trace.started_at * 1e9)
+    spans = [{
+        'traceId': trace.trace_id,
+        'spanId': trace.span_id,
+        'parentSpanId': trace.parent_span_id or '',
+        'name': trace.name,
+        'kind': 2,   # SPAN_KIND_SERVER
+        'startTimeUnixNano': str(start_ns),
+        'endTimeUnixNano': str(start_ns + int(trace.duration * 1e9)),
+        'attributes': otlp_attributes(trace.attributes)
+    }]
+    for span in trace.spans:
+        span_start = start_ns + int(span['start_ms'] * 1e6)
+        spans.append({
+            'traceId': trace.trace_id,
+            'spanId': span['span_id'],
+            'parentSpanId': span['parent_span_id'],
+            'name': span['name'],
+            'kind': 1,   # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(span_start),
+            'endTimeUnixNano': str(span_start + int(span['duration_ms'] * 1e6)),
+            'attributes': otlp_attributes(span['attributes'])
+        })
+    return spans
+
+class OTLPExporter:
+    """Envío por lotes de trazas a un colector OTLP/HTTP (JSON) desde un hilo propio
+    Si el colector no da abasto se descartan trazas: nunca frena un login"""
+
+    def __init__(self, endpoint, service, batch_size=256, interval=1.0, max_queue=10000):
+        self.endpoint = endpoint.rstrip('/')
+        if not self.endpoint.endswith('/v1/traces'):
+            self.endpoint += '/v1/traces'
+        self.service = service
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {'exported': 0, 'dropped': 0, 'errors': 0}
+
+    def export(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def flush(self):
+        """Enviar lo acumulado; devuelve cuántas trazas salieron"""
+        traces = []
+        while len(traces) < self.batch_size:
+            try:
+                traces.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not traces:
+            return 0
+
+        body = {'resourceSpans': [{
+            'resource': {'attributes': otlp_attributes({'service.name': self.service})},
+            'scopeSpans': [{
+                'scope': {'name': 'sdn_grupo2.tracing'},
+                'spans': [span for trace in traces for span in to_otlp_spans(trace)]
+            }]
+        }]}
+        try:
+            response = self.session.post(self.endpoint, json=body, timeout=5)
+            response.raise_for_status()
+            self.stats['exported'] += len(traces)
+        except requests.exceptions.RequestException as e:
+            self.stats['errors'] += 1
+            logger.debug(f"Cannot export traces to {self.endpoint}: {e}")
+        return len(traces)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            while self.flush() == self.batch_size:
+                pass
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='otlp-exporter', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()